@@ -0,0 +1,61 @@
+"""
+Operations per second of the JWT codecs on an access token as issued with STATELESS_TOKENS=true:
+- jose-str: python-jose given the secret on every call, as auth_service did before the codecs;
+- jose: JoseCodec, python-jose with the key constructed once;
+- hmac: HMACCodec, HS256 with hmac directly.
+
+    python -m benchmarks.jwt_codecs --seconds 1
+"""
+import argparse
+import time
+from datetime import datetime, timedelta
+
+from jose import jwt
+
+from src.services.jwt_codec import HMACCodec, JoseCodec
+
+KEY = "81ca0de60255b6e2b16b03a717a11c35dc24d8e565fd4f388a876de40d21d9ce"
+ALGORITHM = "HS256"
+
+
+class JoseStrCodec:
+    def encode(self, claims: dict) -> str:
+        return jwt.encode(claims, KEY, algorithm=ALGORITHM)
+
+    def decode(self, token: str) -> dict:
+        return jwt.decode(token, KEY, algorithms=[ALGORITHM])
+
+
+def ops_per_second(seconds: float, operation, argument) -> float:
+    operations = 0
+    started = time.perf_counter()
+    deadline = started + seconds
+    while time.perf_counter() < deadline:
+        for _ in range(100):
+            operation(argument)
+        operations += 100
+    return operations / (time.perf_counter() - started)
+
+
+def main(seconds: float) -> None:
+    now = datetime.utcnow()
+    claims = {"sub": "deadpool@example.com", "sid": "u3Zx1y9bT0a6v2Q4mJ8kLw", "uid": 1, "role": "user",
+              "name": "deadpool", "avatar": "https://www.gravatar.com/avatar/0c1d0c6e5d0b1f3e7a2c4b5d6e7f8091",
+              "iat": now, "exp": now + timedelta(minutes=15), "scope": "access_token"}
+    codecs = {"jose-str": JoseStrCodec(), "jose": JoseCodec(KEY, ALGORITHM), "hmac": HMACCodec(KEY, ALGORITHM)}
+    token = codecs["jose"].encode(claims)
+    assert all(codec.encode(claims) == token for codec in codecs.values())
+
+    print(f"{'codec':<10}{'encode/s':>12}{'decode/s':>12}")
+    results = {}
+    for name, codec in codecs.items():
+        results[name] = ops_per_second(seconds, codec.encode, claims), ops_per_second(seconds, codec.decode, token)
+        print(f"{name:<10}{results[name][0]:>12.0f}{results[name][1]:>12.0f}")
+    base = results["jose-str"]
+    print(f"hmac: {results['hmac'][0] / base[0]:.1f}x encode, {results['hmac'][1] / base[1]:.1f}x decode")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seconds", type=float, default=1, help="time per measurement")
+    main(parser.parse_args().seconds)
@@ -0,0 +1,114 @@
+"""
+Latency of GET /api/contacts/ while the same worker is handling a burst of logins.
+
+Runs the app in-process on a temporary SQLite database, once with bcrypt inline on the event
+loop (PASSWORD_HASH_WORKERS=0, the old behaviour) and once with the hashing pool. Contacts are
+requested one after another for as long as the logins are in flight.
+
+    python -m benchmarks.login_storm --logins 40 --workers 4
+"""
+import argparse
+import asyncio
+import statistics
+import tempfile
+import time
+from datetime import date
+from pathlib import Path
+
+import httpx
+from fastapi_limiter.depends import RateLimiter
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+from main import app
+from src.database.db import get_db
+from src.entity.models import Base, Contact, User
+from src.services.auth import auth_service, get_read_db
+from src.services.cache import contacts_cache, InMemoryCacheBackend
+from src.services.executor import BlockingPool
+from src.services.login_limiter import login_limiter
+from src.services.sessions import MemorySessionStore, get_session_store
+
+EMAIL = "storm@example.com"
+PASSWORD = "123456789"
+
+
+async def no_rate_limit():
+    return None
+
+
+async def prepare(url: str) -> async_sessionmaker:
+    engine = create_async_engine(url, connect_args={"timeout": 60})
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+    session_maker = async_sessionmaker(bind=engine, expire_on_commit=False)
+    async with session_maker() as session:
+        user = User(username="storm", user_email=EMAIL, password=auth_service.get_password_hash(PASSWORD),
+                    confirmed=True, avatar="avatar")
+        session.add(user)
+        for i in range(50):
+            session.add(Contact(first_name=f"first{i}", last_name="last", email=f"c{i}@example.com",
+                                phone="0673293127", birth_date=date(1990, 1, 1), user=user))
+        await session.commit()
+
+    async def override_get_db():
+        async with session_maker() as session:
+            yield session
+
+    app.dependency_overrides[get_db] = override_get_db
+    app.dependency_overrides[get_read_db] = override_get_db
+    sessions = MemorySessionStore(ttl=3600)
+    app.dependency_overrides[get_session_store] = lambda: sessions
+    app.dependency_overrides[login_limiter] = no_rate_limit
+    contacts_cache.init(InMemoryCacheBackend(), expire=60)
+    for route in app.routes:
+        for dependency in getattr(route, "dependant", None) and route.dependant.dependencies or ():
+            if isinstance(dependency.call, RateLimiter):
+                app.dependency_overrides[dependency.call] = no_rate_limit
+    return session_maker
+
+
+async def run(workers: int, logins: int) -> list[float]:
+    auth_service.hashing = BlockingPool(workers, queue_size=logins, name="hashing")
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        response = await client.post("/api/auth/login", data={"username": EMAIL, "password": PASSWORD})
+        # no-cache: every probe goes to the database instead of the response cache
+        headers = {"Authorization": f"Bearer {response.json()['access_token']}", "Cache-Control": "no-cache"}
+        await client.get("/api/contacts/", headers=headers)
+
+        storm = [asyncio.create_task(client.post("/api/auth/login", data={"username": EMAIL, "password": PASSWORD}))
+                 for _ in range(logins)]
+        latencies = []
+        while not all(task.done() for task in storm):
+            started = time.perf_counter()
+            response = await client.get("/api/contacts/", headers=headers)
+            latencies.append((time.perf_counter() - started) * 1000)
+            assert response.status_code == 200, response.text
+            await asyncio.sleep(0.005)
+        await asyncio.gather(*storm)
+    auth_service.hashing.shutdown()
+    return latencies
+
+
+def percentile(values: list[float], pct: float) -> float:
+    return statistics.quantiles(values, n=100, method="inclusive")[int(pct) - 1]
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--logins", type=int, default=40, help="concurrent logins in the storm")
+    parser.add_argument("--workers", type=int, default=4, help="hashing pool size for the 'after' run")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        await prepare(f"sqlite+aiosqlite:///{Path(tmp) / 'bench.db'}")
+        print(f"{'mode':<22}{'probes':>8}{'p50 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+        for label, workers in (("inline (before)", 0), (f"pool of {args.workers} (after)", args.workers)):
+            latencies = await run(workers, args.logins)
+            print(f"{label:<22}{len(latencies):>8}{statistics.median(latencies):>10.1f}"
+                  f"{percentile(latencies, 99):>10.1f}{max(latencies):>10.1f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
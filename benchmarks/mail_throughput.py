@@ -0,0 +1,69 @@
+"""
+Messages per second delivered to a local SMTP server, with a new connection per message
+(FastMail.send_message, the old behaviour) and over the SMTPPool, at several concurrency levels.
+
+The stand-in from tests.smtp_server delays every reply by --rtt-ms to stand in for the network and
+asks for AUTH; it has no TLS, so a real server's handshake costs a few more round trips than here.
+
+    python -m benchmarks.mail_throughput --messages 300 --pool-size 4 --rtt-ms 5
+"""
+import argparse
+import asyncio
+import time
+
+from fastapi_mail import FastMail, MessageSchema, MessageType
+
+from src.services.email import SMTPPool, build_message
+from tests.smtp_server import local_config, start_server
+
+TEMPLATE_BODY = {"host": "http://localhost:8000/", "username": "bench", "token": "x" * 150}
+
+
+async def send_all(send, messages: int, concurrency: int) -> float:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(i: int):
+        async with semaphore:
+            await send(i)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(messages)))
+    return messages / (time.perf_counter() - started)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=300)
+    parser.add_argument("--pool-size", type=int, default=4)
+    parser.add_argument("--rtt-ms", type=float, default=5.0, help="simulated round trip to the SMTP server")
+    args = parser.parse_args()
+
+    controller, handler = start_server(rtt=args.rtt_ms / 1000, auth=True)
+    config = local_config(controller.port)
+    fast_mail = FastMail(config)
+
+    async def per_message(i: int):
+        message = MessageSchema(subject="Confirm your email ", recipients=[f"user{i}@example.com"],
+                                body="<p>confirm</p>", subtype=MessageType.html)
+        await fast_mail.send_message(message)
+
+    print(f"{'concurrency':>12}{'per-message msg/s':>20}{'pool msg/s':>14}{'pool connects':>15}")
+    try:
+        for concurrency in (1, 10, 100):
+            before = await send_all(per_message, args.messages, concurrency)
+            pool = SMTPPool(config, args.pool_size, idle_timeout=60)
+
+            async def pooled(i: int):
+                await pool.send(build_message("Confirm your email ", f"user{i}@example.com", "email_template.html",
+                                              TEMPLATE_BODY, config))
+
+            after = await send_all(pooled, args.messages, concurrency)
+            await pool.close()
+            print(f"{concurrency:>12}{before:>20.0f}{after:>14.0f}{pool.connects:>15}")
+    finally:
+        controller.stop()
+    print(f"server received {len(handler.messages)} messages in {handler.sessions} sessions")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,64 @@
+"""
+Time to verify a password on this machine for each bcrypt cost and a few argon2id settings, and the cost to
+configure so a login takes about --target-ms of CPU: the highest one that stays under it.
+
+A worker verifies PASSWORD_HASH_WORKERS passwords at a time, so it handles about
+workers * 1000 / verify-ms logins per second at most.
+
+    python -m benchmarks.password_cost --target-ms 250
+"""
+import argparse
+import time
+
+from src.conf.config import settings
+from src.services.auth import create_pwd_context
+
+PASSWORD = "correct horse battery staple"
+ARGON2 = [(2, 19456), (2, 32768), (3, 65536), (4, 65536), (3, 131072), (4, 262144)]
+
+
+def verify_ms(context, repeat: int) -> float:
+    password_hash = context.hash(PASSWORD)
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        context.verify(PASSWORD, password_hash)
+        best = min(best, time.perf_counter() - started)
+    return best * 1000
+
+
+def main(target_ms: float, repeat: int, max_rounds: int) -> None:
+    workers = max(settings.password_hash_workers, 1)
+    print(f"{'setting':<40}{'verify ms':>10}{'logins/s':>10}")
+
+    bcrypt = None
+    for rounds in range(10, max_rounds + 1):
+        ms = verify_ms(create_pwd_context("bcrypt", bcrypt_rounds=rounds), repeat)
+        print(f"{f'BCRYPT_ROUNDS={rounds}':<40}{ms:>10.1f}{workers * 1000 / ms:>10.0f}")
+        if ms <= target_ms:
+            bcrypt = rounds
+        if ms > 2 * target_ms:
+            break
+
+    argon2 = None
+    for time_cost, memory_cost in ARGON2:
+        context = create_pwd_context("argon2", argon2_time_cost=time_cost, argon2_memory_cost=memory_cost,
+                                     argon2_parallelism=settings.argon2_parallelism)
+        ms = verify_ms(context, repeat)
+        label = f"ARGON2_TIME_COST={time_cost} MEMORY_COST={memory_cost}"
+        print(f"{label:<40}{ms:>10.1f}{workers * 1000 / ms:>10.0f}")
+        if ms <= target_ms:
+            argon2 = label
+
+    print(f"\ntarget {target_ms:.0f} ms, PASSWORD_HASH_WORKERS={workers}")
+    print(f"bcrypt: BCRYPT_ROUNDS={bcrypt}" if bcrypt else "bcrypt: even BCRYPT_ROUNDS=10 is over the target")
+    print(f"argon2: {argon2}" if argon2 else "argon2: every setting is over the target")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--target-ms", type=float, default=250, help="CPU time a login may spend verifying")
+    parser.add_argument("--repeat", type=int, default=3, help="verifications per setting, the fastest counts")
+    parser.add_argument("--max-rounds", type=int, default=16)
+    args = parser.parse_args()
+    main(args.target_ms, args.repeat, args.max_rounds)
@@ -0,0 +1,66 @@
+"""
+Renders per second of the confirmation email template:
+- fastapi-mail: a new Jinja environment per send (what FastMail.send_message does), so the template is loaded
+  and compiled every time;
+- shared environment: one environment, get_template per send (checks the file for changes every time);
+- compiled: MailTemplates.render;
+- batch: MailTemplates.render_many, and render_batches in the thread pool, as used for a mass send.
+
+    python -m benchmarks.render_templates --renders 100000
+"""
+import argparse
+import asyncio
+import time
+
+from jinja2 import Environment, FileSystemLoader
+
+from src.services.executor import BlockingPool
+from src.services.mail_templates import TEMPLATE_FOLDER, TEMPLATES, MailTemplates
+
+NAME = "email_template.html"
+
+
+def contexts(n: int):
+    return ({"host": "http://localhost:8000/", "username": f"user{i}", "token": "x" * 150} for i in range(n))
+
+
+def rate(label: str, n: int, func) -> None:
+    started = time.perf_counter()
+    func(n)
+    elapsed = time.perf_counter() - started
+    print(f"{label:<28}{n / elapsed:>14,.0f} renders/s")
+
+
+def fastapi_mail(n: int) -> None:
+    for context in contexts(n):
+        Environment(loader=FileSystemLoader(TEMPLATE_FOLDER)).get_template(NAME).render(**context)
+
+
+def shared_environment(n: int) -> None:
+    env = Environment(loader=FileSystemLoader(TEMPLATE_FOLDER))
+    for context in contexts(n):
+        env.get_template(NAME).render(**context)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--renders", type=int, default=100_000)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    args = parser.parse_args()
+    templates = MailTemplates(TEMPLATE_FOLDER, TEMPLATES, BlockingPool(workers=1, queue_size=1, name="mail-render"))
+
+    async def batches(n: int) -> None:
+        async for _ in templates.render_batches(NAME, contexts(n), args.batch_size):
+            pass
+
+    # compiling a template costs milliseconds, a tenth of the renders is plenty
+    rate("fastapi-mail", args.renders // 10, fastapi_mail)
+    rate("shared environment", args.renders, shared_environment)
+    rate("compiled", args.renders, lambda n: [templates.render(NAME, context) for context in contexts(n)])
+    rate("compiled, render_many", args.renders, lambda n: templates.render_many(NAME, contexts(n)))
+    rate("compiled, render_batches", args.renders, lambda n: asyncio.run(batches(n)))
+    templates.shutdown()
+
+
+if __name__ == "__main__":
+    main()
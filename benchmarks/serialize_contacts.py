@@ -0,0 +1,86 @@
+"""
+CPU time per page of GET /api/contacts/ with limit=500, from the query to the JSON bytes of the response:
+- orm: Contact objects, validated against ContactPage by FastAPI and rendered by JSONResponse (the include=user path,
+  without the owner query);
+- rows: CONTACT_COLUMNS selected into Row tuples and written by page_response with orjson.
+
+The database is SQLite in memory, so the query itself is cheap and the difference is the Python side.
+
+    python -m benchmarks.serialize_contacts --pages 200
+"""
+import argparse
+import asyncio
+import time
+from datetime import date, datetime
+
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from main import app
+from src.entity.models import Base, Contact, User
+from src.repository.contacts import get_contacts
+from src.routes.contacts import contact_id_key
+from src.services.pagination import build_page
+from src.services.serialization import page_response
+
+LIMIT = 500
+
+
+async def seed(session_maker: async_sessionmaker) -> User:
+    async with session_maker() as session:
+        user = User(username="bench", user_email="bench@example.com", password="x", avatar="avatar")
+        session.add(user)
+        for i in range(LIMIT):
+            session.add(Contact(first_name=f"first{i}", last_name=f"last{i}", email=f"contact{i}@example.com",
+                                phone="0673293127", birth_date=date(1990, 1 + i % 12, 1 + i % 28), user=user,
+                                created_at=datetime(2024, 5, 1, 12, 30, i % 60, 123456),
+                                updated_at=datetime(2024, 5, 1, 12, 30, i % 60, 123456)))
+        await session.commit()
+        return user
+
+
+async def orm_page(session_maker: async_sessionmaker, user: User, field) -> bytes:
+    async with session_maker() as session:
+        contacts = await get_contacts(LIMIT, 0, session, user)
+        page = dict(build_page(contacts, LIMIT, contact_id_key), owner=user)
+        content = await serialize_response(field=field, response_content=page, is_coroutine=True)
+        return JSONResponse(content).body
+
+
+async def rows_page(session_maker: async_sessionmaker, user: User, field) -> bytes:
+    async with session_maker() as session:
+        contacts = await get_contacts(LIMIT, 0, session, user, as_rows=True)
+        return page_response(build_page(contacts, LIMIT, contact_id_key), user).body
+
+
+async def measure(label: str, pages: int, render, *args) -> float:
+    await render(*args)
+    started = time.process_time()
+    for _ in range(pages):
+        await render(*args)
+    per_page = (time.process_time() - started) / pages * 1000
+    print(f"{label:<8}{per_page:>10.2f} ms CPU/page")
+    return per_page
+
+
+async def main(pages: int) -> None:
+    engine = create_async_engine("sqlite+aiosqlite://")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    session_maker = async_sessionmaker(engine, expire_on_commit=False)
+    user = await seed(session_maker)
+    route = next(route for route in app.routes
+                 if getattr(route, "path", None) == "/api/contacts/" and "GET" in route.methods)
+    field = route.secure_cloned_response_field
+
+    orm = await measure("orm", pages, orm_page, session_maker, user, field)
+    rows = await measure("rows", pages, rows_page, session_maker, user, field)
+    print(f"{orm / rows:.1f}x less CPU per page")
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=200)
+    asyncio.run(main(parser.parse_args().pages))
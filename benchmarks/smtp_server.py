@@ -0,0 +1,28 @@
+"""
+Runs the local SMTP stand-in of tests.smtp_server on its own, for the mail benchmarks.
+
+--rtt-ms delays the reply to every command (EHLO, AUTH, MAIL, RCPT, DATA, QUIT) to stand in for the
+network round trip to a real server; --auth makes clients log in (any credentials are accepted).
+
+    python -m benchmarks.smtp_server --port 8025 --rtt-ms 5 --auth
+"""
+import argparse
+import time
+
+from tests.smtp_server import start_server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8025)
+    parser.add_argument("--rtt-ms", type=float, default=0.0)
+    parser.add_argument("--auth", action="store_true")
+    args = parser.parse_args()
+    controller, handler = start_server(args.port, args.rtt_ms / 1000, args.auth)
+    print(f"SMTP stand-in listening on 127.0.0.1:{controller.port}")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        controller.stop()
+        print(f"received {len(handler.messages)} messages in {handler.sessions} sessions")
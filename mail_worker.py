@@ -0,0 +1,43 @@
+import asyncio
+import signal
+
+from src.conf.config import settings
+from src.database.db import sessionmanager
+from src.services.email import create_smtp_pool
+from src.services.mail_templates import mail_templates
+from src.services.outbox import MailOutboxWorker
+
+
+async def main() -> None:
+    """
+    The main function runs the mail worker: it opens the SMTP pool and sends the emails the web application
+    queued in the outbox until it gets SIGINT or SIGTERM, then finishes the current batch and closes the SMTP
+    and database connections and the rendering threads.
+    Run it next to the web application with `python mail_worker.py`; several workers may run at the same time.
+
+    :return: None
+    :doc-author: SergiyRus1974
+    """
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    smtp_pool = create_smtp_pool()
+    worker = MailOutboxWorker(sessionmanager.session, smtp_pool,
+                              batch_size=settings.mail_outbox_batch_size,
+                              concurrency=settings.mail_outbox_concurrency,
+                              max_attempts=settings.mail_outbox_max_attempts,
+                              backoff=settings.mail_outbox_backoff,
+                              backoff_max=settings.mail_outbox_backoff_max,
+                              lease=settings.mail_outbox_lease,
+                              poll_interval=settings.mail_outbox_poll_interval)
+    try:
+        await worker.run(stop)
+    finally:
+        await smtp_pool.close()
+        mail_templates.shutdown()
+        await sessionmanager.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,24 +1,39 @@
 import uvicorn
 
 from fastapi_limiter import FastAPILimiter
-from fastapi import FastAPI, HTTPException, Depends
+from fastapi import FastAPI, HTTPException, Depends, Response
 from sqlalchemy import text
 from sqlalchemy.ext.asyncio import AsyncSession
 from fastapi.middleware.cors import CORSMiddleware
-from middlewares import CustomHeaderMiddleware
-
-from src.database.db import get_db, db_redis
+from fastapi.staticfiles import StaticFiles
+from middlewares import MetricsMiddleware, ServerTimingMiddleware
+
+from src.conf.config import settings
+from src.database.db import get_db, get_session_factory, db_redis, sessionmanager
+from src.entity.models import User
+from src.repository import contacts as repository_contacts
+from src.repository import outbox as repository_outbox
+from src.repository import users as repository_users
 from src.routes import contacts, auth, users
+from src.services.auth import auth_service
+from src.services.cache import contacts_cache, RedisCacheBackend
+from src.services.revocation import revocations
+from src.services.serialization import TimedJSONResponse
+from src.services.storage import get_avatar_storage
+from src.services.token_cache import token_cache
+from src.services import metrics, timing
 
-app = FastAPI()
+app = FastAPI(default_response_class=TimedJSONResponse)
 
 origins = ['*']
 
 app.include_router(auth.router, prefix="/api")
 app.include_router(contacts.router, prefix="/api")
 app.include_router(users.router, prefix='/api')
+if settings.avatar_storage == "local":
+    app.mount(settings.avatar_local_url, StaticFiles(directory=settings.avatar_local_dir, check_dir=False),
+              name="avatars")
 
-app.add_middleware(CustomHeaderMiddleware)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=origins,
@@ -26,20 +41,63 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+if settings.server_timing:
+    timing.instrument()
+    app.add_middleware(ServerTimingMiddleware)
+app.add_middleware(MetricsMiddleware)
+
+
+async def prime_statements(db: AsyncSession) -> None:
+    """
+    The prime_statements function runs the statements of the most frequent requests once on a connection
+    (user lookup of every authenticated request, contact listing and contact by id), so they are prepared
+    before the first request needs them. Nothing matches the values used.
+
+    :param db: AsyncSession: A session holding the connection to prime
+    :return: None
+    :doc-author: SergiyRus1974
+    """
+    nobody = User(id=0)
+    await repository_users.get_user_by_email("", db)
+    await repository_contacts.get_contacts(10, 0, db, nobody)
+    await repository_contacts.get_contact(0, db, nobody)
 
 
 @app.on_event("startup")
 async def startup():
     """
     The startup function is called when the application starts up.
-    It's a good place to initialize things that are needed by your app, such as database connections.
+    It's a good place to initialize things that are needed by your app, such as database connections:
+    DB_WARMUP_CONNECTIONS connections are opened and primed with the common statements.
 
     :return: A list of functions to be executed at the end of startup
     :doc-author: SergiyRus1974
     """
     r = await db_redis
-    await FastAPILimiter.init(r)
-    # FastAPICache.init(RedisBackend(r), prefix="fastapi-cache")
+    await FastAPILimiter.init(r, http_callback=metrics.rate_limit_callback)
+    contacts_cache.init(RedisCacheBackend(r), expire=settings.contacts_cache_expire)
+    get_avatar_storage()
+    await sessionmanager.warmup(settings.db_warmup_connections, prime_statements)
+    await revocations.start()
+    await token_cache.start()
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    """
+    The shutdown function is called when the application shuts down.
+    It stops following the token revocations and cache invalidations, lets the password hashing and avatar upload threads finish their work, closes the database connections
+    and takes the gauges of this worker process out of the metrics.
+
+    :return: None
+    :doc-author: SergiyRus1974
+    """
+    await revocations.stop()
+    await token_cache.stop()
+    auth_service.hashing.shutdown()
+    get_avatar_storage().shutdown()
+    await sessionmanager.close()
+    metrics.mark_process_dead()
 
 
 @app.get("/")
@@ -76,6 +134,29 @@ async def healthchecker(db: AsyncSession = Depends(get_db)):
         raise HTTPException(status_code=500, detail="Error connecting to the database")
 
 
+scrape_auth = metrics.ScrapeAuth(settings.metrics_token)
+outbox_counts = metrics.OutboxCounts(settings.metrics_outbox_cache)
+
+
+@app.get("/metrics", include_in_schema=False, dependencies=[Depends(scrape_auth)])
+async def read_metrics(session_factory=Depends(get_session_factory)) -> Response:
+    """
+    The read_metrics function serves the metrics in the Prometheus text format: requests and latency per route,
+    database pool usage, Redis latency, rate limiter rejections and the email outbox depth.
+    The scrape must send METRICS_TOKEN as a bearer token; the outbox is counted at most every
+    METRICS_OUTBOX_CACHE seconds, in a session opened only then.
+
+    :param session_factory: Returns an async context manager yielding a session
+    :return: The metrics
+    :doc-author: SergiyRus1974
+    """
+    async def count_emails() -> dict[str, int]:
+        async with session_factory() as db:
+            return await repository_outbox.count_emails(db)
+
+    return Response(metrics.latest(await outbox_counts.get(count_emails)), media_type=metrics.CONTENT_TYPE_LATEST)
+
+
 if __name__ == '__main__':
     # uvicorn.run(app, host="localhost", port=8000)
     uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
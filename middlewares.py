@@ -1,35 +1,96 @@
-from datetime import datetime
+import time
 
-from fastapi import Request
-from starlette.middleware.base import BaseHTTPMiddleware
-from starlette.types import ASGIApp
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
 
+from src.services import metrics, timing
 
-class CustomHeaderMiddleware(BaseHTTPMiddleware):
+
+class ServerTimingMiddleware:
     def __init__(self, app: ASGIApp):
         """
         The __init__ function is called when the class is instantiated.
         It sets up the middleware by passing in an ASGI application to wrap.
+        The middleware is plain ASGI: the request runs in the same task and the response body, streamed or not,
+        is passed through untouched.
 
         :param self: Represent the instance of the class
         :param app: ASGIApp: Pass the asgi application instance to the middleware
-        :return: The superclass of the customheadermiddleware class
+        :return: The instance of the class
         :doc-author: SergiyRus1974
         """
-        super(CustomHeaderMiddleware, self).__init__(app)
+        self.app = app
 
-    async def dispatch(self, request: Request, call_next):
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
         """
-        The dispatch function is the first function called when a request comes in.
-        It's job is to take the request and return a response. It can do this by calling
-        the next middleware in line, or it can handle the request itself.
+        The __call__ function serves a request and adds a Server-Timing header to the response with the total time
+        and the time spent in get_current_user (auth), in database statements (db) and in serializing the response
+        (serialization), measured until the response headers are sent.
 
-        :param self: Access the class attributes
-        :param request: Request: Access the request object
-        :param call_next: Call the next middleware in the chain
-        :return: A response object
+        :param self: Represent the instance of the class
+        :param scope: Scope: The ASGI connection scope
+        :param receive: Receive: Receives the request messages
+        :param send: Send: Sends the response messages
+        :return: None
         :doc-author: SergiyRus1974
         """
-        response = await call_next(request)
-        response.headers['Request-time'] = str(datetime.now())
-        return response
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        started = time.perf_counter()
+        token = timing.start()
+
+        async def send_with_timing(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                MutableHeaders(scope=message).append("Server-Timing",
+                                                     timing.header(time.perf_counter() - started))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            timing.stop(token)
+
+
+class MetricsMiddleware:
+    def __init__(self, app: ASGIApp):
+        """
+        The __init__ function is called when the class is instantiated.
+        It sets up the middleware by passing in an ASGI application to wrap.
+
+        :param self: Represent the instance of the class
+        :param app: ASGIApp: Pass the asgi application instance to the middleware
+        :return: The instance of the class
+        :doc-author: SergiyRus1974
+        """
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        """
+        The __call__ function serves a request and counts it with its latency under the route template and
+        status code (see src.services.metrics).
+
+        :param self: Represent the instance of the class
+        :param scope: Scope: The ASGI connection scope
+        :param receive: Receive: Receives the request messages
+        :param send: Send: Sends the response messages
+        :return: None
+        :doc-author: SergiyRus1974
+        """
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        started = time.perf_counter()
+        status_code = 500
+
+        async def send_with_status(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            metrics.observe_request(scope["method"], metrics.route_template(scope), status_code,
+                                    time.perf_counter() - started)
@@ -0,0 +1,29 @@
+"""birthday index
+
+Revision ID: a41f0c9d2b7e
+Revises: 80cb4f69eb69
+Create Date: 2026-10-14 10:12:31.402117
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a41f0c9d2b7e'
+down_revision: Union[str, None] = '80cb4f69eb69'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # month * 100 + day of birth_date, must stay identical to models.birth_month_day
+    op.create_index('ix_contacts_user_id_birth_md', 'contacts',
+                    ['user_id', sa.text('CAST(EXTRACT(MONTH FROM birth_date) * 100 + '
+                                        'EXTRACT(DAY FROM birth_date) AS INTEGER)')], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_contacts_user_id_birth_md', table_name='contacts')
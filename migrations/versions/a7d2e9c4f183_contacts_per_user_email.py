@@ -0,0 +1,38 @@
+"""contacts per-user email and phone indexes
+
+Revision ID: a7d2e9c4f183
+Revises: f1c4b8e3a6d2
+Create Date: 2026-10-15 14:02:17.559230
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a7d2e9c4f183'
+down_revision: Union[str, None] = 'f1c4b8e3a6d2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # CREATE INDEX CONCURRENTLY can't run inside a transaction; if a build fails it leaves an INVALID index
+    # behind, which has to be dropped before running the migration again
+    with op.get_context().autocommit_block():
+        op.create_index('ix_contacts_user_id_phone', 'contacts', ['user_id', 'phone'], unique=False,
+                        postgresql_concurrently=True)
+        # the per-user unique index is in place before the global one goes, so emails are unique throughout
+        op.create_index('uq_contacts_user_id_email', 'contacts', ['user_id', 'email'], unique=True,
+                        postgresql_concurrently=True)
+        op.drop_index('ix_contacts_email', table_name='contacts', postgresql_concurrently=True)
+
+
+def downgrade() -> None:
+    # fails if two users have a contact with the same email by now
+    with op.get_context().autocommit_block():
+        op.create_index('ix_contacts_email', 'contacts', ['email'], unique=True, postgresql_concurrently=True)
+        op.drop_index('uq_contacts_user_id_email', table_name='contacts', postgresql_concurrently=True)
+        op.drop_index('ix_contacts_user_id_phone', table_name='contacts', postgresql_concurrently=True)
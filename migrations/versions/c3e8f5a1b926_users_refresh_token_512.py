@@ -0,0 +1,30 @@
+"""users refresh_token 512
+
+Revision ID: c3e8f5a1b926
+Revises: a7d2e9c4f183
+Create Date: 2026-10-15 15:21:43.108274
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c3e8f5a1b926'
+down_revision: Union[str, None] = 'a7d2e9c4f183'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # refresh tokens with a session id don't fit in 255 characters
+    op.alter_column('users', 'refresh_token', existing_type=sa.String(length=255), type_=sa.String(length=512),
+                    existing_nullable=True)
+
+
+def downgrade() -> None:
+    op.execute("UPDATE users SET refresh_token = NULL WHERE length(refresh_token) > 255")
+    op.alter_column('users', 'refresh_token', existing_type=sa.String(length=512), type_=sa.String(length=255),
+                    existing_nullable=True)
@@ -0,0 +1,36 @@
+"""contacts keyset indexes
+
+Revision ID: d3b86e1f5a90
+Revises: a41f0c9d2b7e
+Create Date: 2026-10-14 13:40:05.117583
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd3b86e1f5a90'
+down_revision: Union[str, None] = 'a41f0c9d2b7e'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # CREATE INDEX CONCURRENTLY can't run inside a transaction
+    with op.get_context().autocommit_block():
+        op.create_index('ix_contacts_user_id_id', 'contacts', ['user_id', 'id'], unique=False,
+                        postgresql_concurrently=True)
+        op.create_index('ix_contacts_user_id_first_name_id', 'contacts', ['user_id', 'first_name', 'id'],
+                        unique=False, postgresql_concurrently=True)
+        op.create_index('ix_contacts_user_id_last_name_id', 'contacts', ['user_id', 'last_name', 'id'],
+                        unique=False, postgresql_concurrently=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_contacts_user_id_last_name_id', table_name='contacts', postgresql_concurrently=True)
+        op.drop_index('ix_contacts_user_id_first_name_id', table_name='contacts', postgresql_concurrently=True)
+        op.drop_index('ix_contacts_user_id_id', table_name='contacts', postgresql_concurrently=True)
@@ -0,0 +1,43 @@
+"""email outbox
+
+Revision ID: e5a7c2d91b34
+Revises: d3b86e1f5a90
+Create Date: 2026-10-15 10:12:47.305218
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e5a7c2d91b34'
+down_revision: Union[str, None] = 'd3b86e1f5a90'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('email_outbox',
+                    sa.Column('id', sa.Integer(), nullable=False),
+                    sa.Column('kind', sa.Enum('confirm_email', 'reset_password', name='emailkind'), nullable=False),
+                    sa.Column('recipient', sa.String(length=255), nullable=False),
+                    sa.Column('username', sa.String(length=50), nullable=False),
+                    sa.Column('host', sa.String(length=255), nullable=False),
+                    sa.Column('status', sa.Enum('pending', 'dead', name='outboxstatus'), nullable=False),
+                    sa.Column('attempts', sa.Integer(), nullable=False),
+                    sa.Column('next_attempt_at', sa.DateTime(), nullable=False),
+                    sa.Column('last_error', sa.String(length=500), nullable=True),
+                    sa.Column('created_at', sa.DateTime(), nullable=True),
+                    sa.PrimaryKeyConstraint('id')
+                    )
+    op.create_index('ix_email_outbox_status_next_attempt_at', 'email_outbox', ['status', 'next_attempt_at'],
+                    unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_email_outbox_status_next_attempt_at', table_name='email_outbox')
+    op.drop_table('email_outbox')
+    op.execute("DROP TYPE outboxstatus")
+    op.execute("DROP TYPE emailkind")
@@ -0,0 +1,34 @@
+"""contacts search trigram index
+
+Revision ID: f1c4b8e3a6d2
+Revises: e5a7c2d91b34
+Create Date: 2026-10-15 11:20:44.381906
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f1c4b8e3a6d2'
+down_revision: Union[str, None] = 'e5a7c2d91b34'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    # CREATE INDEX CONCURRENTLY can't run inside a transaction
+    with op.get_context().autocommit_block():
+        # must stay identical to models.contact_search_text
+        op.create_index('ix_contacts_search_trgm', 'contacts',
+                        [sa.text("lower(first_name || ' ' || last_name || ' ' || email || ' ' || phone) "
+                                 "gin_trgm_ops")],
+                        unique=False, postgresql_using='gin', postgresql_concurrently=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_contacts_search_trgm', table_name='contacts', postgresql_concurrently=True)
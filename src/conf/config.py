@@ -5,13 +5,36 @@ class Settings(BaseSettings):
     model_config = SettingsConfigDict(env_file='.env', env_file_encoding='utf-8')
     db_url: str
     db_local_url: str
+    db_pool_size: int = 5
+    db_max_overflow: int = 10
+    db_pool_timeout: float = 30
+    db_pool_recycle: int = 1800
+    db_pool_pre_ping: bool = True
+    db_statement_cache_size: int = 500
+    db_warmup_connections: int = 5
+    db_replica_urls: list[str] = []
+    db_replica_retry: float = 30
+    db_sticky_seconds: float = 5
     secret_key: str
     algorithm: str
+    jwt_backend: str = "hmac"
+    jwt_leeway: int = 0
     mail_username: str
     mail_password: str
     mail_from: str
     mail_port: int
     mail_server: str
+    mail_pool_size: int = 4
+    mail_idle_timeout: float = 60
+    mail_outbox_batch_size: int = 100
+    mail_outbox_concurrency: int = 4
+    mail_outbox_max_attempts: int = 8
+    mail_outbox_backoff: float = 30
+    mail_outbox_backoff_max: float = 3600
+    mail_outbox_lease: float = 300
+    mail_outbox_poll_interval: float = 2
+    mail_render_workers: int = 1
+    mail_render_queue: int = 8
     redis_host: str
     redis_local_host: str = 'localhost'
     redis_port: int = '6379'
@@ -23,6 +46,35 @@ class Settings(BaseSettings):
     cloudinary_api_key: str
     cloudinary_api_secret: str
     cloudinary_url: str
+    access_token_expire: int = 900
+    refresh_token_expire: int = 604800
+    stateless_tokens: bool = False
+    token_cache_size: int = 1024
+    token_cache_ttl: int = 60
+    password_scheme: str = "bcrypt"
+    bcrypt_rounds: int = 12
+    argon2_time_cost: int = 3
+    argon2_memory_cost: int = 65536
+    argon2_parallelism: int = 4
+    password_hash_workers: int = 4
+    password_hash_queue: int = 64
+    login_rate_window: int = 900
+    login_rate_per_account: int = 10
+    login_rate_per_ip: int = 100
+    contacts_bulk_max_items: int = 5000
+    contacts_bulk_batch_size: int = 1000
+    contacts_export_batch_size: int = 1000
+    contacts_cache_expire: int = 300
+    contacts_search_similarity: float = 0.4
+    avatar_storage: str = "cloudinary"
+    avatar_local_dir: str = "static/avatars"
+    avatar_local_url: str = "/static/avatars"
+    avatar_upload_workers: int = 4
+    avatar_upload_queue: int = 32
+    avatar_chunk_size: int = 6_000_000
+    server_timing: bool = False
+    metrics_token: str = ""
+    metrics_outbox_cache: float = 15
 
 
 settings = Settings(_env_file='.env', _env_file_encoding='utf-8')
@@ -6,3 +6,5 @@ INVALID_REFRESH_TOKEN = "Invalid refresh token"
 EMAIL_CONFIRMED = "Email confirmed"
 CHECK_EMAIL_FOR_CONFIRMATION = "Check your email for confirmation"
 EMAIL_ALREADY_CONFIRMED = "Your email is already confirmed"
+SERVER_BUSY = "Server is busy, try again later"
+TOO_MANY_LOGINS = "Too many login attempts, try again later"
@@ -1,24 +1,127 @@
+import asyncio
 import contextlib
-import redis.asyncio as redis_async
-from sqlalchemy.ext.asyncio import AsyncEngine, async_sessionmaker, create_async_engine
+import itertools
+import time
+from typing import Awaitable, Callable, Sequence
+
+import redis.exceptions
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import DBAPIError, SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
 
 from src.conf.config import settings
+from src.services.metrics import InstrumentedQueuePool, InstrumentedRedis, instrument_pool
+
+
+class Replica:
+    def __init__(self, name: str, engine: AsyncEngine, session_maker: async_sessionmaker):
+        """
+        The __init__ function is called when the class is instantiated.
+
+        :param self: Represent the instance of the class
+        :param name: str: Name of the replica in logs and metrics
+        :param engine: AsyncEngine: Engine of the replica
+        :param session_maker: async_sessionmaker: Sessions bound to the engine
+        :return: The instance of the class
+        :doc-author: SergiyRus1974
+        """
+        self.name = name
+        self.engine = engine
+        self.session_maker = session_maker
+        self.ejected_until = 0.0
+
+    @property
+    def healthy(self) -> bool:
+        """
+        The healthy property tells whether the replica may serve reads: it was not ejected or its ejection is over.
+
+        :param self: Represent the instance of the class
+        :return: True if reads may go to the replica
+        :doc-author: SergiyRus1974
+        """
+        return time.monotonic() >= self.ejected_until
+
+    def eject(self, seconds: float) -> None:
+        """
+        The eject function takes the replica out of the rotation for some time after it failed.
+
+        :param self: Represent the instance of the class
+        :param seconds: float: How long no reads are sent to the replica
+        :return: None
+        :doc-author: SergiyRus1974
+        """
+        self.ejected_until = time.monotonic() + seconds
+        print(f"database {self.name} ejected for {seconds} seconds")
 
 
 class DatabaseSessionManager:
-    def __init__(self, url: str):
+    def __init__(self, url: str, pool_size: int = 5, max_overflow: int = 10, pool_timeout: float = 30,
+                 pool_recycle: int = -1, pool_pre_ping: bool = False, statement_cache_size: int = 100,
+                 replica_urls: Sequence[str] = (), replica_retry: float = 30):
         """
         The __init__ function is called when the class is instantiated.
         It sets up the database connection and sessionmaker, which will be used for all queries.
+        The connection pool reports its usage and checkout times to the metrics. No connection is opened
+        until the first query or warmup. Replicas get pools with the same settings.
 
         :param self: Represent the instance of the class
         :param url: str: Create the engine and session maker
+        :param pool_size: int: Connections kept open in the pool
+        :param max_overflow: int: Connections opened beyond pool_size under load, closed when returned
+        :param pool_timeout: float: Seconds to wait for a free connection before failing
+        :param pool_recycle: int: Seconds after which a connection is replaced, -1 to keep it
+        :param pool_pre_ping: bool: Test a connection before handing it out, replacing it if the server dropped it
+        :param statement_cache_size: int: Prepared statements kept per connection (asyncpg only)
+        :param replica_urls: Sequence[str]: Read replicas of the primary database, used by read_session
+        :param replica_retry: float: Seconds a failed replica is left out before it is tried again
         :return: The instance of the class
         :doc-author: SergiyRus1974
         """
-        self._engine: AsyncEngine | None = create_async_engine(url)
-        self._session_maker: async_sessionmaker = async_sessionmaker(autoflush=False, autocommit=False,
-                                                                     bind=self._engine)
+        self.pool_size = pool_size
+        self.replica_retry = replica_retry
+        self._engine_options = dict(pool_size=pool_size, max_overflow=max_overflow, pool_timeout=pool_timeout,
+                                    pool_recycle=pool_recycle, pool_pre_ping=pool_pre_ping)
+        self._statement_cache_size = statement_cache_size
+        self._engine: AsyncEngine | None = self._create_engine(url, "primary")
+        self._session_maker: async_sessionmaker = self._create_session_maker(self._engine)
+        self._replicas: list[Replica] = []
+        for i, replica_url in enumerate(replica_urls):
+            engine = self._create_engine(replica_url, f"replica{i}")
+            self._replicas.append(Replica(f"replica{i}", engine, self._create_session_maker(engine)))
+        self._next_replica = itertools.count()
+
+    def _create_engine(self, url: str, name: str) -> AsyncEngine:
+        """
+        The _create_engine function creates an engine with the pool settings of the manager.
+
+        :param self: Represent the instance of the class
+        :param url: str: Database url
+        :param name: str: Name of the pool in the metrics
+        :return: The engine
+        :doc-author: SergiyRus1974
+        """
+        connect_args = {}
+        if make_url(url).get_driver_name() == "asyncpg":
+            connect_args["prepared_statement_cache_size"] = self._statement_cache_size
+        engine = create_async_engine(url, poolclass=InstrumentedQueuePool, connect_args=connect_args,
+                                     **self._engine_options)
+        instrument_pool(engine, name)
+        return engine
+
+    @staticmethod
+    def _create_session_maker(engine: AsyncEngine) -> async_sessionmaker:
+        return async_sessionmaker(autoflush=False, autocommit=False, expire_on_commit=False, bind=engine)
+
+    @property
+    def has_replicas(self) -> bool:
+        """
+        The has_replicas property tells whether reads can be sent somewhere else than the primary.
+
+        :param self: Represent the instance of the class
+        :return: True if replicas are configured
+        :doc-author: SergiyRus1974
+        """
+        return bool(self._replicas)
 
     @contextlib.asynccontextmanager
     async def session(self):
@@ -43,8 +146,122 @@ class DatabaseSessionManager:
         finally:
             await session.close()
 
+    async def _replica_session(self) -> tuple[AsyncSession, Replica] | None:
+        """
+        The _replica_session function opens a session on the next healthy replica, round robin.
+            The connection is checked out right away, so a replica that is down is ejected and the next one is
+            tried before the session is handed out.
+
+        :param self: Represent the instance of the class
+        :return: The session and its replica, or None if no replica is available
+        :doc-author: SergiyRus1974
+        """
+        for _ in range(len(self._replicas)):
+            replica = self._replicas[next(self._next_replica) % len(self._replicas)]
+            if not replica.healthy:
+                continue
+            session = replica.session_maker()
+            try:
+                await session.connection()
+            except (SQLAlchemyError, OSError) as err:
+                print(err)
+                await session.close()
+                replica.eject(self.replica_retry)
+                continue
+            return session, replica
+        return None
+
+    @contextlib.asynccontextmanager
+    async def read_session(self, primary: bool = False):
+        """
+        The read_session function returns an async context manager yielding a session for read-only queries.
+            The session is on a replica when replicas are configured and healthy, otherwise on the primary.
+            A replica that loses its connection while in use is ejected, so the next reads avoid it.
+
+        :param self: Represent the instance of the class
+        :param primary: bool: Read from the primary anyway, e.g. right after the user wrote
+        :return: A context manager that can be used to manage the session
+        :doc-author: SergiyRus1974
+        """
+        opened = None if primary or not self._replicas else await self._replica_session()
+        if opened is None:
+            async with self.session() as session:
+                yield session
+            return
+        session, replica = opened
+        try:
+            yield session
+        except Exception as err:
+            if isinstance(err, OSError) or isinstance(err, DBAPIError) and err.connection_invalidated:
+                replica.eject(self.replica_retry)
+            print(err)
+            await session.rollback()
+            raise
+        finally:
+            await session.close()
+
+    async def warmup(self, connections: int, prime: Callable[[AsyncSession], Awaitable] | None = None) -> None:
+        """
+        The warmup function opens connections to the primary and to every replica up front, so the first
+        requests after a deploy do not pay for connecting. All connections of a pool are held at the same time
+        (otherwise one connection would be reused) and each runs prime, which executes the common statements once
+        so they are prepared on every connection. A database that is not reachable is reported and left to
+        the first request.
+
+        :param self: Represent the instance of the class
+        :param connections: int: How many connections to open per pool, at most pool_size
+        :param prime: Callable[[AsyncSession], Awaitable] | None: Runs the statements to prepare
+        :return: None
+        :doc-author: SergiyRus1974
+        """
+        connections = min(connections, self.pool_size)
+        if connections <= 0:
+            return
+        session_makers = [self._session_maker] + [replica.session_maker for replica in self._replicas]
+        barriers = [asyncio.Barrier(connections) for _ in session_makers]
+
+        async def open_connection(session_maker: async_sessionmaker, barrier: asyncio.Barrier):
+            async with session_maker() as session:
+                try:
+                    await session.connection()
+                    if prime is not None:
+                        await prime(session)
+                except BaseException:
+                    # release the connections waiting for this one
+                    await barrier.abort()
+                    raise
+                await barrier.wait()
 
-sessionmanager = DatabaseSessionManager(settings.db_url)
+        results = await asyncio.gather(*(open_connection(session_maker, barrier)
+                                         for session_maker, barrier in zip(session_makers, barriers)
+                                         for _ in range(connections)), return_exceptions=True)
+        errors = [result for result in results
+                  if isinstance(result, BaseException) and not isinstance(result, asyncio.BrokenBarrierError)]
+        for err in errors:
+            if not isinstance(err, (SQLAlchemyError, OSError)):
+                raise err
+            print(err)
+
+    async def close(self) -> None:
+        """
+        The close function closes all pooled connections, of the primary and of the replicas.
+
+        :param self: Represent the instance of the class
+        :return: None
+        :doc-author: SergiyRus1974
+        """
+        if self._engine is not None:
+            await self._engine.dispose()
+        for replica in self._replicas:
+            await replica.engine.dispose()
+
+
+sessionmanager = DatabaseSessionManager(settings.db_url, pool_size=settings.db_pool_size,
+                                        max_overflow=settings.db_max_overflow, pool_timeout=settings.db_pool_timeout,
+                                        pool_recycle=settings.db_pool_recycle, pool_pre_ping=settings.db_pool_pre_ping,
+                                        statement_cache_size=settings.db_statement_cache_size,
+                                        replica_urls=settings.db_replica_urls,
+                                        replica_retry=settings.db_replica_retry)
 
 
 async def get_db():
@@ -61,6 +278,77 @@ async def get_db():
         yield session
 
 
-db_redis = redis_async.Redis(host=settings.redis_host, port=settings.redis_port, db=0, encoding="utf-8",
-                             decode_responses=True)
+def get_session_factory():
+    """
+    The get_session_factory function returns a factory of database sessions for code that outlives the request
+    dependencies, such as the generator of a StreamingResponse: FastAPI closes the get_db session before the
+    response body is sent, so a streaming generator opens (and closes) its own session with this factory.
+
+    :return: A callable returning an async context manager that yields a session
+    :doc-author: SergiyRus1974
+    """
+    return sessionmanager.session
+
+
+db_redis = InstrumentedRedis(host=settings.redis_host, port=settings.redis_port, db=0, encoding="utf-8",
+                            decode_responses=True)
+
+
+class ReadYourWrites:
+    key = "read-your-writes:{}"
+
+    def __init__(self, redis: InstrumentedRedis, window: float, enabled: bool):
+        """
+        The __init__ function is called when the class is instantiated.
+        After a user writes, their reads go to the primary for window seconds, long enough for the replicas to
+        catch up, so the user always sees their own changes. The marks are kept in Redis and shared by all
+        worker processes.
+
+        :param self: Represent the instance of the class
+        :param redis: InstrumentedRedis: Where the marks are kept
+        :param window: float: Seconds the reads of a user stay on the primary after a write
+        :param enabled: bool: False when there are no replicas, then nothing is kept
+        :return: The instance of the class
+        :doc-author: SergiyRus1974
+        """
+        self.redis = redis
+        self.window = window
+        self.enabled = enabled
+
+    async def mark(self, email: str) -> None:
+        """
+        The mark function records that a user has just written.
+
+        :param self: Represent the instance of the class
+        :param email: str: Email of the user
+        :return: None
+        :doc-author: SergiyRus1974
+        """
+        if not self.enabled:
+            return
+        try:
+            await self.redis.set(self.key.format(email), 1, px=int(self.window * 1000))
+        except redis.exceptions.RedisError as err:
+            print(err)
+
+    async def is_sticky(self, email: str) -> bool:
+        """
+        The is_sticky function tells whether the reads of a user must go to the primary.
+            When Redis does not answer they do, as the replicas may not have the user's writes yet.
+
+        :param self: Represent the instance of the class
+        :param email: str: Email of the user
+        :return: True if the user wrote less than window seconds ago
+        :doc-author: SergiyRus1974
+        """
+        if not self.enabled:
+            return False
+        try:
+            return bool(await self.redis.exists(self.key.format(email)))
+        except redis.exceptions.RedisError as err:
+            print(err)
+            return True
+
+
+read_your_writes = ReadYourWrites(db_redis, settings.db_sticky_seconds, enabled=sessionmanager.has_replicas)
 
@@ -1,21 +1,46 @@
-from datetime import date
+from datetime import date, datetime
 import enum
 
 from sqlalchemy.orm import Mapped, mapped_column, relationship
-from sqlalchemy import String, Integer, ForeignKey, DateTime, func, Date, Enum, Boolean
+from sqlalchemy import String, Integer, ForeignKey, DateTime, func, Date, Enum, Boolean, Index, DDL, event, \
+    literal_column
 from sqlalchemy.orm import DeclarativeBase
+from sqlalchemy.sql.expression import FunctionElement
+from sqlalchemy.ext.compiler import compiles
 
 
 class Base(DeclarativeBase):
     pass
 
 
+class birth_month_day(FunctionElement):
+    """
+    Month and day of a date packed into one integer (month * 100 + day, e.g. 1225 for December 25).
+    Used both by the birthday index on contacts and by the queries, so they always render the same expression.
+    """
+    type = Integer()
+    name = 'birth_month_day'
+    inherit_cache = True
+
+
+@compiles(birth_month_day)
+def _birth_month_day_default(element, compiler, **kw):
+    column = compiler.process(element.clauses, **kw)
+    return f"CAST(EXTRACT(MONTH FROM {column}) * 100 + EXTRACT(DAY FROM {column}) AS INTEGER)"
+
+
+@compiles(birth_month_day, 'sqlite')
+def _birth_month_day_sqlite(element, compiler, **kw):
+    column = compiler.process(element.clauses, **kw)
+    return f"CAST(strftime('%m%d', {column}) AS INTEGER)"
+
+
 class Contact(Base):
     __tablename__ = 'contacts'
     id: Mapped[int] = mapped_column(primary_key=True)
     first_name: Mapped[str] = mapped_column(String(50), index=True)
     last_name: Mapped[str] = mapped_column(String(50), index=True)
-    email: Mapped[str] = mapped_column(String(50), unique=True, index=True)
+    email: Mapped[str] = mapped_column(String(50))
     phone: Mapped[str] = mapped_column(String(50), index=True)
     birth_date: Mapped[str] = mapped_column(Date)
     friend_status: Mapped[bool] = mapped_column(default=False)
@@ -23,7 +48,52 @@ class Contact(Base):
     updated_at: Mapped[date] = mapped_column('updated_at', DateTime, default=func.now(), nullable=True,
                                              onupdate=func.now())
     user_id: Mapped[int] = mapped_column(Integer, ForeignKey('users.id'), nullable=True)
-    user: Mapped['User'] = relationship("User", backref="contacts", lazy="joined")
+    user: Mapped['User'] = relationship("User", backref="contacts", lazy="raise")
+
+
+Index('ix_contacts_user_id_birth_md', Contact.user_id, birth_month_day(Contact.birth_date))
+# keyset pagination: equality filters first, then the id the listings are sorted by
+Index('ix_contacts_user_id_id', Contact.user_id, Contact.id)
+Index('ix_contacts_user_id_first_name_id', Contact.user_id, Contact.first_name, Contact.id)
+Index('ix_contacts_user_id_last_name_id', Contact.user_id, Contact.last_name, Contact.id)
+Index('ix_contacts_user_id_phone', Contact.user_id, Contact.phone)
+# an email is unique among the contacts of one user, it is what create_contact's ON CONFLICT checks
+Index('uq_contacts_user_id_email', Contact.user_id, Contact.email, unique=True)
+
+# the fields the contact search matches, lowercased in one string: what the pg_trgm index of Postgres is built on
+_space = literal_column("' '")
+contact_search_text = func.lower(Contact.first_name + _space + Contact.last_name + _space + Contact.email + _space +
+                                 Contact.phone)
+
+# Postgres: trigram GIN index over contact_search_text (the migration creates the same one);
+# SQLite (tests): an FTS5 table with the trigram tokenizer, kept in sync with contacts by triggers
+CONTACT_SEARCH_DDL = {
+    'postgresql': [
+        "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+        "CREATE INDEX ix_contacts_search_trgm ON contacts USING gin "
+        "(lower(first_name || ' ' || last_name || ' ' || email || ' ' || phone) gin_trgm_ops)",
+    ],
+    'sqlite': [
+        "CREATE VIRTUAL TABLE contacts_search USING fts5(first_name, last_name, email, phone, "
+        "content='contacts', content_rowid='id', tokenize='trigram')",
+        "CREATE TRIGGER contacts_search_insert AFTER INSERT ON contacts BEGIN "
+        "INSERT INTO contacts_search(rowid, first_name, last_name, email, phone) "
+        "VALUES (new.id, new.first_name, new.last_name, new.email, new.phone); END",
+        "CREATE TRIGGER contacts_search_delete AFTER DELETE ON contacts BEGIN "
+        "INSERT INTO contacts_search(contacts_search, rowid, first_name, last_name, email, phone) "
+        "VALUES ('delete', old.id, old.first_name, old.last_name, old.email, old.phone); END",
+        "CREATE TRIGGER contacts_search_update AFTER UPDATE ON contacts BEGIN "
+        "INSERT INTO contacts_search(contacts_search, rowid, first_name, last_name, email, phone) "
+        "VALUES ('delete', old.id, old.first_name, old.last_name, old.email, old.phone); "
+        "INSERT INTO contacts_search(rowid, first_name, last_name, email, phone) "
+        "VALUES (new.id, new.first_name, new.last_name, new.email, new.phone); END",
+    ],
+}
+for _dialect, _statements in CONTACT_SEARCH_DDL.items():
+    for _statement in _statements:
+        event.listen(Contact.__table__, 'after_create', DDL(_statement).execute_if(dialect=_dialect))
+event.listen(Contact.__table__, 'before_drop',
+             DDL("DROP TABLE IF EXISTS contacts_search").execute_if(dialect='sqlite'))
 
 
 class Role(enum.Enum):
@@ -39,8 +109,41 @@ class User(Base):
     user_email: Mapped[str] = mapped_column(String(50), nullable=False, unique=True)
     password: Mapped[str] = mapped_column(String(255), nullable=False)
     avatar: Mapped[str] = mapped_column(String(255), nullable=True)
-    refresh_token: Mapped[str] = mapped_column(String(255), nullable=True)
+    refresh_token: Mapped[str] = mapped_column(String(512), nullable=True)
     created_at: Mapped[date] = mapped_column('created_at', DateTime, default=func.now())
     updated_at: Mapped[date] = mapped_column('updated_at', DateTime, default=func.now(), onupdate=func.now())
     role: Mapped[Enum] = mapped_column('role', Enum(Role), default=Role.user, nullable=True)
     confirmed: Mapped[Boolean] = mapped_column(Boolean, default=False)
+
+
+class EmailKind(enum.Enum):
+    confirm_email: str = "confirm_email"
+    reset_password: str = "reset_password"
+
+
+class OutboxStatus(enum.Enum):
+    pending: str = "pending"
+    dead: str = "dead"
+
+
+class EmailOutbox(Base):
+    """
+    Emails waiting to be sent by the mail worker (mail_worker.py). A row is written in the same transaction as the
+    change that triggers the email and deleted once the email is sent; rows that failed max_attempts times are kept
+    with status dead and the last error.
+    """
+    __tablename__ = 'email_outbox'
+    id: Mapped[int] = mapped_column(primary_key=True)
+    kind: Mapped[Enum] = mapped_column('kind', Enum(EmailKind), nullable=False)
+    recipient: Mapped[str] = mapped_column(String(255), nullable=False)
+    username: Mapped[str] = mapped_column(String(50), nullable=False)
+    host: Mapped[str] = mapped_column(String(255), nullable=False)
+    status: Mapped[Enum] = mapped_column('status', Enum(OutboxStatus), default=OutboxStatus.pending, nullable=False)
+    attempts: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    next_attempt_at: Mapped[datetime] = mapped_column(DateTime, nullable=False)
+    last_error: Mapped[str] = mapped_column(String(500), nullable=True)
+    created_at: Mapped[date] = mapped_column('created_at', DateTime, default=func.now())
+
+
+# the worker polls for pending rows that are due, oldest first
+Index('ix_email_outbox_status_next_attempt_at', EmailOutbox.status, EmailOutbox.next_attempt_at)
@@ -1,53 +1,105 @@
-from typing import Sequence
+from typing import Sequence, AsyncIterator
 
-from sqlalchemy import select
+from sqlalchemy import Row, Select, select, update, delete, or_, case, tuple_, func, literal, literal_column, table, \
+    column
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
-from datetime import date
+from sqlalchemy.orm import selectinload
+from sqlalchemy.orm.attributes import set_committed_value
+from datetime import date, timedelta
 
-from src.entity.models import Contact, User
+from src.database.db import read_your_writes
+from src.entity.models import Contact, User, birth_month_day, contact_search_text
 from src.schemas.contact import ContactSchema, ContactUpdateSchema
+from src.services.cache import contacts_cache
 
 
 class InternalError(Exception):
     pass
 
 
-def days_to_birthday(self) -> int:
+# the unique index (uq_contacts_user_id_email) an email conflicts on: the same email among the user's contacts
+EMAIL_CONFLICT = (Contact.user_id, Contact.email)
+# the FTS5 table the contacts are searched in on SQLite, see models.CONTACT_SEARCH_DDL
+contacts_search = table("contacts_search", column("rowid"), column("rank"))
+
+
+# the fields of ContactResponse except the owner, in the order they are serialized
+CONTACT_COLUMNS = (Contact.id, Contact.first_name, Contact.last_name, Contact.email, Contact.phone, Contact.birth_date,
+                   Contact.friend_status, Contact.created_at, Contact.updated_at)
+
+
+def select_contacts(as_rows: bool) -> Select:
     """
-    The days_to_birthday function returns the number of days until a person's next birthday.
+    The select_contacts function starts a contact listing query.
+        With as_rows the query selects CONTACT_COLUMNS into plain Row tuples: no ORM objects are built and nothing
+        is added to the identity map of the session, which is all a read-only listing needs.
 
-    :param self: Refer to the object itself
-    :return: The number of days until the next birthday
+    :param as_rows: bool: Select the columns instead of Contact objects
+    :return: The SELECT statement
     :doc-author: SergiyRus1974
     """
-    today = date.today()
-    year = today.year if today <= self.replace(year=today.year) else today.year + 1
-    closest_birthday = self.replace(year=year)
-    return (closest_birthday - today).days
+    return select(*CONTACT_COLUMNS) if as_rows else select(Contact)
 
 
-async def get_contacts_birthday(limit: int, offset: int, db: AsyncSession, user: User) -> list[Contact]:
+async def get_contacts_birthday(limit: int, offset: int, db: AsyncSession, user: User, window_days: int = 7,
+                                after: tuple[int, int] | None = None, include_user: bool = False,
+                                as_rows: bool = False) -> Sequence[Contact] | Sequence[Row]:
     """
-    The get_contacts_birthday function returns a list of contacts whose birthdays are within the next 7 days.
-        The function takes in three parameters: limit, offset, and db. Limit is an integer that specifies how many
-        contacts to return at once (defaults to 10). Offset is an integer that specifies where in the database to start
-        returning results from (defaults to 0). Db is a SQLAlchemy AsyncSession object which allows us access our database.
+    The get_contacts_birthday function returns a list of contacts whose birthdays are within the next window_days days.
+        The window is evaluated in the database on the indexed month/day of birth_date, so every returned page is full
+        of hits. When the window crosses New Year it is split into two ranges (end of this year, start of the next).
+        Contacts are ordered by how soon their birthday comes.
 
     :param limit: int: Limit the number of results returned
     :param offset: int: Specify the number of records to skip before starting to return rows
     :param db: AsyncSession: Pass the database session to the function
     :param user: User: Filter the contacts by user
-    :return: A list of contacts that have a birthday in the next 7 days
+    :param window_days: int: Number of days ahead to look for birthdays
+    :param after: tuple[int, int] | None: Sort key (see birthday_sort_key) of the last contact of the previous page
+    :param include_user: bool: Load the owner of every contact with a separate SELECT ... IN query
+    :param as_rows: bool: Return Row tuples of CONTACT_COLUMNS instead of contacts (include_user is ignored)
+    :return: A list of contacts that have a birthday in the next window_days days
     :doc-author: SergiyRus1974
     """
-    stmt = select(Contact).filter_by(user=user).offset(offset).limit(limit)
+    today = date.today()
+    last_day = today + timedelta(days=window_days)
+    start = today.month * 100 + today.day
+    end = last_day.month * 100 + last_day.day
+    birth_md = birth_month_day(Contact.birth_date)
+    if last_day.year == today.year:
+        in_window = birth_md.between(start, end)
+    else:
+        in_window = or_(birth_md >= start, birth_md <= end)
+    upcoming = case((birth_md >= start, birth_md), else_=birth_md + 1300)
+    stmt = select_contacts(as_rows).filter_by(user=user).where(in_window)
+    if after is not None:
+        stmt = stmt.where(tuple_(upcoming, Contact.id) > tuple_(*after))
+    if include_user and not as_rows:
+        stmt = stmt.options(selectinload(Contact.user))
+    stmt = stmt.order_by(upcoming, Contact.id).offset(offset).limit(limit)
     contacts = await db.execute(stmt)
-    results = list(contacts.scalars().all())
+    return contacts.all() if as_rows else contacts.scalars().all()
 
-    return [contact for contact in results if days_to_birthday(contact.birth_date) <= 7]
 
+def birthday_sort_key(contact: Contact) -> tuple[int, int]:
+    """
+    The birthday_sort_key function returns the position of a contact in the get_contacts_birthday ordering.
+    Birthdays that come after New Year are pushed behind the ones left in the current year.
 
-async def get_contacts(limit: int, offset: int, db: AsyncSession, user: User) -> Sequence[Contact]:
+    :param contact: Contact: A contact returned by get_contacts_birthday
+    :return: A tuple of the upcoming birthday key and the contact id
+    :doc-author: SergiyRus1974
+    """
+    today = date.today()
+    start = today.month * 100 + today.day
+    birth_md = contact.birth_date.month * 100 + contact.birth_date.day
+    return (birth_md if birth_md >= start else birth_md + 1300), contact.id
+
+
+async def get_contacts(limit: int, offset: int, db: AsyncSession, user: User, after_id: int | None = None,
+                       include_user: bool = False, as_rows: bool = False) -> Sequence[Contact] | Sequence[Row]:
     """
     The get_contacts function returns a list of contacts for the given user.
 
@@ -55,31 +107,49 @@ async def get_contacts(limit: int, offset: int, db: AsyncSession, user: User) ->
     :param offset: int: Specify the number of records to skip
     :param db: AsyncSession: Pass a database connection to the function
     :param user: User: Filter the results by user
-    :return: A list of contact objects
+    :param after_id: int | None: Return only contacts with a greater id (keyset pagination)
+    :param include_user: bool: Load the owner of every contact with a separate SELECT ... IN query
+    :param as_rows: bool: Return Row tuples of CONTACT_COLUMNS instead of contacts (include_user is ignored)
+    :return: A list of contact objects ordered by id
     :doc-author: SergiyRus1974
     """
-    stmt = select(Contact).filter_by(user=user).offset(offset).limit(limit)
+    stmt = select_contacts(as_rows).filter_by(user=user)
+    if after_id is not None:
+        stmt = stmt.where(Contact.id > after_id)
+    if include_user and not as_rows:
+        stmt = stmt.options(selectinload(Contact.user))
+    stmt = stmt.order_by(Contact.id).offset(offset).limit(limit)
     contacts = await db.execute(stmt)
-    return contacts.scalars().all()
+    return contacts.all() if as_rows else contacts.scalars().all()
 
 
-async def get_all_contacts(limit: int, offset: int, db: AsyncSession) -> Sequence[Contact]:
+async def get_all_contacts(limit: int, offset: int, db: AsyncSession, after_id: int | None = None,
+                           include_user: bool = False, as_rows: bool = False) -> Sequence[Contact] | Sequence[Row]:
     """
     The get_all_contacts function returns a list of all contacts in the database.
 
     :param limit: int: Limit the number of contacts returned
     :param offset: int: Specify the number of rows to skip
     :param db: AsyncSession: Pass in the database session to use
-    :return: A list of contacts
+    :param after_id: int | None: Return only contacts with a greater id (keyset pagination)
+    :param include_user: bool: Load the owner of every contact with a separate SELECT ... IN query
+    :param as_rows: bool: Return Row tuples of CONTACT_COLUMNS instead of contacts (include_user is ignored)
+    :return: A list of contacts ordered by id
     :doc-author: Trelent
     """
-    stmt = select(Contact).offset(offset).limit(limit)
+    stmt = select_contacts(as_rows)
+    if after_id is not None:
+        stmt = stmt.where(Contact.id > after_id)
+    if include_user and not as_rows:
+        stmt = stmt.options(selectinload(Contact.user))
+    stmt = stmt.order_by(Contact.id).offset(offset).limit(limit)
     contacts = await db.execute(stmt)
-    return contacts.scalars().all()
+    return contacts.all() if as_rows else contacts.scalars().all()
 
 
-async def get_contacts_first_name(first_name: str, limit: int, offset: int, db: AsyncSession, user: User) -> \
-        Sequence[Contact]:
+async def get_contacts_first_name(first_name: str, limit: int, offset: int, db: AsyncSession, user: User,
+                                  after_id: int | None = None, include_user: bool = False,
+                                  as_rows: bool = False) -> Sequence[Contact] | Sequence[Row]:
     """
     The get_contacts_first_name function returns a list of contacts with the given first name.
 
@@ -89,16 +159,25 @@ async def get_contacts_first_name(first_name: str, limit: int, offset: int, db:
     :param offset: int: Specify the number of rows to skip before starting to return rows
     :param db: AsyncSession: Pass the database session to the function
     :param user: User: Filter the contacts by user
-    :return: A list of contacts with the given first name
+    :param after_id: int | None: Return only contacts with a greater id (keyset pagination)
+    :param include_user: bool: Load the owner of every contact with a separate SELECT ... IN query
+    :param as_rows: bool: Return Row tuples of CONTACT_COLUMNS instead of contacts (include_user is ignored)
+    :return: A list of contacts with the given first name ordered by id
     :doc-author: SergiyRus1974
     """
-    stmt = select(Contact).filter_by(first_name=first_name, user=user).offset(offset).limit(limit)
+    stmt = select_contacts(as_rows).filter_by(first_name=first_name, user=user)
+    if after_id is not None:
+        stmt = stmt.where(Contact.id > after_id)
+    if include_user and not as_rows:
+        stmt = stmt.options(selectinload(Contact.user))
+    stmt = stmt.order_by(Contact.id).offset(offset).limit(limit)
     contacts = await db.execute(stmt)
-    return contacts.scalars().all()
+    return contacts.all() if as_rows else contacts.scalars().all()
 
 
-async def get_contacts_last_name(last_name: str, limit: int, offset: int, db: AsyncSession, user: User) -> \
-        Sequence[Contact]:
+async def get_contacts_last_name(last_name: str, limit: int, offset: int, db: AsyncSession, user: User,
+                                 after_id: int | None = None, include_user: bool = False,
+                                 as_rows: bool = False) -> Sequence[Contact] | Sequence[Row]:
     """
     The get_contacts_last_name function returns a list of contacts with the given last name.
 
@@ -107,12 +186,101 @@ async def get_contacts_last_name(last_name: str, limit: int, offset: int, db: As
     :param offset: int: Specify the number of rows to skip
     :param db: AsyncSession: Pass the database session to the function
     :param user: User: Filter the results by user
-    :return: A list of contacts with the given last name
+    :param after_id: int | None: Return only contacts with a greater id (keyset pagination)
+    :param include_user: bool: Load the owner of every contact with a separate SELECT ... IN query
+    :param as_rows: bool: Return Row tuples of CONTACT_COLUMNS instead of contacts (include_user is ignored)
+    :return: A list of contacts with the given last name ordered by id
     :doc-author: SergiyRus1974
     """
-    stmt = select(Contact).filter_by(last_name=last_name, user=user).offset(offset).limit(limit)
+    stmt = select_contacts(as_rows).filter_by(last_name=last_name, user=user)
+    if after_id is not None:
+        stmt = stmt.where(Contact.id > after_id)
+    if include_user and not as_rows:
+        stmt = stmt.options(selectinload(Contact.user))
+    stmt = stmt.order_by(Contact.id).offset(offset).limit(limit)
     contacts = await db.execute(stmt)
-    return contacts.scalars().all()
+    return contacts.all() if as_rows else contacts.scalars().all()
+
+
+def trigrams(query: str) -> list[str]:
+    """
+    The trigrams function splits a search query into its distinct lowercase trigrams.
+
+    :param query: str: The search query, at least 3 characters
+    :return: The trigrams in the order they appear
+    :doc-author: SergiyRus1974
+    """
+    query = query.lower()
+    return list(dict.fromkeys(query[i:i + 3] for i in range(len(query) - 2)))
+
+
+def fts_match(grams: list[str]) -> str:
+    """
+    The fts_match function builds the FTS5 MATCH expression of a search on SQLite: any of the trigrams, quoted.
+
+    :param grams: list[str]: Trigrams of the query
+    :return: The MATCH expression
+    :doc-author: SergiyRus1974
+    """
+    return " OR ".join('"{}"'.format(gram.replace('"', '""')) for gram in grams)
+
+
+async def search_contacts(query: str, limit: int, offset: int, db: AsyncSession, user: User, similarity: float,
+                          as_rows: bool = False) -> Sequence[Contact] | Sequence[Row]:
+    """
+    The search_contacts function finds the contacts of a user whose first name, last name, email or phone
+        contain the query or look like it, most similar first.
+        On Postgres the pg_trgm GIN index over contact_search_text serves both the substring match (ILIKE) and
+        the fuzzy one (the <% word similarity operator, with the threshold set for this transaction only);
+        on SQLite the contacts_search FTS5 table finds the contacts sharing a trigram with the query; those that
+        contain less than similarity of the query trigrams are dropped and the rest ranked by that share.
+
+    :param query: str: What to look for, at least 3 characters
+    :param limit: int: Limit the number of results returned
+    :param offset: int: Specify the number of rows to skip
+    :param db: AsyncSession: Pass the database session to the function
+    :param user: User: Search only the contacts of this user
+    :param similarity: float: Minimum similarity (0..1) of a fuzzy match
+    :param as_rows: bool: Return Row tuples of CONTACT_COLUMNS instead of contacts
+    :return: The matching contacts, best match first
+    :doc-author: SergiyRus1974
+    """
+    stmt = select_contacts(as_rows).filter_by(user=user)
+    if db.get_bind().dialect.name == "postgresql":
+        await db.execute(select(func.set_config("pg_trgm.word_similarity_threshold", str(similarity), True)))
+        query = query.lower()
+        stmt = stmt.where(or_(contact_search_text.contains(query, autoescape=True),
+                              literal(query).op("<%")(contact_search_text)))
+        stmt = stmt.order_by(func.word_similarity(query, contact_search_text).desc(), Contact.id)
+    else:
+        grams = trigrams(query)
+        found = sum(case((func.instr(contact_search_text, gram) > 0, 1), else_=0) for gram in grams)
+        share = found / float(len(grams))
+        stmt = stmt.join(contacts_search, contacts_search.c.rowid == Contact.id) \
+            .where(literal_column(contacts_search.name).match(fts_match(grams)), share >= similarity) \
+            .order_by(share.desc(), contacts_search.c.rank, Contact.id)
+    contacts = await db.execute(stmt.offset(offset).limit(limit))
+    return contacts.all() if as_rows else contacts.scalars().all()
+
+
+async def stream_contacts(db: AsyncSession, user: User | None, batch_size: int = 1000) -> AsyncIterator[Contact]:
+    """
+    The stream_contacts function iterates over the contacts of a user (or over all contacts when user is None)
+        without loading them all into memory. The rows are read through a server-side cursor (asyncpg) in batches
+        of batch_size, and the owner is not loaded.
+
+    :param db: AsyncSession: A session that stays open while the iterator is consumed
+    :param user: User | None: Filter the contacts by user, None for all contacts
+    :param batch_size: int: Number of rows fetched from the cursor at a time
+    :return: An async iterator of contacts ordered by id
+    :doc-author: SergiyRus1974
+    """
+    stmt = select(Contact).order_by(Contact.id).execution_options(yield_per=batch_size)
+    if user is not None:
+        stmt = stmt.where(Contact.user_id == user.id)
+    contacts = await db.stream_scalars(stmt)
+    async for contact in contacts:
+        yield contact
 
 
 async def get_contact_email(email: str, db: AsyncSession, user: User) -> Contact | None:
@@ -129,7 +297,10 @@ async def get_contact_email(email: str, db: AsyncSession, user: User) -> Contact
     """
     stmt = select(Contact).filter_by(email=email, user=user)
     contact = await db.execute(stmt)
-    return contact.scalar_one_or_none()
+    contact = contact.scalar_one_or_none()
+    if contact:
+        set_committed_value(contact, "user", user)
+    return contact
 
 
 async def get_contact(contact_id: int, db: AsyncSession, user: User) -> Contact | None:
@@ -145,12 +316,32 @@ async def get_contact(contact_id: int, db: AsyncSession, user: User) -> Contact
     """
     stmt = select(Contact).filter_by(id=contact_id, user=user)
     contact = await db.execute(stmt)
-    return contact.scalar_one_or_none()
+    contact = contact.scalar_one_or_none()
+    if contact:
+        set_committed_value(contact, "user", user)
+    return contact
+
+
+def _insert(db: AsyncSession):
+    """
+    The _insert function picks the dialect-specific insert construct for the session's database,
+    so that ON CONFLICT DO NOTHING can be used both on Postgres and on SQLite (tests).
+
+    :param db: AsyncSession: The database session the statement will run on
+    :return: The insert function of the matching dialect
+    :doc-author: SergiyRus1974
+    """
+    if db.get_bind().dialect.name == "postgresql":
+        return postgresql.insert
+    return sqlite.insert
 
 
 async def create_contact(body: ContactSchema, db: AsyncSession, user: User) -> Contact | None:
     """
     The create_contact function creates a new contact in the database.
+        A single INSERT ... ON CONFLICT (user_id, email) DO NOTHING RETURNING statement both checks whether
+        the user already has a contact with this email and returns the stored row, so no extra SELECT or refresh
+        is needed.
 
     :param body: ContactSchema: Validate the request body
     :param db: AsyncSession: Pass the database session to the function
@@ -158,16 +349,55 @@ async def create_contact(body: ContactSchema, db: AsyncSession, user: User) -> C
     :return: A contact object if the contact is created, or none if it already exists
     :doc-author: SergiyRus1974
     """
-    stmt = select(Contact).filter_by(email=body.email, user=user)
+    stmt = _insert(db)(Contact).values(**body.model_dump(exclude_unset=True), user_id=user.id) \
+        .on_conflict_do_nothing(index_elements=EMAIL_CONFLICT).returning(Contact)
     result = await db.execute(stmt)
-    contact_ = result.scalar_one_or_none()
-    if contact_ is None:
-        contact = Contact(**body.model_dump(exclude_unset=True), user=user)
-        db.add(contact)
+    contact = result.scalar_one_or_none()
+    if contact is None:
+        return
+    await db.commit()
+    await contacts_cache.bump(user.id)
+    await read_your_writes.mark(user.user_email)
+    set_committed_value(contact, "user", user)
+    return contact
+
+
+async def create_contacts(bodies: list[ContactSchema], db: AsyncSession, user: User, batch_size: int = 1000) -> \
+        list[tuple[str, int | None]]:
+    """
+    The create_contacts function creates many contacts at once with the same rules as create_contact.
+        Contacts are inserted with multi-row INSERT ... ON CONFLICT DO NOTHING RETURNING statements of up to
+        batch_size rows, committed once per batch. An email the user already has is reported as "exists", an email
+        repeated in the request is stored once and its later copies are reported as "duplicate".
+
+    :param bodies: list[ContactSchema]: The validated contacts to create
+    :param db: AsyncSession: Pass the database session to the function
+    :param user: User: Get the user that is currently logged in
+    :param batch_size: int: Maximum number of rows per INSERT statement
+    :return: A (status, contact id) pair for every item of bodies, in the same order
+    :doc-author: SergiyRus1974
+    """
+    report: list[tuple[str, int | None]] = [("duplicate", None)] * len(bodies)
+    first_index = {}
+    for index, body in enumerate(bodies):
+        first_index.setdefault(body.email, index)
+    unique = list(first_index.values())
+    insert = _insert(db)
+    for start in range(0, len(unique), batch_size):
+        batch = unique[start:start + batch_size]
+        rows = [dict(bodies[index].model_dump(), user_id=user.id) for index in batch]
+        stmt = insert(Contact).values(rows).on_conflict_do_nothing(index_elements=EMAIL_CONFLICT) \
+            .returning(Contact.id, Contact.email)
+        result = await db.execute(stmt)
+        created = {email: contact_id for contact_id, email in result.all()}
         await db.commit()
-        await db.refresh(contact)
-        return contact
-    return
+        if created:
+            await contacts_cache.bump(user.id)
+            await read_your_writes.mark(user.user_email)
+        for index in batch:
+            contact_id = created.get(bodies[index].email)
+            report[index] = ("exists", None) if contact_id is None else ("created", contact_id)
+    return report
 
 
 async def update_contact(contact_id: int, body: ContactUpdateSchema, db: AsyncSession, user: User) -> \
@@ -179,38 +409,40 @@ async def update_contact(contact_id: int, body: ContactUpdateSchema, db: AsyncSe
             body (ContactUpdateSchema): A schema containing all fields that can be updated for a Contact object.
             This is used to validate and deserialize the request body into an object that can be passed as an argument
             to this function. See schemas/contact_update_schema for more information on what fields are required, optional, etc...
+        The update is a single UPDATE ... WHERE id AND user_id RETURNING statement; an email that another contact
+        of the user already has is reported by the unique index on (user_id, email).
 
     :param contact_id: int: Specify the contact that will be updated
     :param body: ContactUpdateSchema: Validate the body of the request
     :param db: AsyncSession: Pass the database session to the function
     :param user: User: Make sure that the user who is trying to update a contact is the owner of
-    :return: The contact object with the updated fields
+    :return: The contact object with the updated fields, None if not found or False if the email is taken
     :doc-author: SergiyRus1974
     """
-    stmt = select(Contact).filter_by(id=contact_id, user=user)
-    result = await db.execute(stmt)
+    stmt = update(Contact).where(Contact.id == contact_id, Contact.user_id == user.id).values(
+        first_name=body.first_name,
+        last_name=body.last_name,
+        email=body.email,
+        phone=body.phone,
+        friend_status=body.friend_status,
+    ).returning(Contact)
+    try:
+        result = await db.execute(stmt)
+    except IntegrityError:
+        await db.rollback()
+        return False
     contact = result.scalar_one_or_none()
-
     if contact:
-        if contact.email != body.email:
-            stmt = select(Contact).filter_by(email=body.email)
-            result = await db.execute(stmt)
-            contact_ = result.scalar_one_or_none()
-            if contact_:
-                return False
-        contact.first_name = body.first_name
-        contact.last_name = body.last_name
-        contact.email = body.email
-        contact.phone = body.phone
-        contact.friend_status = body.friend_status
         await db.commit()
-        await db.refresh(contact)
+        await contacts_cache.bump(user.id)
+        await read_your_writes.mark(user.user_email)
+        set_committed_value(contact, "user", user)
     return contact
 
 
 async def delete_contact(contact_id: int, db: AsyncSession, user: User) -> Contact:
     """
-    The delete_contact function deletes a contact from the database.
+    The delete_contact function deletes a contact from the database with a single DELETE ... RETURNING statement.
 
     :param contact_id: int: Identify the contact to be deleted
     :param db: AsyncSession: Pass the database session to the function
@@ -218,10 +450,12 @@ async def delete_contact(contact_id: int, db: AsyncSession, user: User) -> Conta
     :return: The contact that was deleted
     :doc-author: SergiyRus1974
     """
-    stmt = select(Contact).filter_by(id=contact_id, user=user)
-    contact = await db.execute(stmt)
-    contact = contact.scalar_one_or_none()
+    stmt = delete(Contact).where(Contact.id == contact_id, Contact.user_id == user.id).returning(Contact)
+    result = await db.execute(stmt)
+    contact = result.scalar_one_or_none()
     if contact:
-        await db.delete(contact)
         await db.commit()
+        await contacts_cache.bump(user.id)
+        await read_your_writes.mark(user.user_email)
+        set_committed_value(contact, "user", user)
     return contact
@@ -0,0 +1,106 @@
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.entity.models import EmailKind, EmailOutbox, OutboxStatus
+
+
+def utcnow() -> datetime:
+    """
+    The utcnow function returns the current UTC time without tzinfo, as it is stored in the outbox.
+
+    :return: The current time
+    :doc-author: SergiyRus1974
+    """
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+async def enqueue_email(kind: EmailKind, email: str, username: str, host: str, db: AsyncSession) -> EmailOutbox:
+    """
+    The enqueue_email function adds an email to the outbox without committing: it is committed by the caller
+        together with the change that triggers it, so the email is queued if and only if that change is saved.
+
+    :param kind: EmailKind: Which email to send
+    :param email: str: The address the email is sent to
+    :param username: str: Passed to the template
+    :param host: str: Base url of the application, used for the links in the email
+    :param db: AsyncSession: Pass the database session to the function
+    :return: The outbox row
+    :doc-author: SergiyRus1974
+    """
+    outbox_email = EmailOutbox(kind=kind, recipient=email, username=username, host=host,
+                               status=OutboxStatus.pending, attempts=0, next_attempt_at=utcnow())
+    db.add(outbox_email)
+    return outbox_email
+
+
+async def claim_emails(limit: int, lease: float, db: AsyncSession) -> list[EmailOutbox]:
+    """
+    The claim_emails function takes up to limit pending emails that are due, oldest first.
+        The rows are locked with SKIP LOCKED, so several workers never claim the same email, and they are moved
+        lease seconds into the future before the transaction is committed: the lock is not held while the emails
+        are sent, and an email claimed by a worker that died is picked up again once the lease runs out.
+
+    :param limit: int: Maximum number of emails to claim
+    :param lease: float: Seconds the worker has to send the emails
+    :param db: AsyncSession: Pass the database session to the function
+    :return: The claimed emails, with attempts already counting this attempt
+    :doc-author: SergiyRus1974
+    """
+    now = utcnow()
+    stmt = select(EmailOutbox).where(EmailOutbox.status == OutboxStatus.pending,
+                                     EmailOutbox.next_attempt_at <= now) \
+        .order_by(EmailOutbox.next_attempt_at, EmailOutbox.id).limit(limit).with_for_update(skip_locked=True)
+    emails = list((await db.execute(stmt)).scalars().all())
+    for outbox_email in emails:
+        outbox_email.attempts += 1
+        outbox_email.next_attempt_at = now + timedelta(seconds=lease)
+    await db.commit()
+    return emails
+
+
+async def mark_sent(outbox_email: EmailOutbox, db: AsyncSession) -> None:
+    """
+    The mark_sent function removes a sent email from the outbox; it is committed by the caller with the batch.
+
+    :param outbox_email: EmailOutbox: A claimed email
+    :param db: AsyncSession: Pass the database session to the function
+    :return: None
+    :doc-author: SergiyRus1974
+    """
+    await db.delete(outbox_email)
+
+
+async def mark_failed(outbox_email: EmailOutbox, error: str, retry_in: float | None, db: AsyncSession) -> None:
+    """
+    The mark_failed function schedules a failed email for another attempt, or moves it to the dead letters when
+        retry_in is None. It is committed by the caller with the batch.
+
+    :param outbox_email: EmailOutbox: A claimed email
+    :param error: str: Why sending failed
+    :param retry_in: float | None: Seconds until the next attempt, None to give up
+    :param db: AsyncSession: Pass the database session to the function
+    :return: None
+    :doc-author: SergiyRus1974
+    """
+    outbox_email.last_error = error[:500]
+    if retry_in is None:
+        outbox_email.status = OutboxStatus.dead
+    else:
+        outbox_email.next_attempt_at = utcnow() + timedelta(seconds=retry_in)
+
+
+async def count_emails(db: AsyncSession) -> dict[str, int]:
+    """
+    The count_emails function counts the emails in the outbox by status.
+
+    :param db: AsyncSession: Pass the database session to the function
+    :return: A dict of status name to count, with every status present
+    :doc-author: SergiyRus1974
+    """
+    counts = {status.value: 0 for status in OutboxStatus}
+    rows = await db.execute(select(EmailOutbox.status, func.count()).group_by(EmailOutbox.status))
+    for status, count in rows:
+        counts[status.value] = count
+    return counts
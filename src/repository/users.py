@@ -3,9 +3,12 @@ from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 from libgravatar import Gravatar
 
-from src.database.db import get_db
+from src.database.db import get_db, read_your_writes
 from src.entity.models import User
 from src.schemas.user import UserSchema
+from src.services.cache import contacts_cache
+from src.services.revocation import revocations
+from src.services.token_cache import token_cache
 # from src.services.auth import auth_service
 
 
@@ -57,8 +60,11 @@ async def update_token(user: User, token: str | None, db: AsyncSession):
     :return: A boolean value
     :doc-author: SergiyRus1974
     """
+    email = user.user_email
     user.refresh_token = token
     await db.commit()
+    await token_cache.invalidate(email)
+    await read_your_writes.mark(email)
 
 
 async def confirmed_email(email: str, db: AsyncSession):
@@ -75,6 +81,8 @@ async def confirmed_email(email: str, db: AsyncSession):
     user = await get_user_by_email(email, db)
     user.confirmed = True
     await db.commit()
+    await token_cache.invalidate(email)
+    await read_your_writes.mark(email)
 
 
 async def update_avatar(email, url: str, db: AsyncSession) -> User:
@@ -90,15 +98,35 @@ async def update_avatar(email, url: str, db: AsyncSession) -> User:
     user = await get_user_by_email(email, db)
     user.avatar = url
     await db.commit()
+    await token_cache.invalidate(email)
+    await read_your_writes.mark(email)
     await db.refresh(user)
+    await contacts_cache.bump(user.id)
     return user
 
 
+async def rehash_password(user: User, password_hash: str, db: AsyncSession) -> None:
+    """
+    The rehash_password function stores a new hash of the same password, with the current hashing settings.
+    Unlike update_password the sessions and tokens of the user stay valid, only the cached tokens are dropped.
+
+    :param user: User: The user who just logged in
+    :param password_hash: str: The new hash
+    :param db: AsyncSession: Pass the database session to the function
+    :return: None
+    :doc-author: SergiyRus1974
+    """
+    user.password = password_hash
+    await db.commit()
+    await token_cache.invalidate(user.user_email)
+
+
 async def update_password(user: User, new_password: str, db: AsyncSession) -> User:
     """
     The update_password function takes a user object, a new password string, and an async database session.
     It updates the user's password to the new_password string and commits it to the database. It then refreshes
     the user object from the database so that it has all of its attributes up-to-date.
+    The stateless access tokens issued to the user until now are revoked.
 
     :param user: User: Pass the user object to the function
     :param new_password: str: Pass the new password to the function
@@ -106,7 +134,11 @@ async def update_password(user: User, new_password: str, db: AsyncSession) -> Us
     :return: The updated user
     :doc-author: SergiyRus1974
     """
+    email = user.user_email
     user.password = new_password
     await db.commit()
+    await token_cache.invalidate(email)
+    await revocations.revoke_user(user.id)
+    await read_your_writes.mark(email)
     await db.refresh(user)
     return user
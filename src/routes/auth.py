@@ -1,13 +1,17 @@
-from fastapi import APIRouter, HTTPException, Depends, status, Security, BackgroundTasks, Request
+from fastapi import APIRouter, HTTPException, Depends, status, Security, Request
 from fastapi.security import OAuth2PasswordRequestForm, HTTPAuthorizationCredentials, HTTPBearer
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from src.database.db import get_db
+from src.repository import outbox as repository_outbox
 from src.repository import users as repository_users
 from src.schemas.user import UserSchema, TokenSchema, LogoutResponse, RequestEmail, UserResponseSchema
-from src.entity.models import User
+from src.entity.models import EmailKind, User
 from src.services.auth import auth_service
-from src.services.email import send_email
+from src.services.login_limiter import login_limiter
+from src.services.revocation import revocations
+from src.services.sessions import SessionStore, get_session_store
+from src.services.token_cache import token_cache
 from src.conf import messages
 
 router = APIRouter(prefix='/auth', tags=['auth'])
@@ -16,16 +20,15 @@ get_refresh_token = HTTPBearer()
 
 
 @router.post("/signup", response_model=UserResponseSchema, status_code=status.HTTP_201_CREATED)
-async def signup(body: UserSchema, background_tasks: BackgroundTasks, request: Request,
-                 db: AsyncSession = Depends(get_db)) -> dict:
+async def signup(body: UserSchema, request: Request, db: AsyncSession = Depends(get_db)) -> dict:
     """
     The signup function creates a new user in the database.
         It takes in a UserSchema object, which is validated by pydantic.
         If the email already exists, it returns an HTTP 409 error code (conflict).
         Otherwise, it hashes the password and saves to database.
+        The confirmation email is queued in the outbox in the same transaction and sent by the mail worker.
 
     :param body: UserSchema: Validate the request body
-    :param background_tasks: BackgroundTasks: Add a task to the background tasks queue
     :param request: Request: Get the base url of the application
     :param db: AsyncSession: Get the database session
     :return: A dictionary with the user and a message
@@ -35,21 +38,30 @@ async def signup(body: UserSchema, background_tasks: BackgroundTasks, request: R
 
     if exist_user:
         raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=messages.ACCOUNT_EXISTS)
-    body.password = auth_service.get_password_hash(body.password)
+    # don't hold a pooled connection while bcrypt runs
+    await db.commit()
+    body.password = await auth_service.get_password_hash_async(body.password)
+    # create_user commits the queued email together with the user
+    await repository_outbox.enqueue_email(EmailKind.confirm_email, body.user_email, body.username,
+                                          str(request.base_url), db)
     new_user = await repository_users.create_user(body, db)
-    background_tasks.add_task(send_email, new_user.user_email, new_user.username, str(request.base_url))
     return {"user": new_user, "detail": "User successfully created. Check your email for confirmation."}
 
 
-@router.post("/login", response_model=TokenSchema)
-async def login(body: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(get_db)) -> dict():
+@router.post("/login", response_model=TokenSchema, dependencies=[Depends(login_limiter)])
+async def login(body: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(get_db),
+                sessions: SessionStore = Depends(get_session_store)) -> dict():
     """
     The login function is used to authenticate a user.
         It takes in the username and password of the user, and returns an access token if successful.
         The access token can be used to make authenticated requests.
+        A password hashed with another scheme or cost than the settings is hashed again and stored.
+        Attempts from an account or a client address over their limit of failed logins are rejected before the
+        password is checked; an answer 401 counts as a failure (see login_limiter).
 
     :param body: OAuth2PasswordRequestForm: Get the username and password from the request body
     :param db: AsyncSession: Get the database session
+    :param sessions: SessionStore: The store of the login sessions
     :return: A dict with the access token and refresh token
     :doc-author: SergiyRus1974
     """
@@ -58,83 +70,102 @@ async def login(body: OAuth2PasswordRequestForm = Depends(), db: AsyncSession =
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail=messages.INVALID_EMAIL)
     if not user.confirmed:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail=messages.NOT_CONFIRMED_EMAIL)
-    if not auth_service.verify_password(body.password, user.password):
+    # don't hold a pooled connection while bcrypt runs
+    await db.commit()
+    verified, password_hash = await auth_service.verify_and_update_password(body.password, user.password)
+    if not verified:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail=messages.INVALID_PASSWORD)
+    if password_hash is not None:
+        await repository_users.rehash_password(user, password_hash, db)
     # Generate JWT
-    access_token = await auth_service.create_access_token(data={"sub": user.user_email})
-    refresh_token_ = await auth_service.create_refresh_token(data={"sub": user.user_email})
-    await repository_users.update_token(user, refresh_token_, db)
+    access_data, refresh_data = auth_service.token_data(user)
+    access_token = await auth_service.create_access_token(data=access_data)
+    refresh_token_ = await auth_service.create_refresh_token(data=refresh_data)
+    await sessions.create(refresh_data["sid"], user.user_email, refresh_token_)
     return {"access_token": access_token, "refresh_token": refresh_token_, "token_type": "bearer"}
 
 
 @router.post("/logout", response_model=LogoutResponse)
-async def logout(user: User = Depends(auth_service.get_current_user),
-                 db: AsyncSession = Depends(get_db)) -> dict:
+async def logout(user: User = Depends(auth_service.get_current_user), token: str = Depends(auth_service.oauth2_scheme),
+                 db: AsyncSession = Depends(get_db), sessions: SessionStore = Depends(get_session_store)) -> dict:
     """
-    The logout function will logout the user by removing their refresh token from the database.
+    The logout function will logout the user by ending the login session of their access token.
+        With stateless tokens the session is revoked too, as the access token itself stays valid until it expires.
 
     :param user: User: Get the current user
+    :param token: str: The access token of the request
     :param db: AsyncSession: Access the database
+    :param sessions: SessionStore: The store of the login sessions
     :return: A response with a dictionary containing the result
     :doc-author: SergiyRus1974
     """
-    user.refresh_token = None
-    await db.commit()
+    session_id = auth_service.session_id(token)
+    if session_id is None:
+        # a token issued before sessions
+        await repository_users.update_token(user, None, db)
+        return {"result": "Success"}
+    await sessions.revoke(session_id, user.user_email)
+    await revocations.revoke_session(session_id)
+    await token_cache.invalidate(user.user_email)
     return {"result": "Success"}
 
 
 @router.get('/refresh_token', response_model=TokenSchema)
 async def refresh_token(credentials: HTTPAuthorizationCredentials = Security(get_refresh_token),
-                        db: AsyncSession = Depends(get_db)) -> dict():
+                        db: AsyncSession = Depends(get_db), sessions: SessionStore = Depends(get_session_store)) -> dict():
     """
     The refresh_token function is used to refresh the access token.
     It takes in a refresh token and returns a new access_token and refresh_token pair.
-    The function first decodes the given refresh token to get the email of its owner, then it gets that user from
-    the database, checks if their stored tokens match with what was provided, if not it raises an error. If they do match
-    it creates new tokens for them using auth_service's create functions and updates their stored tokens in the database.
+    The function first decodes the given refresh token to get the email of its owner and its login session, then it
+    creates new tokens for the session and moves the session on to the new refresh token. A refresh token that was
+    already used means it leaked: the session is revoked and the client has to log in again.
 
     :param credentials: HTTPAuthorizationCredentials: Get the token from the header
     :param db: AsyncSession: Get the database session
+    :param sessions: SessionStore: The store of the login sessions
     :return: A dict with the access_token, refresh_token and token type
     :doc-author: SergiyRus1974
     """
     token = credentials.credentials
     email = await auth_service.decode_refresh_token(token)
+    session_id = auth_service.session_id(token)
     user = await repository_users.get_user_by_email(email, db)
-    if user.refresh_token != token:
-        await repository_users.update_token(user, None, db)
+    if session_id is None or user is None:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail=messages.INVALID_REFRESH_TOKEN)
 
-    access_token = await auth_service.create_access_token(data={"sub": email})
-    refresh_token_ = await auth_service.create_refresh_token(data={"sub": email})
-    await repository_users.update_token(user, refresh_token_, db)
+    access_data, refresh_data = auth_service.token_data(user, session_id=session_id)
+    access_token = await auth_service.create_access_token(data=access_data)
+    refresh_token_ = await auth_service.create_refresh_token(data=refresh_data)
+    if not await sessions.rotate(session_id, email, token, refresh_token_):
+        await revocations.revoke_session(session_id)
+        await token_cache.invalidate(email)
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail=messages.INVALID_REFRESH_TOKEN)
     return {"access_token": access_token, "refresh_token": refresh_token_, "token_type": "bearer"}
 
 
 @router.post("/request_email")
-async def request_email(body: RequestEmail, background_tasks: BackgroundTasks, request: Request,
-                        db: AsyncSession = Depends(get_db)) -> dict:
+async def request_email(body: RequestEmail, request: Request, db: AsyncSession = Depends(get_db)) -> dict:
     """
     The request_email function is used to send an email to the user with a link that will allow them
     to confirm their email address. The function takes in a RequestEmail object, which contains the
     email of the user who wants to confirm their account. It then checks if there is already a confirmed
-    user with that email address, and if so returns an error message saying as much. If not, it sends
-    an asynchronous task (send_email) containing information about what URL should be sent in order for
-    the user's account to be confirmed.
+    user with that email address, and if so returns a message saying as much; an unknown email gets a 404.
+    Otherwise it queues the confirmation email in the outbox, from where the mail worker sends it.
 
     :param body: RequestEmail: Get the email from the request body
-    :param background_tasks: BackgroundTasks: Add a task to the background tasks queue
     :param request: Request: Get the base_url of the application
     :param db: AsyncSession: Get the database session
     :return: A dict with a message key and value
     :doc-author: SergiyRus1974
     """
     user = await repository_users.get_user_by_email(body.email, db)
-
+    if user is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
     if user.confirmed:
         return {"message": messages.EMAIL_ALREADY_CONFIRMED}
-    if user:
-        background_tasks.add_task(send_email, user.user_email, user.username, str(request.base_url))
+    await repository_outbox.enqueue_email(EmailKind.confirm_email, user.user_email, user.username,
+                                          str(request.base_url), db)
+    await db.commit()
     return {"message": messages.CHECK_EMAIL_FOR_CONFIRMATION}
 
 
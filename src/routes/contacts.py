@@ -1,14 +1,21 @@
-from typing import Sequence
+from typing import Literal
 
-from fastapi import APIRouter, HTTPException, Depends, status, Path, Query
+from fastapi import APIRouter, HTTPException, Depends, status, Path, Query, Body
+from fastapi.responses import Response, StreamingResponse
 from fastapi_limiter.depends import RateLimiter
 from sqlalchemy.ext.asyncio import AsyncSession
 from pydantic import EmailStr
 
-from src.database.db import get_db
+from src.conf.config import settings
+from src.database.db import get_db, get_session_factory
 from src.repository import contacts as repositories_contacts
-from src.schemas.contact import ContactSchema, ContactUpdateSchema, ContactResponse
-from src.services.auth import auth_service
+from src.schemas.contact import ContactSchema, ContactUpdateSchema, ContactResponse, ContactPage, \
+    ContactBulkResponse
+from src.services.auth import auth_service, get_read_db
+from src.services.cache import contacts_cache
+from src.services.export import ExportFormat, ENCODERS, export_response
+from src.services.pagination import build_page, decode_cursor
+from src.services.serialization import page_response
 from src.entity.models import User, Role, Contact
 from src.services.roles import RoleAccess
 
@@ -16,11 +23,45 @@ from src.services.roles import RoleAccess
 router = APIRouter(prefix='/contacts', tags=['contacts'])
 access_to_route_all = RoleAccess([Role.admin, Role.moderator])
 
+CURSOR_DESCRIPTION = "next_cursor of the previous page; pages after the first cost the same as the first one"
+INCLUDE_DESCRIPTION = "include=user embeds the owner in every contact (loaded with one extra query)"
 
-@router.get("/all", response_model=list[ContactResponse], dependencies=[Depends(access_to_route_all)])
+
+def contact_id_key(contact: Contact) -> tuple[int]:
+    """
+    The contact_id_key function returns the keyset sort key of the listings that are ordered by id.
+
+    :param contact: Contact: The last contact of a page
+    :return: A one-element tuple with the contact id
+    :doc-author: SergiyRus1974
+    """
+    return (contact.id,)
+
+
+def contacts_page(page: dict, include: str | None, owner: User | None = None) -> dict | Response:
+    """
+    The contacts_page function returns a page of a listing from the route.
+        Without include the contacts are Row tuples (as_rows), written straight to JSON by page_response;
+        with include=user they are contacts with their owners, serialized through the response_model.
+
+    :param page: dict: The page built by build_page
+    :param include: str | None: The include query parameter of the route
+    :param owner: User | None: The owner of the listed contacts, if the listing has one
+    :return: The JSON response, or the page for the response_model
+    :doc-author: SergiyRus1974
+    """
+    if include is None:
+        return page_response(page, owner)
+    return dict(page, owner=owner)
+
+
+@router.get("/all", response_model=ContactPage, dependencies=[Depends(access_to_route_all)])
+@contacts_cache.cached(ContactPage, all_users=True)
 async def get_all_contacts(limit: int = Query(10, ge=10, le=500), offset: int = Query(0, ge=0),
-                           db: AsyncSession = Depends(get_db), user: User = Depends(auth_service.get_current_user)) -> \
-        Sequence[Contact]:
+                           cursor: str | None = Query(None, description=CURSOR_DESCRIPTION),
+                           include: Literal["user"] | None = Query(None, description=INCLUDE_DESCRIPTION),
+                           db: AsyncSession = Depends(get_read_db),
+                           user: User = Depends(auth_service.get_current_user)) -> dict | Response:
     """
     The get_all_contacts function returns a list of contacts.
 
@@ -29,23 +70,31 @@ async def get_all_contacts(limit: int = Query(10, ge=10, le=500), offset: int =
     :param le: Limit the number of contacts returned to a maximum of 500
     :param offset: int: Specify the number of records to skip before starting to return the results
     :param ge: Check if the value is greater than or equal to 10
+    :param cursor: str | None: Continue after the page that returned this cursor
+    :param include: Literal["user"] | None: Embed the owner in every contact
     :param db: AsyncSession: Get the database session
     :param user: User: Get the current user
-    :return: A list of contacts
+    :return: A page of contacts and the cursor of the next page
     :doc-author: SergiyRus1974
     """
-    contacts = await repositories_contacts.get_all_contacts(limit, offset, db)
+    after = decode_cursor(cursor, offset=offset)
+    contacts = await repositories_contacts.get_all_contacts(limit, offset, db, after_id=after and after[0],
+                                                            include_user=include == "user", as_rows=include is None)
     if not contacts:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="NOT FOUND")
-    return contacts
+    return contacts_page(build_page(contacts, limit, contact_id_key), include)
 
 
-@router.get("/birthday", response_model=list[ContactResponse])
+@router.get("/birthday", response_model=ContactPage)
+@contacts_cache.cached(ContactPage)
 async def get_contacts_birthday(limit: int = Query(10, ge=10, le=500), offset: int = Query(0, ge=0),
-                                db: AsyncSession = Depends(get_db),
-                                user: User = Depends(auth_service.get_current_user)) -> Sequence[Contact]:
+                                window_days: int = Query(7, ge=0, le=365),
+                                cursor: str | None = Query(None, description=CURSOR_DESCRIPTION),
+                                include: Literal["user"] | None = Query(None, description=INCLUDE_DESCRIPTION),
+                                db: AsyncSession = Depends(get_read_db),
+                                user: User = Depends(auth_service.get_current_user)) -> dict | Response:
     """
-    The get_contacts_birthday function returns a list of contacts that have birthdays in the next 7 days.
+    The get_contacts_birthday function returns a list of contacts that have birthdays in the next window_days days.
     The function takes an optional limit and offset parameter to control how many results are returned.
     The user must be logged in to use this function.
 
@@ -54,19 +103,26 @@ async def get_contacts_birthday(limit: int = Query(10, ge=10, le=500), offset: i
     :param le: Limit the maximum value of the parameter
     :param offset: int: Skip a number of records in the database
     :param ge: Set a minimum value for the parameter
+    :param window_days: int: How many days ahead to look for birthdays (7 by default)
+    :param cursor: str | None: Continue after the page that returned this cursor
+    :param include: Literal["user"] | None: Embed the owner in every contact
     :param db: AsyncSession: Get the database session
     :param user: User: Get the current user from the auth_service
-    :return: A list of contacts who have a birthday in the current month
+    :return: A page of contacts who have a birthday in the next window_days days and the cursor of the next page
     :doc-author: SergiyRus1974
     """
-    contacts = await repositories_contacts.get_contacts_birthday(limit, offset, db, user)
+    after = decode_cursor(cursor, size=2, offset=offset)
+    contacts = await repositories_contacts.get_contacts_birthday(limit, offset, db, user, window_days, after=after,
+                                                                 include_user=include == "user",
+                                                                 as_rows=include is None)
     if not contacts:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="NOT FOUND")
-    return contacts
+    return contacts_page(build_page(contacts, limit, repositories_contacts.birthday_sort_key), include, owner=user)
 
 
 @router.get("/email", response_model=ContactResponse)
-async def get_contact_email(email: EmailStr, db: AsyncSession = Depends(get_db),
+@contacts_cache.cached(ContactResponse)
+async def get_contact_email(email: EmailStr, db: AsyncSession = Depends(get_read_db),
                             user: User = Depends(auth_service.get_current_user)) -> Contact:
     """
     The get_contact_email function is used to retrieve a contact by email.
@@ -84,11 +140,14 @@ async def get_contact_email(email: EmailStr, db: AsyncSession = Depends(get_db),
     return contact
 
 
-@router.get("/first_name", response_model=list[ContactResponse])
+@router.get("/first_name", response_model=ContactPage)
+@contacts_cache.cached(ContactPage)
 async def get_contacts_first_name(first_name: str = Query(description="Input first name", min_length=3, max_length=50),
                                   limit: int = Query(10, ge=10, le=500), offset: int = Query(0, ge=0),
-                                  db: AsyncSession = Depends(get_db),
-                                  user: User = Depends(auth_service.get_current_user)) -> Sequence[Contact]:
+                                  cursor: str | None = Query(None, description=CURSOR_DESCRIPTION),
+                                  include: Literal["user"] | None = Query(None, description=INCLUDE_DESCRIPTION),
+                                  db: AsyncSession = Depends(get_read_db),
+                                  user: User = Depends(auth_service.get_current_user)) -> dict | Response:
     """
     The get_contacts_first_name function is used to retrieve a list of contacts from the database.
     The function takes in an optional first_name parameter, which is used to filter the results by first name.
@@ -103,22 +162,31 @@ async def get_contacts_first_name(first_name: str = Query(description="Input fir
     :param le: Limit the amount of contacts returned
     :param offset: int: Specify the number of records to skip before starting to return rows
     :param ge: Specify a minimum value for the parameter
+    :param cursor: str | None: Continue after the page that returned this cursor
+    :param include: Literal["user"] | None: Embed the owner in every contact
     :param db: AsyncSession: Get the database session
     :param user: User: Get the current user
-    :return: A list of contacts
+    :return: A page of contacts, their owner and the cursor of the next page
     :doc-author: SergiyRus1974
     """
-    contacts = await repositories_contacts.get_contacts_first_name(first_name, limit, offset, db, user)
+    after = decode_cursor(cursor, offset=offset)
+    contacts = await repositories_contacts.get_contacts_first_name(first_name, limit, offset, db, user,
+                                                                   after_id=after and after[0],
+                                                                   include_user=include == "user",
+                                                                   as_rows=include is None)
     if not contacts:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="NOT FOUND")
-    return contacts
+    return contacts_page(build_page(contacts, limit, contact_id_key), include, owner=user)
 
 
-@router.get("/last_name", response_model=list[ContactResponse])
+@router.get("/last_name", response_model=ContactPage)
+@contacts_cache.cached(ContactPage)
 async def get_contacts_last_name(last_name: str = Query(description="Input last name", min_length=3, max_length=50),
                                  limit: int = Query(10, ge=10, le=500), offset: int = Query(0, ge=0),
-                                 db: AsyncSession = Depends(get_db),
-                                 user: User = Depends(auth_service.get_current_user)) -> Sequence[Contact]:
+                                 cursor: str | None = Query(None, description=CURSOR_DESCRIPTION),
+                                 include: Literal["user"] | None = Query(None, description=INCLUDE_DESCRIPTION),
+                                 db: AsyncSession = Depends(get_read_db),
+                                 user: User = Depends(auth_service.get_current_user)) -> dict | Response:
     """
     The get_contacts_last_name function is used to retrieve a list of contacts with the same last name.
     The function takes in an optional query parameter called last_name, which is a string that represents the contact's
@@ -135,19 +203,116 @@ async def get_contacts_last_name(last_name: str = Query(description="Input last
     :param le: Limit the number of contacts returned
     :param offset: int: Specify the number of records to skip
     :param ge: Specify that the limit parameter must be greater than or equal to 10
+    :param cursor: str | None: Continue after the page that returned this cursor
+    :param include: Literal["user"] | None: Embed the owner in every contact
+    :param db: AsyncSession: Get the database session
+    :param user: User: Get the current user
+    :return: A page of contacts with the specified last name and the cursor of the next page
+    :doc-author: SergiyRus1974
+    """
+    after = decode_cursor(cursor, offset=offset)
+    contacts = await repositories_contacts.get_contacts_last_name(last_name, limit, offset, db, user,
+                                                                  after_id=after and after[0],
+                                                                  include_user=include == "user",
+                                                                  as_rows=include is None)
+    if not contacts:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="NOT FOUND")
+    return contacts_page(build_page(contacts, limit, contact_id_key), include, owner=user)
+
+
+async def export_chunks(session_factory, user: User | None, export_format: ExportFormat):
+    """
+    The export_chunks function streams the encoded contacts of a user (or all contacts when user is None).
+        It opens its own session because the request session is closed before a StreamingResponse body is sent.
+
+    :param session_factory: Returns an async context manager yielding a session
+    :param user: User | None: Owner of the exported contacts, None for all contacts
+    :param export_format: ExportFormat: Encoding of the export
+    :return: An async iterator of text chunks
+    :doc-author: SergiyRus1974
+    """
+    batch_size = settings.contacts_export_batch_size
+    async with session_factory() as session:
+        contacts = repositories_contacts.stream_contacts(session, user, batch_size)
+        async for chunk in ENCODERS[export_format](contacts, batch_size):
+            yield chunk
+
+
+@router.get("/search", response_model=ContactPage)
+@contacts_cache.cached(ContactPage)
+async def search_contacts(q: str = Query(description="Part of a name, email or phone, typos allowed", min_length=3,
+                                         max_length=50),
+                          limit: int = Query(10, ge=10, le=500), offset: int = Query(0, ge=0),
+                          db: AsyncSession = Depends(get_read_db),
+                          user: User = Depends(auth_service.get_current_user)) -> Response:
+    """
+    The search_contacts function searches the contacts of the current user by first name, last name, email
+    and phone at once. A contact matches when one of them contains q, in any case, or looks like it
+    (a typo or two); the most similar contacts come first.
+
+    :param q: str: What to look for
+    :param limit: int: Limit the number of contacts returned
+    :param offset: int: Skip that many matches, the results are ranked so there is no cursor
     :param db: AsyncSession: Get the database session
     :param user: User: Get the current user
-    :return: A list of contacts with the specified last name
+    :return: A page of the matching contacts and their owner
     :doc-author: SergiyRus1974
     """
-    contacts = await repositories_contacts.get_contacts_last_name(last_name, limit, offset, db, user)
+    contacts = await repositories_contacts.search_contacts(q, limit, offset, db, user,
+                                                           settings.contacts_search_similarity, as_rows=True)
     if not contacts:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="NOT FOUND")
-    return contacts
+    return page_response({"items": contacts, "next_cursor": None}, user)
+
+
+@router.get("/export", response_class=StreamingResponse)
+async def export_contacts(export_format: ExportFormat = Query(ExportFormat.ndjson, alias="format"),
+                          session_factory=Depends(get_session_factory),
+                          user: User = Depends(auth_service.get_current_user)) -> StreamingResponse:
+    """
+    The export_contacts function streams all contacts of the current user as NDJSON or CSV.
+        Rows are read through a server-side cursor and sent in chunks, so memory use does not grow with the
+        number of contacts.
+
+    :param export_format: ExportFormat: ndjson or csv
+    :param session_factory: Open the session used while the response is streamed
+    :param user: User: Get the current user
+    :return: A streaming response with the contacts
+    :doc-author: SergiyRus1974
+    """
+    return export_response(export_chunks(session_factory, user, export_format), export_format, "contacts")
+
+
+@router.get("/all/export", response_class=StreamingResponse, dependencies=[Depends(access_to_route_all)])
+async def export_all_contacts(export_format: ExportFormat = Query(ExportFormat.ndjson, alias="format"),
+                              session_factory=Depends(get_session_factory)) -> StreamingResponse:
+    """
+    The export_all_contacts function streams the contacts of all users as NDJSON or CSV.
+        It is the streaming counterpart of get_all_contacts and is available to admins and moderators only.
+
+    :param export_format: ExportFormat: ndjson or csv
+    :param session_factory: Open the session used while the response is streamed
+    :return: A streaming response with the contacts
+    :doc-author: SergiyRus1974
+    """
+    return export_response(export_chunks(session_factory, None, export_format), export_format, "all_contacts")
+
+
+@router.get("/cache/stats", dependencies=[Depends(access_to_route_all)])
+async def get_cache_stats() -> dict:
+    """
+    The get_cache_stats function returns the hit and miss counters of the contacts response cache.
+        The counters belong to the worker process that serves the request.
+
+    :return: A dict with hits, misses and hit_ratio
+    :doc-author: SergiyRus1974
+    """
+    return contacts_cache.stats()
 
 
 @router.get("/{contact_id}", response_model=ContactResponse)
-async def get_contact(contact_id: int = Path(ge=1), db: AsyncSession = Depends(get_db),
+@contacts_cache.cached(ContactResponse)
+async def get_contact(contact_id: int = Path(ge=1), db: AsyncSession = Depends(get_read_db),
                       user: User = Depends(auth_service.get_current_user)) -> Contact:
     """
     The get_contact function is a GET request that returns the contact with the given ID.
@@ -186,6 +351,30 @@ async def create_contact(body: ContactSchema, db: AsyncSession = Depends(get_db)
     return contact
 
 
+@router.post("/bulk", response_model=ContactBulkResponse,
+             description=f'Up to {settings.contacts_bulk_max_items} contacts per request, '
+                         f'no more than 5 requests per minute',
+             dependencies=[Depends(RateLimiter(times=5, seconds=60))])
+async def create_contacts(body: list[ContactSchema] = Body(min_length=1, max_length=settings.contacts_bulk_max_items),
+                          db: AsyncSession = Depends(get_db),
+                          user: User = Depends(auth_service.get_current_user)) -> dict:
+    """
+    The create_contacts function creates many contacts in one request.
+        The whole list is validated before anything is stored, then the contacts are inserted in batches.
+        The response reports for every item whether it was created, already existed or was repeated in the request.
+
+    :param body: list[ContactSchema]: The contacts to create
+    :param db: AsyncSession: Pass the database session into the function
+    :param user: User: Get the current user from the database
+    :return: The number of created contacts and the status of every item
+    :doc-author: SergiyRus1974
+    """
+    report = await repositories_contacts.create_contacts(body, db, user, settings.contacts_bulk_batch_size)
+    items = [{"index": index, "email": contact.email, "status": status_, "id": contact_id}
+             for index, (contact, (status_, contact_id)) in enumerate(zip(body, report))]
+    return {"created": sum(item["status"] == "created" for item in items), "items": items}
+
+
 @router.put("/{contact_id}", response_model=ContactResponse)
 async def update_contact(body: ContactUpdateSchema, contact_id: int = Path(ge=1), db: AsyncSession = Depends(get_db),
                          user: User = Depends(auth_service.get_current_user)) -> Contact:
@@ -230,11 +419,14 @@ async def delete_contact(contact_id: int = Path(ge=1), db: AsyncSession = Depend
     return contact
 
 
-@router.get("/", response_model=list[ContactResponse], description='No more than 5 requests per minute',
+@router.get("/", response_model=ContactPage, description='No more than 5 requests per minute',
             dependencies=[Depends(RateLimiter(times=5, seconds=60))])
+@contacts_cache.cached(ContactPage)
 async def get_contacts(limit: int = Query(10, ge=10, le=500), offset: int = Query(0, ge=0),
-                       db: AsyncSession = Depends(get_db), user: User = Depends(auth_service.get_current_user)) -> \
-        Sequence[Contact]:
+                       cursor: str | None = Query(None, description=CURSOR_DESCRIPTION),
+                       include: Literal["user"] | None = Query(None, description=INCLUDE_DESCRIPTION),
+                       db: AsyncSession = Depends(get_read_db),
+                       user: User = Depends(auth_service.get_current_user)) -> dict | Response:
     """
     The get_contacts function returns a list of contacts.
 
@@ -243,12 +435,16 @@ async def get_contacts(limit: int = Query(10, ge=10, le=500), offset: int = Quer
     :param le: Specify the maximum value of the limit parameter
     :param offset: int: Specify the offset of the first contact to return
     :param ge: Specify a minimum value
+    :param cursor: str | None: Continue after the page that returned this cursor
+    :param include: Literal["user"] | None: Embed the owner in every contact
     :param db: AsyncSession: Get the database session
     :param user: User: Get the current user
-    :return: A list of contacts
+    :return: A page of contacts, their owner and the cursor of the next page
     :doc-author: SergiyRus1974
     """
-    contacts = await repositories_contacts.get_contacts(limit, offset, db, user)
+    after = decode_cursor(cursor, offset=offset)
+    contacts = await repositories_contacts.get_contacts(limit, offset, db, user, after_id=after and after[0],
+                                                        include_user=include == "user", as_rows=include is None)
     if not contacts:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="NOT FOUND")
-    return contacts
+    return contacts_page(build_page(contacts, limit, contact_id_key), include, owner=user)
@@ -1,4 +1,4 @@
-from typing import Optional
+from typing import Optional, Literal
 from datetime import date, datetime
 
 from pydantic import BaseModel, EmailStr, Field, ConfigDict
@@ -32,3 +32,21 @@ class ContactResponse(BaseModel):
     user: UserDb | None
 
     model_config = ConfigDict(from_attributes=True)
+
+
+class ContactPage(BaseModel):
+    items: list[ContactResponse]
+    next_cursor: str | None = None
+    owner: UserDb | None = None
+
+
+class ContactBulkItem(BaseModel):
+    index: int
+    email: EmailStr
+    status: Literal["created", "exists", "duplicate"]
+    id: int | None = None
+
+
+class ContactBulkResponse(BaseModel):
+    created: int
+    items: list[ContactBulkItem]
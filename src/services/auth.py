@@ -1,3 +1,4 @@
+import secrets
 from datetime import datetime, timedelta
 from typing import Optional
 from src.conf.config import settings
@@ -6,18 +7,51 @@ from fastapi import Depends, HTTPException, status
 from passlib.context import CryptContext
 from fastapi.security import OAuth2PasswordBearer
 from sqlalchemy.ext.asyncio import AsyncSession
-from jose import JWTError, jwt
 
-from src.database.db import get_db
+from src.database.db import get_db, read_your_writes, sessionmanager
 from src.repository import users as repositories_users
-from src.entity.models import User
+from src.entity.models import Role, User
+from src.services.revocation import revocations
+from src.services.sessions import SessionStore, get_session_store
+from src.services.token_cache import token_cache, user_from_snapshot
+from src.services.executor import BlockingPool
+from src.services.jwt_codec import TokenError, create_codec
+from src.services.timing import timed
+
+
+def create_pwd_context(scheme: str = settings.password_scheme, bcrypt_rounds: int = settings.bcrypt_rounds,
+                       argon2_time_cost: int = settings.argon2_time_cost,
+                       argon2_memory_cost: int = settings.argon2_memory_cost,
+                       argon2_parallelism: int = settings.argon2_parallelism) -> CryptContext:
+    """
+    The create_pwd_context function builds the password hashing context: new hashes use the scheme and cost of the
+        settings (PASSWORD_SCHEME bcrypt or argon2, i.e. argon2id), and a hash of the other scheme or with another
+        cost is verified as usual but needs an update, which login does.
+
+    :param scheme: str: bcrypt or argon2
+    :param bcrypt_rounds: int: log2 of the bcrypt iterations
+    :param argon2_time_cost: int: Passes of argon2 over its memory
+    :param argon2_memory_cost: int: KiB of memory argon2 fills
+    :param argon2_parallelism: int: Lanes of argon2
+    :return: The context
+    :doc-author: SergiyRus1974
+    """
+    return CryptContext(schemes=["bcrypt", "argon2"], default=scheme, deprecated="auto",
+                        bcrypt__rounds=bcrypt_rounds, bcrypt__min_rounds=bcrypt_rounds,
+                        bcrypt__max_rounds=bcrypt_rounds,
+                        argon2__type="ID", argon2__rounds=argon2_time_cost, argon2__min_rounds=argon2_time_cost,
+                        argon2__max_rounds=argon2_time_cost, argon2__memory_cost=argon2_memory_cost,
+                        argon2__parallelism=argon2_parallelism)
 
 
 class Auth:
-    pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+    pwd_context = create_pwd_context()
     SECRET_KEY = settings.secret_key
     ALGORITHM = settings.algorithm
+    codec = create_codec(settings.jwt_backend, SECRET_KEY, ALGORITHM, settings.jwt_leeway)
+    stateless = settings.stateless_tokens
     oauth2_scheme = OAuth2PasswordBearer(tokenUrl="api/auth/login")
+    hashing = BlockingPool(settings.password_hash_workers, settings.password_hash_queue, name="hashing")
 
     def verify_password(self, plain_password, hashed_password) -> bool:
         """
@@ -45,6 +79,76 @@ class Auth:
         """
         return self.pwd_context.hash(password)
 
+    async def verify_password_async(self, plain_password: str, hashed_password: str) -> bool:
+        """
+        The verify_password_async function is verify_password for async routes.
+        The bcrypt check runs in the hashing pool, so it doesn't block the event loop.
+
+        :param self: Represent the instance of the class
+        :param plain_password: str: Pass the password that is entered by the user
+        :param hashed_password: str: Verify the password
+        :return: A boolean value, true or false
+        :doc-author: SergiyRus1974
+        """
+        return await self.hashing.run(self.pwd_context.verify, plain_password, hashed_password)
+
+    async def verify_and_update_password(self, plain_password: str, hashed_password: str) -> tuple[bool, str | None]:
+        """
+        The verify_and_update_password function is verify_password_async for login: when the password matches a hash
+            of another scheme or cost than the settings, it also hashes the password again with the current ones.
+            Both run in the hashing pool, in a single job.
+
+        :param self: Represent the instance of the class
+        :param plain_password: str: Pass the password that is entered by the user
+        :param hashed_password: str: Verify the password
+        :return: Whether the password matches, and the new hash to store or None
+        :doc-author: SergiyRus1974
+        """
+        return await self.hashing.run(self.pwd_context.verify_and_update, plain_password, hashed_password)
+
+    async def get_password_hash_async(self, password: str) -> str:
+        """
+        The get_password_hash_async function is get_password_hash for async routes.
+        The hash is computed in the hashing pool, so it doesn't block the event loop.
+
+        :param self: Represent the instance of the class
+        :param password: str: Specify the password that will be hashed
+        :return: A hashed version of the password
+        :doc-author: SergiyRus1974
+        """
+        return await self.hashing.run(self.pwd_context.hash, password)
+
+    def token_data(self, user: User, session_id: str | None = None) -> tuple[dict, dict]:
+        """
+        The token_data function returns the claims of a new access and refresh token pair of a user.
+            Both tokens carry the id of the login session (see get_session_store), which goes on through refreshes.
+            With stateless tokens the access token also carries the user id, role, name and avatar,
+            as they are now: a later profile change shows up with the next refresh.
+
+        :param self: Represent the instance of the class
+        :param user: User: The user the tokens are issued to
+        :param session_id: str | None: The session being refreshed, None for a new login
+        :return: The data of the access token and of the refresh token
+        :doc-author: SergiyRus1974
+        """
+        session = {"sub": user.user_email, "sid": session_id or secrets.token_urlsafe(16)}
+        # jti tells apart refresh tokens issued in the same second, so a reused one is always detected
+        refresh_data = dict(session, jti=secrets.token_urlsafe(8))
+        if not self.stateless:
+            return session, refresh_data
+        return dict(session, uid=user.id, role=user.role.value, name=user.username, avatar=user.avatar), refresh_data
+
+    def session_id(self, token: str) -> str | None:
+        """
+        The session_id function returns the login session of a token that was already verified.
+
+        :param self: Represent the instance of the class
+        :param token: str: An access or refresh token
+        :return: The sid claim, None for a token issued before sessions
+        :doc-author: SergiyRus1974
+        """
+        return self.codec.unverified_claims(token).get("sid")
+
     # define a function to generate a new access token
     async def create_access_token(self, data: dict, expires_delta: Optional[float] = None):
         """
@@ -52,7 +156,8 @@ class Auth:
             Args:
                 data (dict): A dictionary containing the claims to be encoded in the JWT.
                 expires_delta (Optional[float]): An optional parameter specifying how long, in seconds,
-                the access token should last before expiring. If not specified, it defaults to 15 minutes.
+                the access token should last before expiring. If not specified, it defaults to ACCESS_TOKEN_EXPIRE
+                (15 minutes).
 
         :param self: Access the class attributes and methods
         :param data: dict: Pass in the data that you want to encode into your token
@@ -64,9 +169,9 @@ class Auth:
         if expires_delta:
             expire = datetime.utcnow() + timedelta(seconds=expires_delta)
         else:
-            expire = datetime.utcnow() + timedelta(minutes=15)
+            expire = datetime.utcnow() + timedelta(seconds=settings.access_token_expire)
         to_encode.update({"iat": datetime.utcnow(), "exp": expire, "scope": "access_token"})
-        encoded_access_token = jwt.encode(to_encode, self.SECRET_KEY, algorithm=self.ALGORITHM)
+        encoded_access_token = self.codec.encode(to_encode)
         return encoded_access_token
 
     async def create_refresh_token(self, data: dict, expires_delta: Optional[float] = None):
@@ -74,7 +179,7 @@ class Auth:
         The create_refresh_token function creates a refresh token for the user.
             Args:
                 data (dict): A dictionary containing the user's id and username.
-                expires_delta (Optional[float]): The number of seconds until the refresh token expires. Defaults to None, which sets it to 7 days from now.
+                expires_delta (Optional[float]): The number of seconds until the refresh token expires. Defaults to None, which sets it to REFRESH_TOKEN_EXPIRE (7 days) from now.
 
         :param self: Represent the instance of the class
         :param data: dict: Pass in the user's data, which is then encoded into a jwt
@@ -86,16 +191,16 @@ class Auth:
         if expires_delta:
             expire = datetime.utcnow() + timedelta(seconds=expires_delta)
         else:
-            expire = datetime.utcnow() + timedelta(days=7)
+            expire = datetime.utcnow() + timedelta(seconds=settings.refresh_token_expire)
         to_encode.update({"iat": datetime.utcnow(), "exp": expire, "scope": "refresh_token"})
-        encoded_refresh_token = jwt.encode(to_encode, self.SECRET_KEY, algorithm=self.ALGORITHM)
+        encoded_refresh_token = self.codec.encode(to_encode)
         return encoded_refresh_token
 
     async def decode_refresh_token(self, refresh_token: str):
         """
         The decode_refresh_token function takes a refresh token and decodes it.
             If the scope is not 'refresh_token', then an HTTPException is raised.
-            If the JWTError exception occurs, then an HTTPException is raised.
+            If the TokenError exception occurs, then an HTTPException is raised.
 
         :param self: Represent the instance of a class
         :param refresh_token: str: Pass in the refresh token that is sent from the client
@@ -103,62 +208,98 @@ class Auth:
         :doc-author: SergiyRus1974
         """
         try:
-            payload = jwt.decode(refresh_token, self.SECRET_KEY, algorithms=[self.ALGORITHM])
+            payload = self.codec.decode(refresh_token)
             print(payload['scope'])
             if payload['scope'] == 'refresh_token':
                 email = payload.get("sub")
                 return email
             raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail='Invalid scope for token')
-        except JWTError:
+        except TokenError:
             raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail='Could not validate credentials')
 
-    async def get_current_user(self, token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)):
+    async def get_current_user(self, token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db),
+                               sessions: SessionStore = Depends(get_session_store)):
         """
         The get_current_user function is a dependency that will be used in the
             protected endpoints. It takes a token as an argument and returns the user
             associated with that token. If no user is found, it raises an exception.
+            Tokens that were verified before are served from token_cache: no JWT decode and no SELECT,
+            the cached user snapshot (see TokenCache.fields) is merged into the session instead. Otherwise the user is read from
+            a replica (unless they wrote in the last seconds) and merged into the session the same way.
+            With stateless tokens (STATELESS_TOKENS) the user is built from the claims of the token instead,
+            detached and with the UserDb fields only, as they were when the token was issued (up to
+            settings.access_token_expire seconds old); the token must not be revoked (see revocations).
+            Otherwise the login session of the token must still be active (not logged out).
+            The time it takes is reported as auth in the Server-Timing header.
 
         :param self: Access the class attributes
         :param token: str: Pass the token that is sent in the authorization header
         :param db: AsyncSession: Create a database session
+        :param sessions: SessionStore: The store of the login sessions
         :return: The user object associated with the email in the jwt payload
         :doc-author: SergiyRus1974
         """
-        credentials_exception = HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Could not validate credentials",
-            headers={"WWW-Authenticate": "Bearer"},
-        )
+        with timed("auth"):
+            if not self.stateless:
+                cached = token_cache.get(token)
+                if cached is not None:
+                    payload, snapshot = cached
+                    return await db.merge(user_from_snapshot(snapshot), load=False)
 
-        try:
-            # Decode JWT
-            payload = jwt.decode(token, self.SECRET_KEY, algorithms=[self.ALGORITHM])
-            if payload['scope'] == 'access_token':
-                email = payload.get("sub")
+            credentials_exception = HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Could not validate credentials",
+                headers={"WWW-Authenticate": "Bearer"},
+            )
+
+            try:
+                # Decode JWT
+                payload = self.codec.decode(token)
+                if payload['scope'] == 'access_token':
+                    email = payload.get("sub")
+                    if email is None:
+                        raise credentials_exception
+                else:
+                    raise credentials_exception
+
+                email = payload["sub"]
                 if email is None:
                     raise credentials_exception
-            else:
+            except TokenError as e:
                 raise credentials_exception
 
-            email = payload["sub"]
-            if email is None:
+            # tokens issued before stateless tokens were turned on carry no user claims and are checked as before
+            if self.stateless and "uid" in payload:
+                if revocations.is_revoked(payload):
+                    raise credentials_exception
+                return user_from_snapshot({"id": payload["uid"], "user_email": email, "role": Role(payload["role"]),
+                                           "username": payload["name"], "avatar": payload["avatar"]})
+
+            session_id = payload.get("sid")
+            if session_id is not None and not await sessions.is_active(session_id):
                 raise credentials_exception
-        except JWTError as e:
-            raise credentials_exception
 
-        user = await repositories_users.get_user_by_email(email, db)
-        if user is None:
-            raise credentials_exception
+            if sessionmanager.has_replicas and not await read_your_writes.is_sticky(email):
+                async with sessionmanager.read_session() as read_db:
+                    user = await repositories_users.get_user_by_email(email, read_db)
+                if user is not None:
+                    user = await db.merge(user, load=False)
+            else:
+                user = await repositories_users.get_user_by_email(email, db)
+            if user is None:
+                raise credentials_exception
 
-        if user.refresh_token is None:
-            raise credentials_exception
-        return user
+            # a token issued before sessions: its user must not have logged out since
+            if session_id is None and user.refresh_token is None:
+                raise credentials_exception
+            token_cache.set(token, payload, user)
+            return user
 
     async def create_email_token(self, data: dict):
         """
         The create_email_token function takes in a dictionary of data and returns a token.
         The function creates an expiration date for the token, adds it to the dictionary,
-        and then encodes it using jwt.
+        and then encodes it using the JWT codec.
 
         :param self: Represent the instance of the class
         :param data: dict: Create the token
@@ -168,7 +309,7 @@ class Auth:
         to_encode = data.copy()
         expire = datetime.utcnow() + timedelta(days=7)
         to_encode.update({"iat": datetime.utcnow(), "exp": expire})
-        token = jwt.encode(to_encode, self.SECRET_KEY, algorithm=self.ALGORITHM)
+        token = self.codec.encode(to_encode)
         return token
 
     async def get_email_from_token(self, token: str):
@@ -183,13 +324,27 @@ class Auth:
         :doc-author: SergiyRus1974
         """
         try:
-            payload = jwt.decode(token, self.SECRET_KEY, algorithms=[self.ALGORITHM])
+            payload = self.codec.decode(token)
             email = payload["sub"]
             return email
-        except JWTError as e:
+        except TokenError as e:
             print(e)
             raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
                                 detail="Invalid token for email verification")
 
 
 auth_service = Auth()
+
+
+async def get_read_db(user: User = Depends(auth_service.get_current_user)):
+    """
+    The get_read_db function is the database dependency of the read-only routes of a user.
+        It yields a session on a read replica, or on the primary when there are no healthy replicas or the user
+        wrote less than DB_STICKY_SECONDS ago (so the user reads their own writes).
+
+    :param user: User: The current user
+    :return: A session object
+    :doc-author: SergiyRus1974
+    """
+    async with sessionmanager.read_session(primary=await read_your_writes.is_sticky(user.user_email)) as session:
+        yield session
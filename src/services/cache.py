@@ -0,0 +1,252 @@
+from datetime import date
+from functools import wraps
+from typing import Any, Callable
+
+from fastapi_cache import FastAPICache
+from fastapi_cache.backends.inmemory import InMemoryBackend
+from fastapi_cache.backends.redis import RedisBackend
+from fastapi_cache.coder import Coder
+from fastapi_cache.decorator import cache
+from pydantic import BaseModel
+from starlette.requests import Request
+from starlette.responses import Response
+
+from src.services.serialization import JSONBytesResponse
+
+VERSION_KEY = "contacts-cache:version:{}"
+ALL_USERS = "all"
+# the Response parameter fastapi-cache adds to a cached route to set the cache headers on
+CACHE_RESPONSE_PARAM = "__fastapi_cache_response"
+
+
+class CacheStatsMixin:
+    hits: int = 0
+    misses: int = 0
+
+    async def get_with_ttl(self, key: str) -> tuple[int, Any]:
+        """
+        The get_with_ttl function reads a cached response and counts it as a hit or a miss.
+
+        :param self: Represent the instance of the class
+        :param key: str: The cache key built by ContactsCache.key_builder
+        :return: The remaining ttl and the cached value, or None on a miss
+        :doc-author: SergiyRus1974
+        """
+        ttl, value = await super().get_with_ttl(key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return ttl, value
+
+
+class RedisCacheBackend(CacheStatsMixin, RedisBackend):
+    async def incr_versions(self, *scopes: int | str) -> None:
+        """
+        The incr_versions function bumps the version counters of the given scopes in one round trip.
+
+        :param self: Represent the instance of the class
+        :param scopes: int | str: User ids and/or ALL_USERS
+        :return: None
+        :doc-author: SergiyRus1974
+        """
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for scope in scopes:
+                pipe.incr(VERSION_KEY.format(scope))
+            await pipe.execute()
+
+    async def get_version(self, scope: int | str) -> int:
+        """
+        The get_version function returns the current version counter of a scope.
+
+        :param self: Represent the instance of the class
+        :param scope: int | str: A user id or ALL_USERS
+        :return: The version, 0 if the scope was never written to
+        :doc-author: SergiyRus1974
+        """
+        return int(await self.redis.get(VERSION_KEY.format(scope)) or 0)
+
+
+class InMemoryCacheBackend(CacheStatsMixin, InMemoryBackend):
+    def __init__(self):
+        """
+        The __init__ function gives every instance its own store (InMemoryBackend shares one between instances).
+        It is meant for a single process: tests and local development without Redis.
+
+        :param self: Represent the instance of the class
+        :return: None
+        :doc-author: SergiyRus1974
+        """
+        self._store = {}
+        self._versions: dict[int | str, int] = {}
+
+    async def incr_versions(self, *scopes: int | str) -> None:
+        """
+        The incr_versions function bumps the version counters of the given scopes.
+
+        :param self: Represent the instance of the class
+        :param scopes: int | str: User ids and/or ALL_USERS
+        :return: None
+        :doc-author: SergiyRus1974
+        """
+        for scope in scopes:
+            self._versions[scope] = self._versions.get(scope, 0) + 1
+
+    async def get_version(self, scope: int | str) -> int:
+        """
+        The get_version function returns the current version counter of a scope.
+
+        :param self: Represent the instance of the class
+        :param scope: int | str: A user id or ALL_USERS
+        :return: The version, 0 if the scope was never written to
+        :doc-author: SergiyRus1974
+        """
+        return self._versions.get(scope, 0)
+
+
+def model_coder(model: type[BaseModel]) -> type[Coder]:
+    """
+    The model_coder function returns a cache coder that stores a route result as the JSON of its response model.
+        Route results are ORM objects, which the default JsonCoder cannot encode, or a JSON response already
+        written by the route, which is stored as it is. A cached entry was produced from the response model,
+        so a hit is returned as JSON bytes without being validated again.
+
+    :param model: type[BaseModel]: The response_model of the route
+    :return: A Coder class
+    :doc-author: SergiyRus1974
+    """
+
+    class ModelCoder(Coder):
+        @classmethod
+        def encode(cls, value: Any) -> bytes:
+            if isinstance(value, Response):
+                return bytes(value.body)
+            return model.model_validate(value, from_attributes=True).model_dump_json().encode()
+
+        @classmethod
+        def decode(cls, value: bytes | str) -> Any:
+            return JSONBytesResponse(value)
+
+    return ModelCoder
+
+
+class ContactsCache:
+    namespace = "contacts"
+
+    def __init__(self):
+        """
+        The __init__ function creates a cache that stays disabled until init is called on startup.
+
+        :param self: Represent the instance of the class
+        :return: None
+        :doc-author: SergiyRus1974
+        """
+        self.backend: RedisCacheBackend | InMemoryCacheBackend | None = None
+
+    def init(self, backend: RedisCacheBackend | InMemoryCacheBackend, expire: int) -> None:
+        """
+        The init function enables the response cache of the contact read routes.
+        Like FastAPICache.init, only the first call takes effect.
+
+        :param self: Represent the instance of the class
+        :param backend: RedisCacheBackend | InMemoryCacheBackend: Where responses and versions are kept
+        :param expire: int: Lifetime of a cached response in seconds
+        :return: None
+        :doc-author: SergiyRus1974
+        """
+        if self.backend is None:
+            self.backend = backend
+            FastAPICache.init(backend, prefix="fastapi-cache", expire=expire)
+
+    async def bump(self, user_id: int) -> None:
+        """
+        The bump function invalidates every cached read of a user (and of the all-users listings) in O(1):
+            cache keys contain the version counter, so after the increment the old entries are never read again
+            and simply expire.
+
+        :param self: Represent the instance of the class
+        :param user_id: int: The owner of the contacts that were written
+        :return: None
+        :doc-author: SergiyRus1974
+        """
+        if self.backend is not None:
+            await self.backend.incr_versions(user_id, ALL_USERS)
+
+    async def clear(self) -> None:
+        """
+        The clear function drops all cached responses.
+
+        :param self: Represent the instance of the class
+        :return: None
+        :doc-author: SergiyRus1974
+        """
+        if self.backend is not None:
+            await FastAPICache.clear(self.namespace)
+
+    def stats(self) -> dict:
+        """
+        The stats function returns the hit and miss counters of this process.
+
+        :param self: Represent the instance of the class
+        :return: A dict with hits, misses and hit_ratio
+        :doc-author: SergiyRus1974
+        """
+        hits = self.backend.hits if self.backend else 0
+        misses = self.backend.misses if self.backend else 0
+        return {"hits": hits, "misses": misses, "hit_ratio": hits / (hits + misses) if hits + misses else 0.0}
+
+    def key_builder(self, all_users: bool) -> Callable:
+        """
+        The key_builder function returns the fastapi-cache key builder of a route.
+            The key is (user or ALL_USERS, version, route, query params, day); the day is part of the key because
+            the birthday window moves every day.
+
+        :param self: Represent the instance of the class
+        :param all_users: bool: The route lists the contacts of all users
+        :return: An async key builder
+        :doc-author: SergiyRus1974
+        """
+
+        async def build_key(func: Callable, namespace: str = "", *, request: Request = None, response=None,
+                            args: tuple = (), kwargs: dict = None) -> str:
+            scope = ALL_USERS if all_users else kwargs["user"].id
+            version = await self.backend.get_version(scope)
+            params = sorted(request.query_params.multi_items()) if request else []
+            path_params = sorted(request.path_params.items()) if request else []
+            return f"{namespace}:{scope}:v{version}:{func.__name__}:{path_params}:{params}:{date.today()}"
+
+        return build_key
+
+    def cached(self, model: type[BaseModel], all_users: bool = False) -> Callable:
+        """
+        The cached function decorates a contact read route with the versioned response cache.
+
+        :param self: Represent the instance of the class
+        :param model: type[BaseModel]: The response_model of the route
+        :param all_users: bool: The route lists the contacts of all users
+        :return: A route decorator
+        :doc-author: SergiyRus1974
+        """
+        decorator = cache(coder=model_coder(model), key_builder=self.key_builder(all_users), namespace=self.namespace)
+
+        def wrapper(func: Callable) -> Callable:
+            cached_func = decorator(func)
+
+            @wraps(cached_func)
+            async def inner(*args, **kwargs):
+                # FastAPI ignores the headers fastapi-cache sets on its Response parameter when the route returns
+                # a response of its own, so they are copied over
+                response = kwargs.get(CACHE_RESPONSE_PARAM)
+                result = await cached_func(*args, **kwargs)
+                if isinstance(result, Response) and response is not None and result is not response:
+                    for name, value in response.headers.items():
+                        if name != "content-length":
+                            result.headers[name] = value
+                return result
+
+            return inner
+
+        return wrapper
+
+
+contacts_cache = ContactsCache()
@@ -1,28 +1,166 @@
-from pathlib import Path
-from src.conf.config import settings
+import asyncio
+import contextlib
+import time
+from collections import deque
+from email.message import EmailMessage
+from email.utils import formataddr, formatdate, make_msgid
 
-from fastapi_mail import FastMail, MessageSchema, ConnectionConfig, MessageType
-from fastapi_mail.errors import ConnectionErrors
+import aiosmtplib
+from fastapi_mail import ConnectionConfig
 from pydantic import EmailStr
 
+from src.conf.config import settings
 from src.services.auth import auth_service
+from src.services.mail_templates import mail_templates
 
 conf = ConnectionConfig(
     MAIL_USERNAME=settings.mail_username,
     MAIL_PASSWORD=settings.mail_password,
     MAIL_FROM=settings.mail_from,
     MAIL_PORT=settings.mail_port,
-    MAIL_SERVER="smtp.meta.ua",
+    MAIL_SERVER=settings.mail_server,
     MAIL_FROM_NAME=settings.mail_from,
     MAIL_STARTTLS=False,
     MAIL_SSL_TLS=True,
     USE_CREDENTIALS=True,
     VALIDATE_CERTS=True,
-    TEMPLATE_FOLDER=Path(__file__).parent / 'templates',
 )
 
 
-async def send_email(email: EmailStr, username: str, host: str):
+class SMTPPool:
+    def __init__(self, config: ConnectionConfig, size: int, idle_timeout: float):
+        """
+        The __init__ function is called when the class is instantiated.
+        The pool keeps up to size authenticated SMTP connections open and sends messages over them back to back,
+        so a message does not pay the TCP + TLS + AUTH handshake. Connections are opened on first use.
+
+        :param self: Represent the instance of the class
+        :param config: ConnectionConfig: SMTP server and credentials
+        :param size: int: How many connections may be open (and messages sent) at the same time
+        :param idle_timeout: float: Seconds after which an unused connection is closed instead of reused
+        :return: The instance of the class
+        :doc-author: SergiyRus1974
+        """
+        self.config = config
+        self.size = size
+        self.idle_timeout = idle_timeout
+        self.connects = 0
+        self._idle: deque[tuple[aiosmtplib.SMTP, float]] = deque()
+        self._semaphore = asyncio.Semaphore(size)
+
+    async def _connect(self) -> aiosmtplib.SMTP:
+        """
+        The _connect function opens and authenticates a new SMTP connection.
+
+        :param self: Represent the instance of the class
+        :return: A connected SMTP client
+        :doc-author: SergiyRus1974
+        """
+        smtp = aiosmtplib.SMTP(hostname=self.config.MAIL_SERVER, port=self.config.MAIL_PORT,
+                               use_tls=self.config.MAIL_SSL_TLS, start_tls=self.config.MAIL_STARTTLS,
+                               validate_certs=self.config.VALIDATE_CERTS, timeout=self.config.TIMEOUT)
+        await smtp.connect()
+        if self.config.USE_CREDENTIALS:
+            await smtp.login(self.config.MAIL_USERNAME, self.config.MAIL_PASSWORD)
+        self.connects += 1
+        return smtp
+
+    async def _checkout(self) -> aiosmtplib.SMTP:
+        """
+        The _checkout function takes the most recently used open connection, or opens a new one.
+            Connections that were idle too long or were dropped by the server are closed on the way.
+
+        :param self: Represent the instance of the class
+        :return: A connected SMTP client
+        :doc-author: SergiyRus1974
+        """
+        now = time.monotonic()
+        while self._idle and now - self._idle[0][1] >= self.idle_timeout:
+            self._idle.popleft()[0].close()
+        while self._idle:
+            smtp, _ = self._idle.pop()
+            if smtp.is_connected:
+                return smtp
+            smtp.close()
+        return await self._connect()
+
+    async def send(self, message: EmailMessage) -> None:
+        """
+        The send function sends a message over a pooled connection.
+            When the server has closed the connection since it was last used, the message is sent once more
+            over a new connection. A connection that failed otherwise is not put back into the pool.
+
+        :param self: Represent the instance of the class
+        :param message: EmailMessage: The message to send
+        :return: None
+        :doc-author: SergiyRus1974
+        """
+        if self.config.SUPPRESS_SEND:
+            return
+        async with self._semaphore:
+            smtp = await self._checkout()
+            try:
+                try:
+                    await smtp.send_message(message)
+                except aiosmtplib.SMTPServerDisconnected:
+                    smtp.close()
+                    smtp = await self._connect()
+                    await smtp.send_message(message)
+            except BaseException:
+                smtp.close()
+                raise
+            self._idle.append((smtp, time.monotonic()))
+
+    async def close(self) -> None:
+        """
+        The close function says goodbye to the server on every idle connection.
+
+        :param self: Represent the instance of the class
+        :return: None
+        :doc-author: SergiyRus1974
+        """
+        while self._idle:
+            smtp, _ = self._idle.pop()
+            with contextlib.suppress(aiosmtplib.SMTPException, OSError):
+                await smtp.quit()
+            smtp.close()
+
+
+def create_smtp_pool() -> SMTPPool:
+    """
+    The create_smtp_pool function builds the pool of the process that sends the emails, on its startup;
+        it is closed on its shutdown (see mail_worker.py).
+
+    :return: The SMTP pool configured by MAIL_POOL_SIZE and MAIL_IDLE_TIMEOUT
+    :doc-author: SergiyRus1974
+    """
+    return SMTPPool(conf, settings.mail_pool_size, settings.mail_idle_timeout)
+
+
+def build_message(subject: str, recipient: EmailStr, template_name: str, template_body: dict,
+                  config: ConnectionConfig = conf) -> EmailMessage:
+    """
+    The build_message function renders a compiled html template into a message ready to be sent.
+
+    :param subject: str: Subject of the message
+    :param recipient: EmailStr: The address the message is sent to
+    :param template_name: str: File name of a template compiled by mail_templates
+    :param template_body: dict: Variables passed to the template
+    :param config: ConnectionConfig: Gives the sender address
+    :return: The message
+    :doc-author: SergiyRus1974
+    """
+    message = EmailMessage()
+    message["Subject"] = subject
+    message["From"] = formataddr((config.MAIL_FROM_NAME, config.MAIL_FROM))
+    message["To"] = recipient
+    message["Date"] = formatdate(localtime=True)
+    message["Message-ID"] = make_msgid()
+    message.set_content(mail_templates.render(template_name, template_body), subtype="html")
+    return message
+
+
+async def send_email(email: EmailStr, username: str, host: str, smtp_pool: SMTPPool):
     """
     The send_email function sends an email to the user with a link to confirm their email address.
         The function takes in three parameters:
@@ -33,26 +171,17 @@ async def send_email(email: EmailStr, username: str, host: str):
     :param email: EmailStr: Specify the email address of the recipient
     :param username: str: Pass the username to the template
     :param host: str: Pass the host name to the template
-    :return: A coroutine, which is an object that represents a function that returns a future
+    :param smtp_pool: SMTPPool: The pool the email is sent over
+    :return: None; SMTP and connection errors are raised, so the mail worker can retry
     :doc-author: SergiyRus1974
     """
-    try:
-        token_verification = await auth_service.create_email_token({"sub": email})
-
-        message = MessageSchema(
-            subject="Confirm your email ",
-            recipients=[email],
-            template_body={"host": host, "username": username, "token": token_verification},
-            subtype=MessageType.html
-        )
-
-        fm = FastMail(conf)
-        await fm.send_message(message, template_name="email_template.html")
-    except ConnectionErrors as err:
-        print(err)
+    token_verification = await auth_service.create_email_token({"sub": email})
+    message = build_message("Confirm your email ", email, "email_template.html",
+                            {"host": host, "username": username, "token": token_verification})
+    await smtp_pool.send(message)
 
 
-async def send_email_reset_password(email: EmailStr, username: str, host: str):
+async def send_email_reset_password(email: EmailStr, username: str, host: str, smtp_pool: SMTPPool):
     """
     The send_email_reset_password function sends an email to the user with a link to reset their password.
         Args:
@@ -63,20 +192,11 @@ async def send_email_reset_password(email: EmailStr, username: str, host: str):
     :param email: EmailStr: Specify the email address of the user
     :param username: str: Pass the username to the template
     :param host: str: Create the link for the user to reset their password
-    :return: A coroutine object
+    :param smtp_pool: SMTPPool: The pool the email is sent over
+    :return: None; SMTP and connection errors are raised, so the mail worker can retry
     :doc-author: SergiyRus1974
     """
-    try:
-        token_verification = await auth_service.create_email_token({"sub": email})
-
-        message = MessageSchema(
-            subject="Reset password ",
-            recipients=[email],
-            template_body={"host": host, "username": username, "token": token_verification},
-            subtype=MessageType.html
-        )
-
-        fm = FastMail(conf)
-        await fm.send_message(message, template_name="password_template.html")
-    except ConnectionErrors as err:
-        print(err)
+    token_verification = await auth_service.create_email_token({"sub": email})
+    message = build_message("Reset password ", email, "password_template.html",
+                            {"host": host, "username": username, "token": token_verification})
+    await smtp_pool.send(message)
@@ -0,0 +1,69 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, TypeVar
+
+from fastapi import HTTPException, status
+
+from src.conf import messages
+from src.services.metrics import POOL_PENDING, POOL_REJECTED
+
+T = TypeVar("T")
+
+
+class BlockingPool:
+    def __init__(self, workers: int, queue_size: int, name: str = "blocking"):
+        """
+        The __init__ function is called when the class is instantiated.
+        It creates a bounded thread pool for blocking calls (password hashing, avatar uploads). bcrypt and socket
+        I/O release the GIL, so the event loop keeps serving other requests while the calls run in parallel.
+
+        :param self: Represent the instance of the class
+        :param workers: int: How many calls may run at the same time; 0 runs them inline on the event loop
+        :param queue_size: int: How many more calls may wait for a free worker before new ones are rejected
+        :param name: str: Prefix of the worker thread names and label of the pool in the metrics
+        :return: The instance of the class
+        :doc-author: SergiyRus1974
+        """
+        self.workers = workers
+        self.queue_size = queue_size
+        self.pending = 0
+        self._pending_gauge = POOL_PENDING.labels(name)
+        self._rejected = POOL_REJECTED.labels(name)
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=name) if workers > 0 else None
+
+    async def run(self, func: Callable[..., T], *args) -> T:
+        """
+        The run function calls func in the pool and waits for the result without blocking the event loop.
+        When all workers are busy and the queue is full it raises 503 with Retry-After instead of queueing more.
+        The calls in the pool and the rejections are in the metrics, labelled with the name of the pool.
+
+        :param self: Represent the instance of the class
+        :param func: Callable[..., T]: A blocking function, e.g. CryptContext.verify
+        :param args: Arguments for func
+        :return: What func returns
+        :doc-author: SergiyRus1974
+        """
+        if self._executor is None:
+            return func(*args)
+        if self.pending >= self.workers + self.queue_size:
+            self._rejected.inc()
+            raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=messages.SERVER_BUSY,
+                                headers={"Retry-After": "1"})
+        self.pending += 1
+        self._pending_gauge.inc()
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+        finally:
+            self.pending -= 1
+            self._pending_gauge.dec()
+
+    def shutdown(self) -> None:
+        """
+        The shutdown function stops the worker threads once the calls already submitted are done.
+
+        :param self: Represent the instance of the class
+        :return: None
+        :doc-author: SergiyRus1974
+        """
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
@@ -0,0 +1,99 @@
+import csv
+import enum
+import io
+import json
+from datetime import date
+from typing import AsyncIterator, Callable
+
+from fastapi.responses import StreamingResponse
+
+from src.entity.models import Contact
+
+EXPORT_FIELDS = ("id", "first_name", "last_name", "email", "phone", "birth_date", "friend_status", "created_at",
+                 "updated_at", "user_id")
+
+
+class ExportFormat(str, enum.Enum):
+    ndjson: str = "ndjson"
+    csv: str = "csv"
+
+
+MEDIA_TYPES = {ExportFormat.ndjson: "application/x-ndjson", ExportFormat.csv: "text/csv"}
+
+
+def _json_default(value):
+    """
+    The _json_default function encodes the values json does not know about (dates and datetimes).
+
+    :param value: A value of a contact field
+    :return: The value in ISO 8601 format
+    :doc-author: SergiyRus1974
+    """
+    if isinstance(value, date):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+async def encode_ndjson(contacts: AsyncIterator[Contact], chunk_rows: int = 1000) -> AsyncIterator[str]:
+    """
+    The encode_ndjson function encodes contacts as newline-delimited JSON, one object per line.
+        Lines are sent in chunks of chunk_rows contacts, so only one chunk is held in memory.
+
+    :param contacts: AsyncIterator[Contact]: The contacts to encode
+    :param chunk_rows: int: Number of contacts per yielded chunk
+    :return: An async iterator of text chunks
+    :doc-author: SergiyRus1974
+    """
+    lines = []
+    async for contact in contacts:
+        lines.append(json.dumps({field: getattr(contact, field) for field in EXPORT_FIELDS}, default=_json_default))
+        if len(lines) >= chunk_rows:
+            yield "\n".join(lines) + "\n"
+            lines.clear()
+    if lines:
+        yield "\n".join(lines) + "\n"
+
+
+async def encode_csv(contacts: AsyncIterator[Contact], chunk_rows: int = 1000) -> AsyncIterator[str]:
+    """
+    The encode_csv function encodes contacts as CSV with a header row.
+        Rows are sent in chunks of chunk_rows contacts, so only one chunk is held in memory.
+
+    :param contacts: AsyncIterator[Contact]: The contacts to encode
+    :param chunk_rows: int: Number of contacts per yielded chunk
+    :return: An async iterator of text chunks
+    :doc-author: SergiyRus1974
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_FIELDS)
+    rows = 0
+    async for contact in contacts:
+        writer.writerow([getattr(contact, field) for field in EXPORT_FIELDS])
+        rows += 1
+        if rows >= chunk_rows:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+            rows = 0
+    yield buffer.getvalue()
+
+
+ENCODERS: dict[ExportFormat, Callable[[AsyncIterator[Contact], int], AsyncIterator[str]]] = {
+    ExportFormat.ndjson: encode_ndjson,
+    ExportFormat.csv: encode_csv,
+}
+
+
+def export_response(chunks: AsyncIterator[str], export_format: ExportFormat, filename: str) -> StreamingResponse:
+    """
+    The export_response function wraps encoded chunks into a downloadable StreamingResponse.
+
+    :param chunks: AsyncIterator[str]: The encoded export
+    :param export_format: ExportFormat: The format the chunks are encoded in
+    :param filename: str: File name without extension offered to the client
+    :return: A StreamingResponse
+    :doc-author: SergiyRus1974
+    """
+    return StreamingResponse(chunks, media_type=MEDIA_TYPES[export_format],
+                             headers={"Content-Disposition": f'attachment; filename="{filename}.{export_format.value}"'})
@@ -0,0 +1,341 @@
+"""
+Codecs of the JWTs issued by the application: python-jose, or HS256/384/512 signed and verified with hmac directly.
+
+Both write the same bytes for the same claims (compact JSON, header {"alg": ..., "typ": "JWT"}) and check the
+same registered claims on decode, so tokens issued by one are accepted by the other.
+"""
+import base64
+import hashlib
+import hmac
+import json
+from abc import ABC, abstractmethod
+from calendar import timegm
+from datetime import datetime, timezone
+
+import orjson
+from jose import JWTError, jwk, jwt
+
+HMAC_DIGESTS = {"HS256": hashlib.sha256, "HS384": hashlib.sha384, "HS512": hashlib.sha512}
+
+
+class TokenError(Exception):
+    pass
+
+
+def numeric_dates(claims: dict) -> dict:
+    """
+    The numeric_dates function writes the datetimes of the exp, iat and nbf claims as seconds since the epoch,
+        as python-jose does.
+
+    :param claims: dict: The claims to encode
+    :return: A copy of the claims
+    :doc-author: SergiyRus1974
+    """
+    claims = dict(claims)
+    for claim in ("exp", "iat", "nbf"):
+        if isinstance(claims.get(claim), datetime):
+            claims[claim] = timegm(claims[claim].utctimetuple())
+    return claims
+
+
+class JWTCodec(ABC):
+    def __init__(self, key: str, algorithm: str, leeway: int = 0):
+        """
+        The __init__ function is called when the class is instantiated.
+        The key is prepared here once, not on every token.
+
+        :param self: Represent the instance of the class
+        :param key: str: The secret key (SECRET_KEY)
+        :param algorithm: str: The signing algorithm (ALGORITHM)
+        :param leeway: int: Seconds of clock skew allowed when checking exp and nbf (JWT_LEEWAY)
+        :return: The instance of the class
+        :doc-author: SergiyRus1974
+        """
+        self.algorithm = algorithm
+        self.leeway = leeway
+
+    @abstractmethod
+    def encode(self, claims: dict) -> str:
+        """
+        The encode function signs the claims into a token.
+
+        :param self: Represent the instance of the class
+        :param claims: dict: The claims; datetimes in exp, iat and nbf are allowed
+        :return: The token
+        :doc-author: SergiyRus1974
+        """
+
+    @abstractmethod
+    def decode(self, token: str) -> dict:
+        """
+        The decode function verifies the signature of a token and its exp, nbf, iat, sub, jti and aud claims.
+
+        :param self: Represent the instance of the class
+        :param token: str: The token
+        :return: The claims
+        :raises TokenError: If the token is malformed, forged, expired or has an invalid claim
+        :doc-author: SergiyRus1974
+        """
+
+    @abstractmethod
+    def unverified_claims(self, token: str) -> dict:
+        """
+        The unverified_claims function reads the claims of a token without verifying it.
+
+        :param self: Represent the instance of the class
+        :param token: str: A token that was verified before
+        :return: The claims
+        :raises TokenError: If the token is malformed
+        :doc-author: SergiyRus1974
+        """
+
+
+class JoseCodec(JWTCodec):
+    def __init__(self, key: str, algorithm: str, leeway: int = 0):
+        """
+        The __init__ function is called when the class is instantiated.
+        python-jose accepts a constructed key in place of the secret and then skips building it on every call.
+
+        :param self: Represent the instance of the class
+        :param key: str: The secret key (SECRET_KEY)
+        :param algorithm: str: The signing algorithm (ALGORITHM)
+        :param leeway: int: Seconds of clock skew allowed when checking exp and nbf (JWT_LEEWAY)
+        :return: The instance of the class
+        :doc-author: SergiyRus1974
+        """
+        super().__init__(key, algorithm, leeway)
+        self.key = jwk.construct(key, algorithm)
+        self.algorithms = [algorithm]
+        self.options = {"leeway": leeway}
+
+    def encode(self, claims: dict) -> str:
+        """
+        The encode function signs the claims into a token with python-jose.
+
+        :param self: Represent the instance of the class
+        :param claims: dict: The claims; datetimes in exp, iat and nbf are allowed
+        :return: The token
+        :doc-author: SergiyRus1974
+        """
+        return jwt.encode(claims, self.key, algorithm=self.algorithm)
+
+    def decode(self, token: str) -> dict:
+        """
+        The decode function verifies a token with python-jose.
+
+        :param self: Represent the instance of the class
+        :param token: str: The token
+        :return: The claims
+        :raises TokenError: If the token is malformed, forged, expired or has an invalid claim
+        :doc-author: SergiyRus1974
+        """
+        try:
+            return jwt.decode(token, self.key, algorithms=self.algorithms, options=self.options)
+        except JWTError as err:
+            raise TokenError(str(err)) from err
+
+    def unverified_claims(self, token: str) -> dict:
+        """
+        The unverified_claims function reads the claims of a token with python-jose, without verifying it.
+
+        :param self: Represent the instance of the class
+        :param token: str: A token that was verified before
+        :return: The claims
+        :raises TokenError: If the token is malformed
+        :doc-author: SergiyRus1974
+        """
+        try:
+            return jwt.get_unverified_claims(token)
+        except JWTError as err:
+            raise TokenError(str(err)) from err
+
+
+class HMACCodec(JWTCodec):
+    def __init__(self, key: str, algorithm: str, leeway: int = 0):
+        """
+        The __init__ function is called when the class is instantiated.
+        The header is encoded once and the HMAC is keyed once: every token copies it and only hashes its own bytes.
+
+        :param self: Represent the instance of the class
+        :param key: str: The secret key (SECRET_KEY)
+        :param algorithm: str: HS256, HS384 or HS512 (ALGORITHM)
+        :param leeway: int: Seconds of clock skew allowed when checking exp and nbf (JWT_LEEWAY)
+        :return: The instance of the class
+        :doc-author: SergiyRus1974
+        """
+        super().__init__(key, algorithm, leeway)
+        if algorithm not in HMAC_DIGESTS:
+            raise ValueError(f"HMACCodec signs with {', '.join(HMAC_DIGESTS)}, not {algorithm}")
+        self.mac = hmac.new(key.encode(), digestmod=HMAC_DIGESTS[algorithm])
+        self.header = self.b64encode(json.dumps({"alg": algorithm, "typ": "JWT"}, separators=(",", ":"),
+                                                sort_keys=True).encode())
+
+    @staticmethod
+    def b64encode(data: bytes) -> bytes:
+        """
+        The b64encode function encodes bytes as base64url without padding.
+
+        :param data: bytes: The bytes
+        :return: The encoded bytes
+        :doc-author: SergiyRus1974
+        """
+        return base64.urlsafe_b64encode(data).rstrip(b"=")
+
+    @staticmethod
+    def b64decode(data: bytes) -> bytes:
+        """
+        The b64decode function decodes base64url without padding.
+
+        :param data: bytes: The encoded bytes
+        :return: The bytes
+        :raises TokenError: If the data is not base64url
+        :doc-author: SergiyRus1974
+        """
+        try:
+            return base64.urlsafe_b64decode(data + b"=" * (-len(data) % 4))
+        except ValueError as err:
+            raise TokenError("Invalid base64 segment") from err
+
+    def sign(self, signing_input: bytes) -> bytes:
+        """
+        The sign function computes the signature of the header and claims segments.
+
+        :param self: Represent the instance of the class
+        :param signing_input: bytes: header.claims
+        :return: The signature
+        :doc-author: SergiyRus1974
+        """
+        mac = self.mac.copy()
+        mac.update(signing_input)
+        return mac.digest()
+
+    def encode(self, claims: dict) -> str:
+        """
+        The encode function signs the claims into a token; the claims are written with json like python-jose does,
+            so the tokens are byte for byte the same.
+
+        :param self: Represent the instance of the class
+        :param claims: dict: The claims; datetimes in exp, iat and nbf are allowed
+        :return: The token
+        :doc-author: SergiyRus1974
+        """
+        payload = self.b64encode(json.dumps(numeric_dates(claims), separators=(",", ":")).encode())
+        signing_input = self.header + b"." + payload
+        return (signing_input + b"." + self.b64encode(self.sign(signing_input))).decode()
+
+    def split(self, token: str) -> tuple[bytes, bytes, bytes]:
+        """
+        The split function splits a token into its header, claims and signature segments.
+
+        :param self: Represent the instance of the class
+        :param token: str: The token
+        :return: The three segments
+        :raises TokenError: If the token has no three segments
+        :doc-author: SergiyRus1974
+        """
+        segments = token.encode().split(b".")
+        if len(segments) != 3:
+            raise TokenError("Not enough segments")
+        return segments[0], segments[1], segments[2]
+
+    def claims(self, payload: bytes) -> dict:
+        """
+        The claims function reads the claims segment.
+
+        :param self: Represent the instance of the class
+        :param payload: bytes: The claims segment
+        :return: The claims
+        :raises TokenError: If the segment is not a JSON object
+        :doc-author: SergiyRus1974
+        """
+        try:
+            claims = orjson.loads(self.b64decode(payload))
+        except orjson.JSONDecodeError as err:
+            raise TokenError("Invalid payload string") from err
+        if not isinstance(claims, dict):
+            raise TokenError("Invalid payload string: must be a json object")
+        return claims
+
+    def decode(self, token: str) -> dict:
+        """
+        The decode function verifies the signature in constant time, then the claims as python-jose does.
+            The header must name the algorithm of the codec.
+
+        :param self: Represent the instance of the class
+        :param token: str: The token
+        :return: The claims
+        :raises TokenError: If the token is malformed, forged, expired or has an invalid claim
+        :doc-author: SergiyRus1974
+        """
+        header, payload, signature = self.split(token)
+        if header != self.header:
+            try:
+                algorithm = orjson.loads(self.b64decode(header)).get("alg")
+            except (orjson.JSONDecodeError, AttributeError) as err:
+                raise TokenError("Error decoding token headers") from err
+            if algorithm != self.algorithm:
+                raise TokenError("The specified alg value is not allowed")
+        if not hmac.compare_digest(self.sign(header + b"." + payload), self.b64decode(signature)):
+            raise TokenError("Signature verification failed")
+        claims = self.claims(payload)
+        self.validate(claims)
+        return claims
+
+    def validate(self, claims: dict) -> None:
+        """
+        The validate function checks the registered claims: exp and nbf against the clock (with the leeway),
+            iat, sub and jti for their types. The application sets no audience, so a token with one is rejected.
+
+        :param self: Represent the instance of the class
+        :param claims: dict: The claims of a token with a valid signature
+        :return: None
+        :raises TokenError: If a claim is invalid
+        :doc-author: SergiyRus1974
+        """
+        try:
+            dates = {claim: int(claims[claim]) for claim in ("exp", "iat", "nbf") if claim in claims}
+        except (TypeError, ValueError) as err:
+            raise TokenError("Time claims must be integers") from err
+        now = timegm(datetime.now(timezone.utc).utctimetuple())
+        if "nbf" in dates and dates["nbf"] > now + self.leeway:
+            raise TokenError("The token is not yet valid (nbf)")
+        if "exp" in dates and dates["exp"] < now - self.leeway:
+            raise TokenError("Signature has expired.")
+        if "aud" in claims:
+            raise TokenError("Invalid audience")
+        if not isinstance(claims.get("sub", ""), str):
+            raise TokenError("Subject must be a string.")
+        if not isinstance(claims.get("jti", ""), str):
+            raise TokenError("JWT ID must be a string.")
+
+    def unverified_claims(self, token: str) -> dict:
+        """
+        The unverified_claims function reads the claims of a token without verifying it.
+
+        :param self: Represent the instance of the class
+        :param token: str: A token that was verified before
+        :return: The claims
+        :raises TokenError: If the token is malformed
+        :doc-author: SergiyRus1974
+        """
+        return self.claims(self.split(token)[1])
+
+
+CODECS = {"jose": JoseCodec, "hmac": HMACCodec}
+
+
+def create_codec(backend: str, key: str, algorithm: str, leeway: int = 0) -> JWTCodec:
+    """
+    The create_codec function builds the codec selected by JWT_BACKEND.
+        hmac only signs with HS256/384/512; with another ALGORITHM python-jose is used.
+
+    :param backend: str: jose or hmac
+    :param key: str: The secret key (SECRET_KEY)
+    :param algorithm: str: The signing algorithm (ALGORITHM)
+    :param leeway: int: Seconds of clock skew allowed when checking exp and nbf (JWT_LEEWAY)
+    :return: The codec
+    :doc-author: SergiyRus1974
+    """
+    if backend == "hmac" and algorithm not in HMAC_DIGESTS:
+        backend = "jose"
+    return CODECS[backend](key, algorithm, leeway)
@@ -0,0 +1,239 @@
+import math
+import secrets
+import time
+from collections import deque
+from typing import AsyncIterator
+
+from fastapi import Depends, HTTPException, Request, status
+from fastapi.security import OAuth2PasswordRequestForm
+from redis.exceptions import RedisError
+
+from src.conf import messages
+from src.conf.config import settings
+from src.database.db import db_redis
+from src.services.metrics import LOGIN_ADMISSIONS, InstrumentedRedis
+
+# Sliding-window log of failed logins: every key is a sorted set of the failures of the last window, scored by
+# their time in ms, taken from the clock of Redis so all workers share one window.
+# CHECK returns {1, 0, 0} when the attempt may go on, {0, retry after ms, index of the first key over its limit}
+# when it is rejected; RECORD adds a failure under all keys.
+CHECK = """
+local now = redis.call('TIME')
+local now_ms = tonumber(now[1]) * 1000 + math.floor(tonumber(now[2]) / 1000)
+local window = tonumber(ARGV[1])
+local retry, rejected = 0, 0
+for i, key in ipairs(KEYS) do
+    redis.call('ZREMRANGEBYSCORE', key, '-inf', now_ms - window)
+    if redis.call('ZCARD', key) >= tonumber(ARGV[i + 1]) then
+        local oldest = redis.call('ZRANGE', key, 0, 0, 'WITHSCORES')
+        retry = math.max(retry, tonumber(oldest[2]) + window - now_ms, 1)
+        if rejected == 0 then
+            rejected = i
+        end
+    end
+end
+if rejected > 0 then
+    return {0, retry, rejected}
+end
+return {1, 0, 0}
+"""
+
+RECORD = """
+local now = redis.call('TIME')
+local now_ms = tonumber(now[1]) * 1000 + math.floor(tonumber(now[2]) / 1000)
+for i, key in ipairs(KEYS) do
+    redis.call('ZADD', key, now_ms, ARGV[2])
+    redis.call('PEXPIRE', key, ARGV[1])
+end
+return 1
+"""
+
+# a limiter without Redis drops the windows of idle keys once it holds this many
+LOCAL_KEYS_SWEEP = 20000
+
+
+class LoginLimiter:
+    account_key = "login-attempts:account:{}"
+    ip_key = "login-attempts:ip:{}"
+    reasons = ("account", "ip")
+
+    def __init__(self, redis: InstrumentedRedis | None, window: int, per_account: int, per_ip: int):
+        """
+        The __init__ function is called when the class is instantiated.
+        It limits the failed logins of an account and of a client address over a sliding window. An attempt over
+        a limit is rejected before any password is checked, so an attacker can't make the server run bcrypt faster
+        than the limits allow; successful logins are not counted, so the owner of an account can't be locked out
+        by logging in, and a successful login forgets the failures of its account.
+
+        :param self: Represent the instance of the class
+        :param redis: InstrumentedRedis | None: Where the windows are kept, None for this process only
+        :param window: int: Length of the window in seconds (LOGIN_RATE_WINDOW)
+        :param per_account: int: Failed logins per account in a window (LOGIN_RATE_PER_ACCOUNT)
+        :param per_ip: int: Failed logins per client address in a window (LOGIN_RATE_PER_IP)
+        :return: The instance of the class
+        :doc-author: SergiyRus1974
+        """
+        self.redis = redis
+        self.window = window
+        self.limits = (per_account, per_ip)
+        self._check = redis.register_script(CHECK) if redis is not None else None
+        self._record = redis.register_script(RECORD) if redis is not None else None
+        self._windows: dict[str, deque[float]] = {}
+
+    async def __call__(self, request: Request,
+                       body: OAuth2PasswordRequestForm = Depends()) -> AsyncIterator[None]:
+        """
+        The __call__ function is the dependency of the login route: it admits the attempt or rejects it with 429,
+            then records the attempt as failed if the route answered 401, or clears the failures of the account if
+            the login succeeded. Attempts running at the same time are all checked before their failures are
+            recorded, so a limit may be passed by as many attempts as run at once; the hashing pool bounds them.
+            The client address is the one uvicorn reports; behind a proxy run it with --proxy-headers and
+            --forwarded-allow-ips, so X-Forwarded-For is taken from the proxy only and can't be forged.
+
+        :param self: Represent the instance of the class
+        :param request: Request: The login request
+        :param body: OAuth2PasswordRequestForm: The login form, shared with the route
+        :return: An async iterator, FastAPI runs the route at its yield
+        :doc-author: SergiyRus1974
+        """
+        account, ip = body.username, request.client.host if request.client else "unknown"
+        await self.admit(account, ip)
+        try:
+            yield
+        except HTTPException as err:
+            if err.status_code == status.HTTP_401_UNAUTHORIZED:
+                await self.record_failure(account, ip)
+            raise
+        await self.clear_account(account)
+
+    def _keys(self, account: str, ip: str) -> list[str]:
+        """
+        The _keys function returns the keys of the windows of an account and of a client address.
+
+        :param self: Represent the instance of the class
+        :param account: str: The username sent, an email
+        :param ip: str: The client address
+        :return: The account key and the address key
+        :doc-author: SergiyRus1974
+        """
+        return [self.account_key.format(account.strip().lower()), self.ip_key.format(ip)]
+
+    async def admit(self, account: str, ip: str) -> None:
+        """
+        The admit function lets a login attempt go on if the account and the address are both under their limits.
+            If Redis is unreachable the attempt is admitted: the hashing pool still bounds the bcrypt work.
+
+        :param self: Represent the instance of the class
+        :param account: str: The username sent, an email
+        :param ip: str: The client address
+        :return: None
+        :raises HTTPException: 429 with Retry-After when a limit is reached
+        :doc-author: SergiyRus1974
+        """
+        keys = self._keys(account, ip)
+        if self.redis is None:
+            admitted, retry_ms, rejected = self._check_local(keys)
+        else:
+            try:
+                admitted, retry_ms, rejected = await self._check(keys=keys, args=[self.window * 1000, *self.limits])
+            except (RedisError, OSError) as err:
+                print(err)
+                admitted, retry_ms, rejected = 1, 0, 0
+        if admitted:
+            LOGIN_ADMISSIONS.labels("admitted").inc()
+            return
+        LOGIN_ADMISSIONS.labels(self.reasons[rejected - 1]).inc()
+        raise HTTPException(status_code=status.HTTP_429_TOO_MANY_REQUESTS, detail=messages.TOO_MANY_LOGINS,
+                            headers={"Retry-After": str(math.ceil(retry_ms / 1000))})
+
+    async def record_failure(self, account: str, ip: str) -> None:
+        """
+        The record_failure function counts a failed login against the account and the address.
+
+        :param self: Represent the instance of the class
+        :param account: str: The username sent, an email
+        :param ip: str: The client address
+        :return: None
+        :doc-author: SergiyRus1974
+        """
+        keys = self._keys(account, ip)
+        if self.redis is None:
+            self._record_local(keys)
+            return
+        try:
+            await self._record(keys=keys, args=[self.window * 1000, secrets.token_hex(8)])
+        except (RedisError, OSError) as err:
+            print(err)
+
+    async def clear_account(self, account: str) -> None:
+        """
+        The clear_account function forgets the failed logins of an account, after it logged in.
+            The failures of the address are kept.
+
+        :param self: Represent the instance of the class
+        :param account: str: The username sent, an email
+        :return: None
+        :doc-author: SergiyRus1974
+        """
+        key = self.account_key.format(account.strip().lower())
+        if self.redis is None:
+            self._windows.pop(key, None)
+            return
+        try:
+            await self.redis.delete(key)
+        except (RedisError, OSError) as err:
+            print(err)
+
+    def _check_local(self, keys: list[str]) -> tuple[int, int, int]:
+        """
+        The _check_local function is the CHECK script for a limiter without Redis.
+
+        :param self: Represent the instance of the class
+        :param keys: list[str]: The account key and the address key
+        :return: Admitted, retry after ms and index of the first key over its limit, as the script returns them
+        :doc-author: SergiyRus1974
+        """
+        now = time.monotonic()
+        retry, rejected = 0.0, 0
+        for index, key in enumerate(keys, start=1):
+            failures = self._windows.get(key)
+            if failures is None:
+                continue
+            while failures and failures[0] <= now - self.window:
+                failures.popleft()
+            if len(failures) >= self.limits[index - 1]:
+                retry = max(retry, failures[0] + self.window - now, 0.001)
+                rejected = rejected or index
+        if rejected:
+            return 0, math.ceil(retry * 1000), rejected
+        return 1, 0, 0
+
+    def _record_local(self, keys: list[str]) -> None:
+        """
+        The _record_local function is the RECORD script for a limiter without Redis.
+
+        :param self: Represent the instance of the class
+        :param keys: list[str]: The account key and the address key
+        :return: None
+        :doc-author: SergiyRus1974
+        """
+        now = time.monotonic()
+        for key in keys:
+            self._windows.setdefault(key, deque()).append(now)
+        if len(self._windows) > LOCAL_KEYS_SWEEP:
+            self._windows = {key: failures for key, failures in self._windows.items()
+                             if failures and failures[-1] > now - self.window}
+
+    def clear(self) -> None:
+        """
+        The clear function forgets the failures kept in this process.
+
+        :param self: Represent the instance of the class
+        :return: None
+        :doc-author: SergiyRus1974
+        """
+        self._windows.clear()
+
+
+login_limiter = LoginLimiter(db_redis, settings.login_rate_window, settings.login_rate_per_account,
+                             settings.login_rate_per_ip)
@@ -0,0 +1,90 @@
+from pathlib import Path
+from typing import AsyncIterator, Iterable
+
+from jinja2 import Environment, FileSystemLoader, Template, select_autoescape
+
+from src.conf.config import settings
+from src.services.executor import BlockingPool
+
+TEMPLATE_FOLDER = Path(__file__).parent / 'templates'
+TEMPLATES = ("email_template.html", "password_template.html")
+
+
+class MailTemplates:
+    def __init__(self, folder: Path, names: Iterable[str], pool: BlockingPool):
+        """
+        The __init__ function loads and compiles the templates once. Rendering afterwards neither touches the
+        template folder nor checks the files for changes, so a changed template takes effect after a restart.
+        Values are html-escaped, e.g. a username with markup in it.
+
+        :param self: Represent the instance of the class
+        :param folder: Path: Where the templates are
+        :param names: Iterable[str]: File names of the templates to compile
+        :param pool: BlockingPool: Renders the batches off the event loop
+        :return: The instance of the class
+        :doc-author: SergiyRus1974
+        """
+        env = Environment(loader=FileSystemLoader(folder), autoescape=select_autoescape(["html"]), auto_reload=False)
+        self.templates: dict[str, Template] = {name: env.get_template(name) for name in names}
+        self.pool = pool
+
+    def render(self, name: str, context: dict) -> str:
+        """
+        The render function renders one template. It takes microseconds, so it is called inline.
+
+        :param self: Represent the instance of the class
+        :param name: str: File name of a compiled template
+        :param context: dict: Variables passed to the template
+        :return: The rendered html
+        :doc-author: SergiyRus1974
+        """
+        return self.templates[name].render(context)
+
+    def render_many(self, name: str, contexts: Iterable[dict]) -> list[str]:
+        """
+        The render_many function renders one template for every context.
+
+        :param self: Represent the instance of the class
+        :param name: str: File name of a compiled template
+        :param contexts: Iterable[dict]: Variables of every render
+        :return: The rendered html, in the order of contexts
+        :doc-author: SergiyRus1974
+        """
+        render = self.templates[name].render
+        return [render(context) for context in contexts]
+
+    async def render_batches(self, name: str, contexts: Iterable[dict], batch_size: int) -> AsyncIterator[list[str]]:
+        """
+        The render_batches function renders a mass send (e.g. a re-confirmation of all users) batch by batch
+            in the pool, so the event loop is not blocked and only one batch of html is held in memory.
+
+        :param self: Represent the instance of the class
+        :param name: str: File name of a compiled template
+        :param contexts: Iterable[dict]: Variables of every render, consumed lazily
+        :param batch_size: int: How many renders are done per call in the pool
+        :return: An async iterator of lists of rendered html, in the order of contexts
+        :doc-author: SergiyRus1974
+        """
+        batch = []
+        for context in contexts:
+            batch.append(context)
+            if len(batch) >= batch_size:
+                yield await self.pool.run(self.render_many, name, batch)
+                batch = []
+        if batch:
+            yield await self.pool.run(self.render_many, name, batch)
+
+    def shutdown(self) -> None:
+        """
+        The shutdown function lets the batches in progress finish.
+
+        :param self: Represent the instance of the class
+        :return: None
+        :doc-author: SergiyRus1974
+        """
+        self.pool.shutdown()
+
+
+mail_templates = MailTemplates(TEMPLATE_FOLDER, TEMPLATES,
+                               BlockingPool(settings.mail_render_workers, settings.mail_render_queue,
+                                            name="mail-render"))
@@ -0,0 +1,267 @@
+"""
+Prometheus metrics of the application, served by GET /metrics.
+
+With several worker processes (uvicorn --workers N) set PROMETHEUS_MULTIPROC_DIR to an empty directory before
+the server starts: every process then writes its metrics there and /metrics, whichever process serves it,
+reports the sum over all of them.
+"""
+import os
+import secrets
+import time
+from typing import Awaitable, Callable
+
+import redis.asyncio as redis_async
+from fastapi import Depends, HTTPException, status
+from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
+from fastapi_limiter import http_default_callback
+from prometheus_client import (CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram,
+                               generate_latest, multiprocess)
+from prometheus_client.core import GaugeMetricFamily
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from starlette.requests import Request
+from starlette.responses import Response
+
+MULTIPROCESS = "PROMETHEUS_MULTIPROC_DIR" in os.environ
+
+REQUESTS = Counter("http_requests_total", "HTTP requests by route template and status code",
+                   ["method", "route", "status"])
+REQUEST_LATENCY = Histogram("http_request_duration_seconds", "Time to serve a request, body included",
+                            ["method", "route"],
+                            buckets=(.005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10))
+DB_POOL_CHECKED_OUT = Gauge("db_pool_checked_out", "Database connections in use", ["pool"],
+                            multiprocess_mode="livesum")
+DB_POOL_OVERFLOW = Gauge("db_pool_overflow", "Database connections open beyond the pool size", ["pool"],
+                         multiprocess_mode="livesum")
+DB_POOL_CHECKOUT = Histogram("db_pool_checkout_seconds",
+                             "Time to get a database connection: waiting for a free one, or connecting",
+                             buckets=(.0005, .001, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10, 30))
+REDIS_LATENCY = Histogram("redis_command_duration_seconds", "Redis command round trip", ["command"],
+                          buckets=(.0002, .0005, .001, .0025, .005, .01, .025, .05, .1, .25, 1))
+RATE_LIMITED = Counter("rate_limit_rejections_total", "Requests rejected with 429 by the rate limiter", ["route"])
+LOGIN_ADMISSIONS = Counter("login_admissions_total",
+                           "Login attempts by admission: admitted, or rejected with 429 for the account or the ip",
+                           ["decision"])
+POOL_PENDING = Gauge("blocking_pool_pending", "Calls running or queued in a blocking pool", ["pool"],
+                     multiprocess_mode="livesum")
+POOL_REJECTED = Counter("blocking_pool_rejections_total", "Calls rejected with 503 because a blocking pool was full",
+                        ["pool"])
+
+
+def route_template(scope: dict) -> str:
+    """
+    The route_template function returns the path template of the route that served a request,
+        e.g. /api/contacts/{contact_id}, so the metrics have one series per route instead of one per url.
+
+    :param scope: dict: The ASGI scope, after routing
+    :return: The template, or unmatched when no route matched
+    :doc-author: SergiyRus1974
+    """
+    route = scope.get("route")
+    return route.path if route is not None else "unmatched"
+
+
+def observe_request(method: str, route: str, status: int, seconds: float) -> None:
+    """
+    The observe_request function counts a served request and its latency.
+
+    :param method: str: HTTP method
+    :param route: str: The route template
+    :param status: int: Status code of the response
+    :param seconds: float: Time to serve the request
+    :return: None
+    :doc-author: SergiyRus1974
+    """
+    REQUESTS.labels(method, route, str(status)).inc()
+    REQUEST_LATENCY.labels(method, route).observe(seconds)
+
+
+class InstrumentedQueuePool(AsyncAdaptedQueuePool):
+    def _do_get(self):
+        """
+        The _do_get function hands out a connection and records how long that took.
+
+        :param self: Represent the instance of the class
+        :return: A pooled connection
+        :doc-author: SergiyRus1974
+        """
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            DB_POOL_CHECKOUT.observe(time.perf_counter() - started)
+
+
+def instrument_pool(engine: AsyncEngine, name: str) -> None:
+    """
+    The instrument_pool function keeps the pool gauges up to date on every checkout and checkin.
+
+    :param engine: AsyncEngine: An engine created with poolclass=InstrumentedQueuePool
+    :param name: str: Label of the pool in the gauges (primary, replica0, ...)
+    :return: None
+    :doc-author: SergiyRus1974
+    """
+    checked_out = DB_POOL_CHECKED_OUT.labels(name)
+    overflow = DB_POOL_OVERFLOW.labels(name)
+
+    def update(*args):
+        # engine.dispose() replaces the pool (keeping its listeners), so it is looked up every time
+        pool = engine.sync_engine.pool
+        checked_out.set(pool.checkedout())
+        overflow.set(max(pool.overflow(), 0))
+
+    event.listen(engine.sync_engine.pool, "checkout", update)
+    event.listen(engine.sync_engine.pool, "checkin", update)
+
+
+class InstrumentedRedis(redis_async.Redis):
+    async def execute_command(self, *args, **options):
+        """
+        The execute_command function runs a Redis command and records its round trip by command name.
+
+        :param self: Represent the instance of the class
+        :param args: The command and its arguments
+        :param options: Options of the command
+        :return: The reply
+        :doc-author: SergiyRus1974
+        """
+        started = time.perf_counter()
+        try:
+            return await super().execute_command(*args, **options)
+        finally:
+            REDIS_LATENCY.labels(str(args[0]).upper()).observe(time.perf_counter() - started)
+
+
+async def rate_limit_callback(request: Request, response: Response, pexpire: int):
+    """
+    The rate_limit_callback function counts a rejected request and rejects it as fastapi-limiter does by default.
+
+    :param request: Request: The rejected request
+    :param response: Response: The response being built
+    :param pexpire: int: Milliseconds until the limit resets
+    :return: None, it raises 429
+    :doc-author: SergiyRus1974
+    """
+    RATE_LIMITED.labels(route_template(request.scope)).inc()
+    return await http_default_callback(request, response, pexpire)
+
+
+class OutboxCollector:
+    def __init__(self, counts: dict[str, int]):
+        """
+        The __init__ function is called when the class is instantiated.
+
+        :param self: Represent the instance of the class
+        :param counts: dict[str, int]: Emails in the outbox by status
+        :return: The instance of the class
+        :doc-author: SergiyRus1974
+        """
+        self.counts = counts
+
+    def collect(self):
+        """
+        The collect function reports the outbox depth as a gauge.
+
+        :param self: Represent the instance of the class
+        :return: The metric families
+        :doc-author: SergiyRus1974
+        """
+        depth = GaugeMetricFamily("email_outbox_emails", "Emails in the outbox by status", labels=["status"])
+        for status, count in self.counts.items():
+            depth.add_metric([status], count)
+        yield depth
+
+
+class ScrapeAuth:
+    def __init__(self, token: str):
+        """
+        The __init__ function is called when the class is instantiated.
+        It protects GET /metrics with a bearer token, the one the Prometheus scrape job sends
+        (authorization: credentials in its config).
+
+        :param self: Represent the instance of the class
+        :param token: str: The token (METRICS_TOKEN); empty turns /metrics off
+        :return: The instance of the class
+        :doc-author: SergiyRus1974
+        """
+        self.token = token
+
+    async def __call__(self, credentials: HTTPAuthorizationCredentials | None = Depends(
+            HTTPBearer(auto_error=False))) -> None:
+        """
+        The __call__ function is the dependency of GET /metrics: it lets the scrape through when it sends the token.
+
+        :param self: Represent the instance of the class
+        :param credentials: HTTPAuthorizationCredentials | None: The bearer token of the request
+        :return: None
+        :raises HTTPException: 404 when /metrics is off, 401 without the right token
+        :doc-author: SergiyRus1974
+        """
+        if not self.token:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not Found")
+        if credentials is None or not secrets.compare_digest(credentials.credentials.encode(), self.token.encode()):
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Could not validate credentials",
+                                headers={"WWW-Authenticate": "Bearer"})
+
+
+class OutboxCounts:
+    def __init__(self, ttl: float):
+        """
+        The __init__ function is called when the class is instantiated.
+        It keeps the outbox depth between scrapes, so scraping every worker often does not count the outbox
+        every time.
+
+        :param self: Represent the instance of the class
+        :param ttl: float: Seconds the counts are reused (METRICS_OUTBOX_CACHE)
+        :return: The instance of the class
+        :doc-author: SergiyRus1974
+        """
+        self.ttl = ttl
+        self._counts: dict[str, int] | None = None
+        self._expires_at = 0.0
+
+    async def get(self, count: Callable[[], Awaitable[dict[str, int]]]) -> dict[str, int]:
+        """
+        The get function returns the cached counts, or counts the outbox again once they are ttl seconds old.
+
+        :param self: Represent the instance of the class
+        :param count: Callable[[], Awaitable[dict[str, int]]]: Counts the emails in the outbox by status
+        :return: Emails in the outbox by status
+        :doc-author: SergiyRus1974
+        """
+        now = time.monotonic()
+        if self._counts is None or now >= self._expires_at:
+            self._counts = await count()
+            self._expires_at = now + self.ttl
+        return self._counts
+
+
+def latest(outbox_counts: dict[str, int]) -> bytes:
+    """
+    The latest function renders all metrics in the Prometheus text format, summed over the worker processes
+        in multiprocess mode. The outbox depth is a database count, see OutboxCounts.
+
+    :param outbox_counts: dict[str, int]: Emails in the outbox by status
+    :return: The metrics
+    :doc-author: SergiyRus1974
+    """
+    if MULTIPROCESS:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    scrape = CollectorRegistry()
+    scrape.register(OutboxCollector(outbox_counts))
+    return generate_latest(registry) + generate_latest(scrape)
+
+
+def mark_process_dead() -> None:
+    """
+    The mark_process_dead function drops the gauges of this process from the sums on shutdown.
+
+    :return: None
+    :doc-author: SergiyRus1974
+    """
+    if MULTIPROCESS:
+        multiprocess.mark_process_dead(os.getpid())
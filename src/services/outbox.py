@@ -0,0 +1,131 @@
+import asyncio
+import contextlib
+from typing import Awaitable, Callable
+
+import aiosmtplib
+from sqlalchemy.exc import SQLAlchemyError
+
+from src.entity.models import EmailKind, EmailOutbox
+from src.repository import outbox as repository_outbox
+from src.services.email import SMTPPool, send_email, send_email_reset_password
+
+SENDERS: dict[EmailKind, Callable[[str, str, str, SMTPPool], Awaitable[None]]] = {
+    EmailKind.confirm_email: send_email,
+    EmailKind.reset_password: send_email_reset_password,
+}
+
+
+def is_permanent(err: Exception) -> bool:
+    """
+    The is_permanent function tells whether sending an email again can not succeed:
+        the server answered with a 5xx code, for the message or for every recipient.
+
+    :param err: Exception: The error raised while sending
+    :return: True if the email should not be retried
+    :doc-author: SergiyRus1974
+    """
+    if isinstance(err, aiosmtplib.SMTPRecipientsRefused):
+        return all(refused.code >= 500 for refused in err.recipients)
+    return isinstance(err, aiosmtplib.SMTPResponseException) and err.code >= 500
+
+
+class MailOutboxWorker:
+    def __init__(self, session_factory: Callable, smtp_pool: SMTPPool, batch_size: int, concurrency: int,
+                 max_attempts: int, backoff: float, backoff_max: float, lease: float, poll_interval: float):
+        """
+        The __init__ function is called when the class is instantiated.
+        The worker sends the emails queued in the outbox by the web application (see mail_worker.py).
+
+        :param self: Represent the instance of the class
+        :param session_factory: Callable: Returns an async context manager that yields a database session
+        :param smtp_pool: SMTPPool: The pool the emails are sent over
+        :param batch_size: int: How many emails are claimed at a time
+        :param concurrency: int: How many emails of a batch are sent at the same time
+        :param max_attempts: int: After how many failed attempts an email is moved to the dead letters
+        :param backoff: float: Seconds before the first retry; the delay doubles with every attempt
+        :param backoff_max: float: Upper bound of the delay between retries
+        :param lease: float: Seconds a claimed batch may take before other workers pick it up again
+        :param poll_interval: float: Seconds to wait when the outbox has no due emails
+        :return: The instance of the class
+        :doc-author: SergiyRus1974
+        """
+        self.session_factory = session_factory
+        self.smtp_pool = smtp_pool
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+        self.lease = lease
+        self.poll_interval = poll_interval
+        self._semaphore = asyncio.Semaphore(concurrency)
+
+    def retry_delay(self, attempts: int) -> float:
+        """
+        The retry_delay function returns the exponential backoff after the given number of attempts.
+
+        :param self: Represent the instance of the class
+        :param attempts: int: Attempts made so far, at least 1
+        :return: Seconds until the next attempt
+        :doc-author: SergiyRus1974
+        """
+        return min(self.backoff * 2 ** (attempts - 1), self.backoff_max)
+
+    async def deliver(self, outbox_email: EmailOutbox) -> Exception | None:
+        """
+        The deliver function sends one email, waiting for a free slot when concurrency emails are being sent.
+
+        :param self: Represent the instance of the class
+        :param outbox_email: EmailOutbox: A claimed email
+        :return: None if the email was sent, otherwise the error
+        :doc-author: SergiyRus1974
+        """
+        async with self._semaphore:
+            try:
+                await SENDERS[outbox_email.kind](outbox_email.recipient, outbox_email.username, outbox_email.host,
+                                                 self.smtp_pool)
+            except Exception as err:
+                return err
+        return None
+
+    async def run_once(self) -> int:
+        """
+        The run_once function claims a batch of due emails, sends them and records the results in one commit.
+
+        :param self: Represent the instance of the class
+        :return: The number of emails claimed
+        :doc-author: SergiyRus1974
+        """
+        async with self.session_factory() as db:
+            emails = await repository_outbox.claim_emails(self.batch_size, self.lease, db)
+            if not emails:
+                return 0
+            errors = await asyncio.gather(*(self.deliver(outbox_email) for outbox_email in emails))
+            for outbox_email, err in zip(emails, errors):
+                if err is None:
+                    await repository_outbox.mark_sent(outbox_email, db)
+                    continue
+                give_up = is_permanent(err) or outbox_email.attempts >= self.max_attempts
+                retry_in = None if give_up else self.retry_delay(outbox_email.attempts)
+                await repository_outbox.mark_failed(outbox_email, f"{type(err).__name__}: {err}", retry_in, db)
+            await db.commit()
+        return len(emails)
+
+    async def run(self, stop: asyncio.Event) -> None:
+        """
+        The run function drains the outbox until stop is set. Full batches are followed by the next one right away;
+            otherwise the worker waits poll_interval seconds. A batch in progress is finished before returning.
+
+        :param self: Represent the instance of the class
+        :param stop: asyncio.Event: Set to stop the worker
+        :return: None
+        :doc-author: SergiyRus1974
+        """
+        while not stop.is_set():
+            try:
+                claimed = await self.run_once()
+            except (SQLAlchemyError, OSError) as err:
+                print(err)
+                claimed = 0
+            if claimed < self.batch_size:
+                with contextlib.suppress(asyncio.TimeoutError):
+                    await asyncio.wait_for(stop.wait(), self.poll_interval)
@@ -0,0 +1,64 @@
+import base64
+import json
+from typing import Callable, Sequence, TypeVar
+
+from fastapi import HTTPException, status
+
+T = TypeVar("T")
+
+# the sort keys are made of INTEGER columns (and the birthday key, which is far inside their range)
+INT_MIN, INT_MAX = -2 ** 31, 2 ** 31 - 1
+
+
+def encode_cursor(key: Sequence[int]) -> str:
+    """
+    The encode_cursor function turns the sort key of the last row of a page into an opaque cursor string.
+
+    :param key: Sequence[int]: Values of the sort key of the last row, in sort order
+    :return: A url-safe cursor string
+    :doc-author: SergiyRus1974
+    """
+    raw = json.dumps(list(key), separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str | None, size: int = 1, offset: int = 0) -> tuple[int, ...] | None:
+    """
+    The decode_cursor function turns a cursor received from the client back into a sort key.
+        A malformed or foreign cursor, or one with values out of the range of the columns, is rejected with 400
+        instead of silently starting from the first page. A cursor can't be combined with an offset: the offset
+        would skip rows after the cursor.
+
+    :param cursor: str | None: The cursor from the query string
+    :param size: int: How many values the sort key of this listing has
+    :param offset: int: The offset from the query string
+    :return: The sort key as a tuple, or None when no cursor was given
+    :doc-author: SergiyRus1974
+    """
+    if cursor is None:
+        return None
+    if offset:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Use either cursor or offset")
+    try:
+        key = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except ValueError:
+        key = None
+    if not isinstance(key, list) or len(key) != size or not all(
+            type(value) is int and INT_MIN <= value <= INT_MAX for value in key):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+    return tuple(key)
+
+
+def build_page(items: Sequence[T], limit: int, key: Callable[[T], Sequence[int]]) -> dict:
+    """
+    The build_page function wraps one page of results together with the cursor of the next page.
+        A short page means the end of the listing, so next_cursor is None then.
+
+    :param items: Sequence[T]: Rows of the current page
+    :param limit: int: Page size that was requested
+    :param key: Callable[[T], Sequence[int]]: Returns the sort key of a row
+    :return: A dict with items and next_cursor
+    :doc-author: SergiyRus1974
+    """
+    next_cursor = encode_cursor(key(items[-1])) if items and len(items) >= limit else None
+    return {"items": items, "next_cursor": next_cursor}
@@ -0,0 +1,200 @@
+import asyncio
+import time
+
+from redis.exceptions import RedisError
+
+from src.conf.config import settings
+from src.database.db import db_redis
+from src.services.metrics import InstrumentedRedis
+
+
+class RevocationList:
+    channel = "token-revocations"
+    session_key = "revoked-session:{}"
+    user_key = "revoked-user:{}"
+
+    def __init__(self, redis: InstrumentedRedis | None, ttl: float, enabled: bool):
+        """
+        The __init__ function is called when the class is instantiated.
+        It sets up an empty list of revoked stateless access tokens.
+        Revocations are kept in Redis for new worker processes and published to the running ones, which keep
+        them in memory: checking a token costs no round trip.
+
+        :param self: Represent the instance of the class
+        :param redis: InstrumentedRedis | None: Where revocations are shared, None for this process only
+        :param ttl: float: Lifetime of an access token; a revocation is dropped once the tokens it covers expired
+        :param enabled: bool: Stateless access tokens are on (STATELESS_TOKENS); otherwise revoking is a no-op
+        :return: The instance of the class
+        :doc-author: SergiyRus1974
+        """
+        self.redis = redis
+        self.ttl = ttl
+        self.enabled = enabled
+        self._sessions: dict[str, float] = {}
+        self._users: dict[int, tuple[int, float]] = {}
+        self._listener: asyncio.Task | None = None
+
+    def is_revoked(self, claims: dict) -> bool:
+        """
+        The is_revoked function checks a verified stateless access token against the revocations.
+            A token is revoked when its session was logged out, or when it was issued before its user's
+            sessions were revoked (password change). iat has whole seconds, so revocations are kept in whole
+            seconds too, and a token issued in the same second as the revocation is rejected: an old token must
+            never get through. A login in that very second gets a token that is refused once; the client logs in
+            (or refreshes) again.
+
+        :param self: Represent the instance of the class
+        :param claims: dict: Claims of the token, with uid, sid and iat
+        :return: True if the token must be rejected
+        :doc-author: SergiyRus1974
+        """
+        now = time.time()
+        expires_at = self._sessions.get(claims["sid"])
+        if expires_at is not None and expires_at > now:
+            return True
+        revoked = self._users.get(claims["uid"])
+        return revoked is not None and revoked[1] > now and claims["iat"] <= revoked[0]
+
+    async def revoke_session(self, session_id: str) -> None:
+        """
+        The revoke_session function revokes every access token of one login session (logout).
+
+        :param self: Represent the instance of the class
+        :param session_id: str: The sid claim of the session
+        :return: None
+        :doc-author: SergiyRus1974
+        """
+        if self.enabled:
+            self._apply(f"session:{session_id}")
+            await self._share(self.session_key.format(session_id), "1", f"session:{session_id}")
+
+    async def revoke_user(self, user_id: int) -> None:
+        """
+        The revoke_user function revokes every access token issued to a user until now (password change).
+
+        :param self: Represent the instance of the class
+        :param user_id: int: The uid claim of the user
+        :return: None
+        :doc-author: SergiyRus1974
+        """
+        if self.enabled:
+            revoked_at = int(time.time())
+            self._apply(f"user:{user_id}:{revoked_at}")
+            await self._share(self.user_key.format(user_id), str(revoked_at), f"user:{user_id}:{revoked_at}")
+
+    async def _share(self, key: str, value: str, message: str) -> None:
+        """
+        The _share function stores a revocation in Redis and publishes it to the other worker processes.
+            It is already applied in this process, so a Redis failure is reported and not raised: the other
+            processes then miss it until the tokens expire.
+
+        :param self: Represent the instance of the class
+        :param key: str: The Redis key of the revocation
+        :param value: str: Its value
+        :param message: str: The message published on the channel
+        :return: None
+        :doc-author: SergiyRus1974
+        """
+        if self.redis is None:
+            return
+        try:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                pipe.set(key, value, ex=int(self.ttl))
+                pipe.publish(self.channel, message)
+                await pipe.execute()
+        except (RedisError, OSError) as err:
+            print(err)
+
+    def _apply(self, message: str) -> None:
+        """
+        The _apply function adds a revocation to the in-memory list and drops the ones that expired.
+
+        :param self: Represent the instance of the class
+        :param message: str: session:<sid> or user:<uid>:<revoked at, in seconds since the epoch>
+        :return: None
+        :doc-author: SergiyRus1974
+        """
+        now = time.time()
+        self._sessions = {sid: expires_at for sid, expires_at in self._sessions.items() if expires_at > now}
+        self._users = {uid: revoked for uid, revoked in self._users.items() if revoked[1] > now}
+        kind, _, value = message.partition(":")
+        if kind == "session":
+            self._sessions[value] = now + self.ttl
+        elif kind == "user":
+            user_id, _, revoked_at = value.partition(":")
+            previous = self._users.get(int(user_id), (0, 0.0))[0]
+            self._users[int(user_id)] = (max(previous, int(float(revoked_at))), now + self.ttl)
+
+    async def _load(self) -> None:
+        """
+        The _load function reads the revocations stored in Redis into memory.
+
+        :param self: Represent the instance of the class
+        :return: None
+        :doc-author: SergiyRus1974
+        """
+        prefix = self.session_key.format("")
+        async for key in self.redis.scan_iter(match=self.session_key.format("*")):
+            self._apply(f"session:{key[len(prefix):]}")
+        prefix = self.user_key.format("")
+        async for key in self.redis.scan_iter(match=self.user_key.format("*")):
+            revoked_at = await self.redis.get(key)
+            if revoked_at is not None:
+                self._apply(f"user:{key[len(prefix):]}:{revoked_at}")
+
+    async def _listen(self) -> None:
+        """
+        The _listen function applies the revocations published by the other worker processes.
+            After subscribing (and after every reconnect) the stored revocations are loaded again, so none
+            published in the meantime is missed.
+
+        :param self: Represent the instance of the class
+        :return: None
+        :doc-author: SergiyRus1974
+        """
+        while True:
+            try:
+                async with self.redis.pubsub() as pubsub:
+                    await pubsub.subscribe(self.channel)
+                    await self._load()
+                    async for message in pubsub.listen():
+                        if message["type"] == "message":
+                            self._apply(message["data"])
+            except (RedisError, OSError) as err:
+                print(err)
+                await asyncio.sleep(1)
+
+    async def start(self) -> None:
+        """
+        The start function loads the stored revocations and starts following the ones of the other worker
+        processes, on startup.
+
+        :param self: Represent the instance of the class
+        :return: None
+        :doc-author: SergiyRus1974
+        """
+        if self.enabled and self.redis is not None and self._listener is None:
+            try:
+                await self._load()
+            except (RedisError, OSError) as err:
+                print(err)
+            self._listener = asyncio.create_task(self._listen())
+
+    async def stop(self) -> None:
+        """
+        The stop function stops following the revocations, on shutdown.
+
+        :param self: Represent the instance of the class
+        :return: None
+        :doc-author: SergiyRus1974
+        """
+        if self._listener is not None:
+            self._listener.cancel()
+            try:
+                await self._listener
+            except asyncio.CancelledError:
+                pass
+            self._listener = None
+
+
+revocations = RevocationList(db_redis, settings.access_token_expire, enabled=settings.stateless_tokens)
@@ -0,0 +1,63 @@
+from typing import Any
+
+import orjson
+from fastapi.responses import JSONResponse, Response
+from sqlalchemy import Row
+
+from src.schemas.user import UserDb
+from src.services.timing import timed
+
+# datetimes in UTC end with Z, as pydantic writes them
+ORJSON_OPTIONS = orjson.OPT_UTC_Z
+
+
+class JSONBytesResponse(Response):
+    media_type = "application/json"
+
+
+class TimedJSONResponse(JSONResponse):
+    def render(self, content: Any) -> bytes:
+        """
+        The render function encodes the value returned by a route as JSON and records the time it takes
+            as serialization in the Server-Timing header. It is the default response class of the application.
+
+        :param self: Represent the instance of the class
+        :param content: Any: The value returned by the route, validated against its response_model
+        :return: The body of the response
+        :doc-author: SergiyRus1974
+        """
+        with timed("serialization"):
+            return super().render(content)
+
+
+def contact_row(row: Row) -> dict[str, Any]:
+    """
+    The contact_row function turns a Row of CONTACT_COLUMNS into the dict of a ContactResponse without an owner.
+
+    :param row: Row: A row selected by a listing with as_rows
+    :return: A dict that orjson can serialize
+    :doc-author: SergiyRus1974
+    """
+    contact = row._asdict()
+    contact["user"] = None
+    return contact
+
+
+def page_response(page: dict, owner: Any = None) -> JSONBytesResponse:
+    """
+    The page_response function writes a ContactPage of Row tuples (see build_page) straight to JSON bytes.
+        The rows come from the database, so they are not validated against the response model again: the route
+        returns the bytes as they are and its response_model only documents them in OpenAPI.
+
+    :param page: dict: items (Rows of CONTACT_COLUMNS) and next_cursor
+    :param owner: Any: The user to embed as owner of the page, if any
+    :return: The response
+    :doc-author: SergiyRus1974
+    """
+    with timed("serialization"):
+        body = orjson.dumps({"items": [contact_row(row) for row in page["items"]],
+                             "next_cursor": page["next_cursor"],
+                             "owner": UserDb.model_validate(owner).model_dump(mode="json") if owner else None},
+                            option=ORJSON_OPTIONS)
+    return JSONBytesResponse(body)
+
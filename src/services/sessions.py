@@ -0,0 +1,349 @@
+import hashlib
+import time
+from abc import ABC, abstractmethod
+from functools import lru_cache
+
+from src.conf.config import settings
+from src.database.db import db_redis
+from src.services.metrics import InstrumentedRedis
+
+# the refresh token is current: move the session on to the new one, and keep the sessions of the user listed
+# as long as the session lives; otherwise it was used before, so the whole session is revoked
+ROTATE = """
+local current = redis.call('HGET', KEYS[1], 'token')
+if not current then
+    return 0
+end
+if current ~= ARGV[1] then
+    redis.call('DEL', KEYS[1])
+    redis.call('SREM', KEYS[2], ARGV[4])
+    return 0
+end
+redis.call('HSET', KEYS[1], 'token', ARGV[2])
+redis.call('EXPIRE', KEYS[1], ARGV[3])
+redis.call('EXPIRE', KEYS[2], ARGV[3])
+return 1
+"""
+
+
+def fingerprint(token: str) -> str:
+    """
+    The fingerprint function returns the SHA-256 of a refresh token: sessions keep it instead of the token,
+        so the store holds nothing that can be used to log in.
+
+    :param token: str: A refresh token
+    :return: The hex digest
+    :doc-author: SergiyRus1974
+    """
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+class SessionStore(ABC):
+    def __init__(self, ttl: int):
+        """
+        The __init__ function is called when the class is instantiated.
+        A session is a login on one device: it is created by the login with its first refresh token and
+        every refresh moves it on to the next one (the tokens of a session form a family).
+
+        :param self: Represent the instance of the class
+        :param ttl: int: Seconds a session lives after its last refresh, the lifetime of a refresh token
+        :return: The instance of the class
+        :doc-author: SergiyRus1974
+        """
+        self.ttl = ttl
+
+    @abstractmethod
+    async def create(self, session_id: str, email: str, token: str) -> None:
+        """
+        The create function starts a session, on login.
+
+        :param self: Represent the instance of the class
+        :param session_id: str: The sid claim of the tokens
+        :param email: str: Email of the user
+        :param token: str: The first refresh token of the session
+        :return: None
+        :doc-author: SergiyRus1974
+        """
+
+    @abstractmethod
+    async def rotate(self, session_id: str, email: str, token: str, new_token: str) -> bool:
+        """
+        The rotate function moves a session on to a new refresh token, if the given one is its current token.
+            A refresh token that was already rotated is being reused, by a thief or by the owner after it was
+            stolen: the session is revoked, so neither can refresh again.
+
+        :param self: Represent the instance of the class
+        :param session_id: str: The sid claim of the refresh token
+        :param email: str: Email of the user
+        :param token: str: The refresh token sent by the client
+        :param new_token: str: The refresh token replacing it
+        :return: True if the session moved on, False if it is unknown, expired or was revoked now
+        :doc-author: SergiyRus1974
+        """
+
+    @abstractmethod
+    async def is_active(self, session_id: str) -> bool:
+        """
+        The is_active function checks that a session was not logged out, revoked or expired.
+
+        :param self: Represent the instance of the class
+        :param session_id: str: The sid claim of a token
+        :return: True if the session is active
+        :doc-author: SergiyRus1974
+        """
+
+    @abstractmethod
+    async def revoke(self, session_id: str, email: str) -> None:
+        """
+        The revoke function ends a session, on logout.
+
+        :param self: Represent the instance of the class
+        :param session_id: str: The sid claim of the tokens
+        :param email: str: Email of the user
+        :return: None
+        :doc-author: SergiyRus1974
+        """
+
+    @abstractmethod
+    async def revoke_user(self, email: str) -> None:
+        """
+        The revoke_user function ends every session of a user, on all devices.
+
+        :param self: Represent the instance of the class
+        :param email: str: Email of the user
+        :return: None
+        :doc-author: SergiyRus1974
+        """
+
+
+class RedisSessionStore(SessionStore):
+    session_key = "session:{}"
+    user_key = "user-sessions:{}"
+
+    def __init__(self, redis: InstrumentedRedis, ttl: int):
+        """
+        The __init__ function is called when the class is instantiated.
+        A session is a hash with the fingerprint of its current refresh token, expiring ttl seconds after the
+        last refresh; the sessions of a user are listed in a set, for revoke_user.
+
+        :param self: Represent the instance of the class
+        :param redis: InstrumentedRedis: Where the sessions are kept
+        :param ttl: int: Seconds a session lives after its last refresh
+        :return: The instance of the class
+        :doc-author: SergiyRus1974
+        """
+        super().__init__(ttl)
+        self.redis = redis
+        self._rotate = redis.register_script(ROTATE)
+
+    async def create(self, session_id: str, email: str, token: str) -> None:
+        """
+        The create function stores the session and adds it to the sessions of the user, in one transaction.
+            The sessions of the user that expired are taken out of the list first, so it does not grow with
+            every login.
+
+        :param self: Represent the instance of the class
+        :param session_id: str: The sid claim of the tokens
+        :param email: str: Email of the user
+        :param token: str: The first refresh token of the session
+        :return: None
+        :doc-author: SergiyRus1974
+        """
+        session_key = self.session_key.format(session_id)
+        user_key = self.user_key.format(email)
+        await self._prune(user_key)
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.hset(session_key, mapping={"user": email, "token": fingerprint(token)})
+            pipe.expire(session_key, self.ttl)
+            pipe.sadd(user_key, session_id)
+            pipe.expire(user_key, self.ttl)
+            await pipe.execute()
+
+    async def _prune(self, user_key: str) -> None:
+        """
+        The _prune function takes the sessions that no longer exist out of the sessions of a user.
+            A session is stored before it is listed, so a listed session without its key has ended.
+
+        :param self: Represent the instance of the class
+        :param user_key: str: The key of the sessions of the user
+        :return: None
+        :doc-author: SergiyRus1974
+        """
+        session_ids = list(await self.redis.smembers(user_key))
+        if not session_ids:
+            return
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for session_id in session_ids:
+                pipe.exists(self.session_key.format(session_id))
+            exists = await pipe.execute()
+        ended = [session_id for session_id, alive in zip(session_ids, exists) if not alive]
+        if ended:
+            await self.redis.srem(user_key, *ended)
+
+    async def rotate(self, session_id: str, email: str, token: str, new_token: str) -> bool:
+        """
+        The rotate function compares and moves the session on in a Lua script, so two refreshes with the same
+            token can't both succeed. The sessions of the user are kept as long as the session, so revoke_user
+            still finds a device that kept refreshing after the user's last login.
+
+        :param self: Represent the instance of the class
+        :param session_id: str: The sid claim of the refresh token
+        :param email: str: Email of the user
+        :param token: str: The refresh token sent by the client
+        :param new_token: str: The refresh token replacing it
+        :return: True if the session moved on, False if it is unknown, expired or was revoked now
+        :doc-author: SergiyRus1974
+        """
+        rotated = await self._rotate(keys=[self.session_key.format(session_id), self.user_key.format(email)],
+                                     args=[fingerprint(token), fingerprint(new_token), self.ttl, session_id])
+        return rotated == 1
+
+    async def is_active(self, session_id: str) -> bool:
+        """
+        The is_active function checks that the session key still exists.
+
+        :param self: Represent the instance of the class
+        :param session_id: str: The sid claim of a token
+        :return: True if the session is active
+        :doc-author: SergiyRus1974
+        """
+        return await self.redis.exists(self.session_key.format(session_id)) == 1
+
+    async def revoke(self, session_id: str, email: str) -> None:
+        """
+        The revoke function deletes the session and takes it out of the sessions of the user.
+
+        :param self: Represent the instance of the class
+        :param session_id: str: The sid claim of the tokens
+        :param email: str: Email of the user
+        :return: None
+        :doc-author: SergiyRus1974
+        """
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.delete(self.session_key.format(session_id))
+            pipe.srem(self.user_key.format(email), session_id)
+            await pipe.execute()
+
+    async def revoke_user(self, email: str) -> None:
+        """
+        The revoke_user function deletes every session listed for the user, and the list.
+
+        :param self: Represent the instance of the class
+        :param email: str: Email of the user
+        :return: None
+        :doc-author: SergiyRus1974
+        """
+        user_key = self.user_key.format(email)
+        session_ids = await self.redis.smembers(user_key)
+        await self.redis.delete(user_key, *(self.session_key.format(session_id) for session_id in session_ids))
+
+
+class MemorySessionStore(SessionStore):
+    def __init__(self, ttl: int):
+        """
+        The __init__ function is called when the class is instantiated.
+        The sessions are kept in this process only, for tests and single-process development.
+
+        :param self: Represent the instance of the class
+        :param ttl: int: Seconds a session lives after its last refresh
+        :return: The instance of the class
+        :doc-author: SergiyRus1974
+        """
+        super().__init__(ttl)
+        self._sessions: dict[str, tuple[str, str, float]] = {}
+
+    def _get(self, session_id: str) -> tuple[str, str, float] | None:
+        """
+        The _get function returns a session, dropping it if it expired.
+
+        :param self: Represent the instance of the class
+        :param session_id: str: The sid claim of a token
+        :return: The user, token fingerprint and expiry of the session, None if there is none
+        :doc-author: SergiyRus1974
+        """
+        session = self._sessions.get(session_id)
+        if session is not None and session[2] <= time.monotonic():
+            del self._sessions[session_id]
+            return None
+        return session
+
+    async def create(self, session_id: str, email: str, token: str) -> None:
+        """
+        The create function stores the session.
+
+        :param self: Represent the instance of the class
+        :param session_id: str: The sid claim of the tokens
+        :param email: str: Email of the user
+        :param token: str: The first refresh token of the session
+        :return: None
+        :doc-author: SergiyRus1974
+        """
+        self._sessions[session_id] = (email, fingerprint(token), time.monotonic() + self.ttl)
+
+    async def rotate(self, session_id: str, email: str, token: str, new_token: str) -> bool:
+        """
+        The rotate function moves the session on to the new refresh token, or revokes it on reuse.
+
+        :param self: Represent the instance of the class
+        :param session_id: str: The sid claim of the refresh token
+        :param email: str: Email of the user
+        :param token: str: The refresh token sent by the client
+        :param new_token: str: The refresh token replacing it
+        :return: True if the session moved on, False if it is unknown, expired or was revoked now
+        :doc-author: SergiyRus1974
+        """
+        session = self._get(session_id)
+        if session is None:
+            return False
+        if session[1] != fingerprint(token):
+            del self._sessions[session_id]
+            return False
+        self._sessions[session_id] = (email, fingerprint(new_token), time.monotonic() + self.ttl)
+        return True
+
+    async def is_active(self, session_id: str) -> bool:
+        """
+        The is_active function checks that the session is stored and not expired.
+
+        :param self: Represent the instance of the class
+        :param session_id: str: The sid claim of a token
+        :return: True if the session is active
+        :doc-author: SergiyRus1974
+        """
+        return self._get(session_id) is not None
+
+    async def revoke(self, session_id: str, email: str) -> None:
+        """
+        The revoke function drops the session.
+
+        :param self: Represent the instance of the class
+        :param session_id: str: The sid claim of the tokens
+        :param email: str: Email of the user
+        :return: None
+        :doc-author: SergiyRus1974
+        """
+        self._sessions.pop(session_id, None)
+
+    async def revoke_user(self, email: str) -> None:
+        """
+        The revoke_user function drops every session of the user.
+
+        :param self: Represent the instance of the class
+        :param email: str: Email of the user
+        :return: None
+        :doc-author: SergiyRus1974
+        """
+        self._sessions = {session_id: session for session_id, session in self._sessions.items()
+                          if session[0] != email}
+
+
+@lru_cache
+def get_session_store() -> SessionStore:
+    """
+    The get_session_store function returns the store of the login sessions, in Redis.
+        It is built on the first call and reused afterwards.
+
+    :return: The session store
+    :doc-author: SergiyRus1974
+    """
+    return RedisSessionStore(db_redis, settings.refresh_token_expire)
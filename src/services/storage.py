@@ -0,0 +1,164 @@
+import mimetypes
+import os
+import re
+import shutil
+import tempfile
+import time
+from abc import ABC, abstractmethod
+from functools import lru_cache
+from pathlib import Path
+from typing import BinaryIO
+
+import cloudinary
+import cloudinary.uploader
+
+from src.conf.config import settings
+from src.services.executor import BlockingPool
+
+
+class AvatarStorage(ABC):
+    def __init__(self, pool: BlockingPool, chunk_size: int):
+        """
+        The __init__ function is called when the class is instantiated.
+
+        :param self: Represent the instance of the class
+        :param pool: BlockingPool: Runs the blocking uploads off the event loop
+        :param chunk_size: int: How many bytes of the upload are held in memory at a time
+        :return: The instance of the class
+        :doc-author: SergiyRus1974
+        """
+        self.pool = pool
+        self.chunk_size = chunk_size
+
+    @abstractmethod
+    def upload(self, file: BinaryIO, name: str, content_type: str | None) -> str:
+        """
+        The upload function stores the avatar; it blocks and is called in the pool by save.
+
+        :param self: Represent the instance of the class
+        :param file: BinaryIO: The spooled upload, read in chunks
+        :param name: str: Name of the avatar, unique per user
+        :param content_type: str | None: Media type sent by the client
+        :return: The url of the stored avatar
+        :doc-author: SergiyRus1974
+        """
+
+    async def save(self, file: BinaryIO, name: str, content_type: str | None = None) -> str:
+        """
+        The save function stores the avatar without blocking the event loop.
+
+        :param self: Represent the instance of the class
+        :param file: BinaryIO: The spooled upload, read in chunks
+        :param name: str: Name of the avatar, unique per user
+        :param content_type: str | None: Media type sent by the client
+        :return: The url of the stored avatar
+        :doc-author: SergiyRus1974
+        """
+        return await self.pool.run(self.upload, file, name, content_type)
+
+    def shutdown(self) -> None:
+        """
+        The shutdown function lets the uploads in progress finish.
+
+        :param self: Represent the instance of the class
+        :return: None
+        :doc-author: SergiyRus1974
+        """
+        self.pool.shutdown()
+
+
+class CloudinaryStorage(AvatarStorage):
+    folder = "NotesApp"
+
+    def __init__(self, cloud_name: str, api_key: str, api_secret: str, pool: BlockingPool, chunk_size: int):
+        """
+        The __init__ function configures the Cloudinary client once for the whole process.
+
+        :param self: Represent the instance of the class
+        :param cloud_name: str: Cloudinary cloud name
+        :param api_key: str: Cloudinary api key
+        :param api_secret: str: Cloudinary api secret
+        :param pool: BlockingPool: Runs the blocking uploads off the event loop
+        :param chunk_size: int: Size of the upload parts sent to Cloudinary (at least 5 MB)
+        :return: The instance of the class
+        :doc-author: SergiyRus1974
+        """
+        super().__init__(pool, chunk_size)
+        cloudinary.config(cloud_name=cloud_name, api_key=api_key, api_secret=api_secret, secure=True)
+
+    def upload(self, file: BinaryIO, name: str, content_type: str | None) -> str:
+        """
+        The upload function sends the avatar to Cloudinary in parts of chunk_size bytes
+            and returns the url of its 250x250 version.
+
+        :param self: Represent the instance of the class
+        :param file: BinaryIO: The spooled upload, read in chunks
+        :param name: str: Name of the avatar, unique per user
+        :param content_type: str | None: Media type sent by the client
+        :return: The url of the stored avatar
+        :doc-author: SergiyRus1974
+        """
+        public_id = f"{self.folder}/{name}"
+        r = cloudinary.uploader.upload_large(file, public_id=public_id, overwrite=True, resource_type="image",
+                                             chunk_size=self.chunk_size)
+        return cloudinary.CloudinaryImage(public_id) \
+            .build_url(width=250, height=250, crop='fill', version=r.get('version'))
+
+
+class LocalStorage(AvatarStorage):
+    def __init__(self, directory: str, base_url: str, pool: BlockingPool, chunk_size: int):
+        """
+        The __init__ function prepares a directory for the avatars, e.g. to load-test uploads without Cloudinary.
+
+        :param self: Represent the instance of the class
+        :param directory: str: Where the avatar files are written
+        :param base_url: str: Url prefix the directory is served under
+        :param pool: BlockingPool: Runs the blocking writes off the event loop
+        :param chunk_size: int: How many bytes are copied at a time
+        :return: The instance of the class
+        :doc-author: SergiyRus1974
+        """
+        super().__init__(pool, chunk_size)
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.base_url = base_url.rstrip("/")
+
+    def upload(self, file: BinaryIO, name: str, content_type: str | None) -> str:
+        """
+        The upload function copies the avatar into the directory chunk by chunk.
+            The file is written under a temporary name and renamed, so a half-written avatar is never served.
+
+        :param self: Represent the instance of the class
+        :param file: BinaryIO: The spooled upload, read in chunks
+        :param name: str: Name of the avatar, unique per user
+        :param content_type: str | None: Media type sent by the client
+        :return: The url of the stored avatar
+        :doc-author: SergiyRus1974
+        """
+        extension = mimetypes.guess_extension(content_type or "") or ""
+        filename = re.sub(r"[^\w.-]", "_", name) + extension
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix=".upload-")
+        try:
+            with os.fdopen(fd, "wb") as out:
+                shutil.copyfileobj(file, out, self.chunk_size)
+            os.replace(tmp_path, self.directory / filename)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        return f"{self.base_url}/{filename}?v={time.time_ns()}"
+
+
+@lru_cache
+def get_avatar_storage() -> AvatarStorage:
+    """
+    The get_avatar_storage function returns the avatar storage selected by AVATAR_STORAGE (cloudinary or local).
+        It is built on the first call (on startup) and reused afterwards.
+
+    :return: The avatar storage
+    :doc-author: SergiyRus1974
+    """
+    pool = BlockingPool(settings.avatar_upload_workers, settings.avatar_upload_queue, name="avatar-upload")
+    if settings.avatar_storage == "local":
+        return LocalStorage(settings.avatar_local_dir, settings.avatar_local_url, pool, settings.avatar_chunk_size)
+    return CloudinaryStorage(settings.cloudinary_name, settings.cloudinary_api_key, settings.cloudinary_api_secret,
+                             pool, settings.avatar_chunk_size)
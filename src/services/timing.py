@@ -0,0 +1,130 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar, Token
+from typing import Iterator
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# metric -> [seconds, count] of the request being served; None outside ServerTimingMiddleware
+_timings: ContextVar[dict[str, list[float]] | None] = ContextVar("server_timing", default=None)
+_instrumented = False
+
+
+def start() -> Token:
+    """
+    The start function begins collecting the timings of a request in the current context.
+
+    :return: The token to pass to stop
+    :doc-author: SergiyRus1974
+    """
+    return _timings.set({})
+
+
+def stop(token: Token) -> None:
+    """
+    The stop function ends the collection begun by start.
+
+    :param token: Token: What start returned
+    :return: None
+    :doc-author: SergiyRus1974
+    """
+    _timings.reset(token)
+
+
+def record(metric: str, seconds: float) -> None:
+    """
+    The record function adds a duration to a metric of the current request; outside a request it does nothing.
+
+    :param metric: str: Name of the metric in the Server-Timing header
+    :param seconds: float: The duration
+    :return: None
+    :doc-author: SergiyRus1974
+    """
+    timings = _timings.get()
+    if timings is not None:
+        total = timings.setdefault(metric, [0.0, 0])
+        total[0] += seconds
+        total[1] += 1
+
+
+@contextmanager
+def timed(metric: str) -> Iterator[None]:
+    """
+    The timed function measures the block it wraps and records it under metric.
+        When Server-Timing is disabled it costs one context variable lookup.
+
+    :param metric: str: Name of the metric in the Server-Timing header
+    :return: A context manager
+    :doc-author: SergiyRus1974
+    """
+    if _timings.get() is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(metric, time.perf_counter() - started)
+
+
+def header(total: float) -> str:
+    """
+    The header function formats the timings of the current request as a Server-Timing header value
+        (durations in milliseconds), e.g. total;dur=5.12, db;dur=2.01;desc="3 queries".
+
+    :param total: float: Seconds since the request came in
+    :return: The header value
+    :doc-author: SergiyRus1974
+    """
+    metrics = [f"total;dur={total * 1000:.2f}"]
+    for metric, (seconds, count) in (_timings.get() or {}).items():
+        value = f"{metric};dur={seconds * 1000:.2f}"
+        if metric == "db":
+            value += f';desc="{count} queries"'
+        metrics.append(value)
+    return ", ".join(metrics)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _timings.get() is not None:
+        context.server_timing_started = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = getattr(context, "server_timing_started", None)
+    if started is not None:
+        record("db", time.perf_counter() - started)
+
+
+def instrument() -> None:
+    """
+    The instrument function hooks the database timer in; it is called only when Server-Timing is enabled,
+        so nothing is measured otherwise. db is the time the statements of every engine take to execute
+        (sent and results received). serialization is measured by the response classes, see
+        serialization.TimedJSONResponse.
+
+    :return: None
+    :doc-author: SergiyRus1974
+    """
+    global _instrumented
+    if _instrumented:
+        return
+    _instrumented = True
+    event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+
+
+def uninstrument() -> None:
+    """
+    The uninstrument function takes the hooks of instrument out again.
+
+    :return: None
+    :doc-author: SergiyRus1974
+    """
+    global _instrumented
+    if not _instrumented:
+        return
+    _instrumented = False
+    event.remove(Engine, "before_cursor_execute", _before_cursor_execute)
+    event.remove(Engine, "after_cursor_execute", _after_cursor_execute)
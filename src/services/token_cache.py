@@ -0,0 +1,222 @@
+import asyncio
+import hashlib
+import time
+from collections import OrderedDict
+
+from redis.exceptions import RedisError
+from sqlalchemy.orm import make_transient_to_detached
+
+from src.conf.config import settings
+from src.database.db import db_redis
+from src.entity.models import User
+from src.services.metrics import InstrumentedRedis
+
+
+class TokenCache:
+    channel = "token-cache-invalidations"
+    # the columns kept per token: what the routes read from the current user, no password hash or refresh token
+    fields = ("id", "user_email", "username", "role", "avatar", "confirmed")
+
+    def __init__(self, maxsize: int, ttl: float, redis: InstrumentedRedis | None = None):
+        """
+        The __init__ function is called when the class is instantiated.
+        It sets up an empty LRU cache of verified access tokens.
+        Invalidations are published to the other worker processes, so a logout or a password change is
+        enforced by all of them at once.
+
+        :param self: Represent the instance of the class
+        :param maxsize: int: How many tokens to keep; 0 turns the cache off
+        :param ttl: float: Upper bound in seconds for an entry, even if the token lives longer
+        :param redis: InstrumentedRedis | None: Where invalidations are published, None for this process only
+        :return: The instance of the class
+        :doc-author: SergiyRus1974
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.redis = redis
+        self._entries: OrderedDict[str, tuple[float, dict, dict]] = OrderedDict()
+        self._by_email: dict[str, set[str]] = {}
+        self._listener: asyncio.Task | None = None
+
+    @staticmethod
+    def digest(token: str) -> str:
+        """
+        The digest function returns the key a token is stored under, so raw tokens are never kept in memory.
+
+        :param token: str: The encoded access token
+        :return: Hex sha256 digest of the token
+        :doc-author: SergiyRus1974
+        """
+        return hashlib.sha256(token.encode()).hexdigest()
+
+    def get(self, token: str) -> tuple[dict, dict] | None:
+        """
+        The get function looks up a token that was verified before.
+
+        :param self: Represent the instance of the class
+        :param token: str: The encoded access token
+        :return: A tuple of the decoded claims and the user snapshot, or None on a miss
+        :doc-author: SergiyRus1974
+        """
+        key = self.digest(token)
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, payload, snapshot = entry
+        if expires_at <= time.time():
+            self._discard(key)
+            return None
+        self._entries.move_to_end(key)
+        return payload, snapshot
+
+    def set(self, token: str, payload: dict, user: User) -> None:
+        """
+        The set function stores the claims of a verified token together with a snapshot of its user (see fields).
+        The entry lives until the token expires or ttl passes, whichever comes first.
+
+        :param self: Represent the instance of the class
+        :param token: str: The encoded access token
+        :param payload: dict: Claims decoded from the token
+        :param user: User: The user the token belongs to
+        :return: None
+        :doc-author: SergiyRus1974
+        """
+        if self.maxsize <= 0:
+            return
+        key = self.digest(token)
+        expires_at = min(payload["exp"], time.time() + self.ttl)
+        snapshot = {field: getattr(user, field) for field in self.fields}
+        self._discard(key)
+        self._entries[key] = (expires_at, payload, snapshot)
+        self._by_email.setdefault(user.user_email, set()).add(key)
+        while len(self._entries) > self.maxsize:
+            self._discard(next(iter(self._entries)))
+
+    async def invalidate(self, email: str) -> None:
+        """
+        The invalidate function drops every cached token of a user, in this process and in the others.
+            It is called whenever the user row changes or a session of the user ends.
+            A cache hit is not checked against the session store, so a session must be revoked before this is
+            called, never after: a request in between would put the token back into the cache.
+            A Redis failure is reported and not raised: the other processes then keep the tokens for up to ttl.
+
+        :param self: Represent the instance of the class
+        :param email: str: Email of the user that was changed
+        :return: None
+        :doc-author: SergiyRus1974
+        """
+        self._drop(email)
+        if self.redis is None:
+            return
+        try:
+            await self.redis.publish(self.channel, email)
+        except (RedisError, OSError) as err:
+            print(err)
+
+    def _drop(self, email: str) -> None:
+        """
+        The _drop function drops every token of a user kept in this process.
+
+        :param self: Represent the instance of the class
+        :param email: str: Email of the user
+        :return: None
+        :doc-author: SergiyRus1974
+        """
+        for key in self._by_email.pop(email, ()):
+            self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        """
+        The clear function empties the cache.
+
+        :param self: Represent the instance of the class
+        :return: None
+        :doc-author: SergiyRus1974
+        """
+        self._entries.clear()
+        self._by_email.clear()
+
+    async def _listen(self) -> None:
+        """
+        The _listen function applies the invalidations published by the other worker processes.
+            Invalidations published while the subscription is down are lost, so the cache is emptied on every
+            (re)subscribe.
+
+        :param self: Represent the instance of the class
+        :return: None
+        :doc-author: SergiyRus1974
+        """
+        while True:
+            try:
+                async with self.redis.pubsub() as pubsub:
+                    await pubsub.subscribe(self.channel)
+                    self.clear()
+                    async for message in pubsub.listen():
+                        if message["type"] == "message":
+                            self._drop(message["data"])
+            except (RedisError, OSError) as err:
+                print(err)
+                self.clear()
+                await asyncio.sleep(1)
+
+    async def start(self) -> None:
+        """
+        The start function starts following the invalidations of the other worker processes, on startup.
+
+        :param self: Represent the instance of the class
+        :return: None
+        :doc-author: SergiyRus1974
+        """
+        if self.maxsize > 0 and self.redis is not None and self._listener is None:
+            self._listener = asyncio.create_task(self._listen())
+
+    async def stop(self) -> None:
+        """
+        The stop function stops following the invalidations, on shutdown.
+
+        :param self: Represent the instance of the class
+        :return: None
+        :doc-author: SergiyRus1974
+        """
+        if self._listener is not None:
+            self._listener.cancel()
+            try:
+                await self._listener
+            except asyncio.CancelledError:
+                pass
+            self._listener = None
+
+    def _discard(self, key: str) -> None:
+        """
+        The _discard function removes one entry and its email index record.
+
+        :param self: Represent the instance of the class
+        :param key: str: Digest of the token
+        :return: None
+        :doc-author: SergiyRus1974
+        """
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            email = entry[2]["user_email"]
+            keys = self._by_email.get(email)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._by_email[email]
+
+
+def user_from_snapshot(snapshot: dict) -> User:
+    """
+    The user_from_snapshot function rebuilds a detached User from a cached snapshot.
+    Merged into a session with load=False it behaves like a loaded row without a SELECT.
+
+    :param snapshot: dict: Column values of the user; the columns left out stay unloaded
+    :return: A detached user object
+    :doc-author: SergiyRus1974
+    """
+    user = User(**snapshot)
+    make_transient_to_detached(user)
+    return user
+
+
+token_cache = TokenCache(settings.token_cache_size, settings.token_cache_ttl, db_redis)
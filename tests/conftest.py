@@ -7,8 +7,12 @@ from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, Asyn
 from sqlalchemy.pool import StaticPool
 from main import app
 from src.entity.models import Base, User
-from src.database.db import get_db
-from src.services.auth import auth_service
+from src.database.db import get_db, get_session_factory
+from src.services.auth import auth_service, get_read_db
+from src.services.cache import contacts_cache, InMemoryCacheBackend
+from src.services.login_limiter import login_limiter
+from src.services.sessions import MemorySessionStore, get_session_store
+from src.services.token_cache import token_cache
 
 SQLALCHEMY_DATABASE_URL = "sqlite+aiosqlite:///./test.db"
 
@@ -18,6 +22,9 @@ engine = create_async_engine(
     SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}, poolclass=StaticPool
 )
 TestingSessionLocal = async_sessionmaker(autocommit=False, autoflush=False, expire_on_commit=False, bind=engine)
+contacts_cache.init(InMemoryCacheBackend(), expire=60)
+login_limiter.redis = None
+token_cache.redis = None
 
 
 @pytest.fixture(scope="module", autouse=True)
@@ -34,6 +41,8 @@ def init_model_wrap():
             await session.commit()
 
     asyncio.run(init_models())
+    asyncio.run(contacts_cache.clear())
+    token_cache.clear()
 
 
 @pytest.fixture(scope="module")
@@ -52,5 +61,10 @@ def client():
             await session.close()
 
     app.dependency_overrides[get_db] = override_get_db
+    app.dependency_overrides[get_read_db] = override_get_db
+    sessions = MemorySessionStore(ttl=3600)
+    app.dependency_overrides[get_session_store] = lambda: sessions
+    app.dependency_overrides[get_session_factory] = lambda: TestingSessionLocal
+    login_limiter.clear()
 
     yield TestClient(app)
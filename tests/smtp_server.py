@@ -0,0 +1,87 @@
+"""
+Local SMTP stand-in for the mail tests and benchmarks: accepts every message and keeps it in memory.
+
+rtt delays the reply to every command (EHLO, AUTH, MAIL, RCPT, DATA, QUIT) to stand in for the network round
+trip to a real server; auth makes clients log in (any credentials are accepted).
+"""
+import asyncio
+import socket
+import threading
+import time
+import warnings
+
+from aiosmtpd.controller import Controller
+from aiosmtpd.smtp import AuthResult
+from fastapi_mail import ConnectionConfig
+
+warnings.filterwarnings("ignore", message="Session.login_data is deprecated")
+
+
+class CollectingHandler:
+    def __init__(self, rtt: float = 0.0):
+        self.rtt = rtt
+        self.messages: list[bytes] = []
+        self.sessions = 0
+        self._lock = threading.Lock()
+
+    async def _round_trip(self):
+        if self.rtt:
+            await asyncio.sleep(self.rtt)
+
+    async def handle_EHLO(self, server, session, envelope, hostname, responses):
+        with self._lock:
+            self.sessions += 1
+        session.host_name = hostname
+        await self._round_trip()
+        return responses
+
+    async def handle_MAIL(self, server, session, envelope, address, mail_options):
+        envelope.mail_from = address
+        envelope.mail_options.extend(mail_options)
+        await self._round_trip()
+        return "250 OK"
+
+    async def handle_RCPT(self, server, session, envelope, address, rcpt_options):
+        envelope.rcpt_tos.append(address)
+        await self._round_trip()
+        return "250 OK"
+
+    async def handle_DATA(self, server, session, envelope):
+        with self._lock:
+            self.messages.append(envelope.content)
+        await self._round_trip()
+        return "250 Message accepted for delivery"
+
+    async def handle_QUIT(self, server, session, envelope):
+        await self._round_trip()
+        return "221 Bye"
+
+    def authenticate(self, server, session, envelope, mechanism, auth_data):
+        time.sleep(self.rtt)
+        return AuthResult(success=True)
+
+
+def start_server(port: int = 0, rtt: float = 0.0, auth: bool = False) -> tuple[Controller, CollectingHandler]:
+    """
+    Start the stand-in in a background thread; port 0 picks a free port (see controller.port).
+    """
+    handler = CollectingHandler(rtt)
+    options = {"auth_require_tls": False, "authenticator": handler.authenticate} if auth else {}
+    controller = Controller(handler, hostname="127.0.0.1", port=port or _free_port(), **options)
+    controller.start()
+    return controller, handler
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def local_config(port: int, auth: bool = True) -> ConnectionConfig:
+    """
+    Connection settings for the stand-in listening on port; any credentials are accepted.
+    """
+    return ConnectionConfig(MAIL_USERNAME="bench", MAIL_PASSWORD="bench", MAIL_FROM="bench@example.com",
+                            MAIL_PORT=port, MAIL_SERVER="127.0.0.1", MAIL_STARTTLS=False, MAIL_SSL_TLS=False,
+                            USE_CREDENTIALS=auth, VALIDATE_CERTS=False)
@@ -6,8 +6,9 @@ from fastapi import BackgroundTasks
 from sqlalchemy import select
 
 from src.conf import messages
-from src.entity.models import User
-from src.services.auth import auth_service
+from src.entity.models import EmailKind, EmailOutbox, User
+from src.services.auth import auth_service, create_pwd_context
+from src.services.login_limiter import login_limiter
 
 from tests.conftest import TestingSessionLocal
 
@@ -15,10 +16,7 @@ user_data = {"username": "test_user", "user_email": "test_user@example.com", "pa
 background_tasks = BackgroundTasks()
 
 
-def test_signup(client, monkeypatch):
-    mock_send_email = Mock()
-    monkeypatch.setattr("src.routes.auth.send_email", mock_send_email)
-
+def test_signup(client):
     response = client.post("api/auth/signup", json=user_data)
     assert response.status_code == 201, response.text
     data = response.json()
@@ -26,13 +24,20 @@ def test_signup(client, monkeypatch):
     assert data['user']['user_email'] == user_data['user_email']
     assert 'password' not in data['user']
     assert 'avatar' in data['user']
-    assert mock_send_email.called
 
 
-def test_signup_user_exist(client, monkeypatch):
-    mock_send_email = Mock()
-    monkeypatch.setattr("src.routes.auth.send_email", mock_send_email)
+@pytest.mark.asyncio
+async def test_signup_queues_confirmation_email(client):
+    async with TestingSessionLocal() as session:
+        queued = await session.execute(select(EmailOutbox).where(EmailOutbox.recipient == user_data["user_email"]))
+        queued = queued.scalars().all()
+    assert len(queued) == 1
+    assert queued[0].kind == EmailKind.confirm_email
+    assert queued[0].username == user_data["username"]
+    assert queued[0].host == "http://testserver/"
+
 
+def test_signup_user_exist(client):
     response = client.post("api/auth/signup", json=user_data)
     assert response.status_code == 409, response.text
     data = response.json()
@@ -82,6 +87,18 @@ def test_login_wrong_password(client):
     assert data['detail'] == messages.INVALID_PASSWORD
 
 
+def test_request_email_unknown_user(client):
+    response = client.post("api/auth/request_email", json={"email": "nobody@example.com"})
+    assert response.status_code == 404, response.text
+    assert response.json()['detail'] == "User not found"
+
+
+def test_request_email_already_confirmed(client):
+    response = client.post("api/auth/request_email", json={"email": user_data["user_email"]})
+    assert response.status_code == 200, response.text
+    assert response.json()['message'] == messages.EMAIL_ALREADY_CONFIRMED
+
+
 @pytest.mark.asyncio
 async def test_logout(client, monkeypatch):
     current_user = User(**user_data, refresh_token="test_refresh_token")
@@ -171,3 +188,77 @@ def test_refresh_token_fail(mock_get_refresh_token, mock_update_token, mock_get_
                                                       mock.ANY)  # Перевірка передачі бази даних
 
 
+def test_refresh_token_reuse_revokes_session(client):
+    response = client.post("api/auth/login",
+                           data={"username": user_data["user_email"], "password": user_data["password"]})
+    assert response.status_code == 200, response.text
+    tokens = response.json()
+
+    response = client.get("api/auth/refresh_token", headers={"Authorization": f"Bearer {tokens['refresh_token']}"})
+    assert response.status_code == 200, response.text
+    rotated = response.json()
+    assert rotated["refresh_token"] != tokens["refresh_token"]
+    response = client.get("api/users/me", headers={"Authorization": f"Bearer {rotated['access_token']}"})
+    assert response.status_code == 200, response.text
+
+    # the first refresh token is used again: the whole session is revoked
+    response = client.get("api/auth/refresh_token", headers={"Authorization": f"Bearer {tokens['refresh_token']}"})
+    assert response.status_code == 401, response.text
+    assert response.json() == {"detail": messages.INVALID_REFRESH_TOKEN}
+    response = client.get("api/auth/refresh_token", headers={"Authorization": f"Bearer {rotated['refresh_token']}"})
+    assert response.status_code == 401, response.text
+    response = client.get("api/users/me", headers={"Authorization": f"Bearer {rotated['access_token']}"})
+    assert response.status_code == 401, response.text
+
+
+def test_sessions_per_device(client):
+    devices = []
+    for _ in range(2):
+        response = client.post("api/auth/login",
+                               data={"username": user_data["user_email"], "password": user_data["password"]})
+        assert response.status_code == 200, response.text
+        devices.append(response.json())
+
+    response = client.post("api/auth/logout", headers={"Authorization": f"Bearer {devices[0]['access_token']}"})
+    assert response.status_code == 200, response.text
+    response = client.get("api/users/me", headers={"Authorization": f"Bearer {devices[0]['access_token']}"})
+    assert response.status_code == 401, response.text
+    response = client.get("api/users/me", headers={"Authorization": f"Bearer {devices[1]['access_token']}"})
+    assert response.status_code == 200, response.text
+
+
+@pytest.mark.asyncio
+async def test_login_rehashes_outdated_password(client, monkeypatch):
+    monkeypatch.setattr(auth_service, "pwd_context",
+                        create_pwd_context("argon2", argon2_time_cost=1, argon2_memory_cost=1024, argon2_parallelism=1))
+    for _ in range(2):
+        response = client.post("api/auth/login",
+                               data={"username": user_data["user_email"], "password": user_data["password"]})
+        assert response.status_code == 200, response.text
+        async with TestingSessionLocal() as session:
+            user = await session.execute(select(User).where(User.user_email == user_data["user_email"]))
+            assert user.scalar_one().password.startswith("$argon2id$v=19$m=1024,t=1,p=1$")
+
+
+def test_login_rate_limited(client, monkeypatch):
+    monkeypatch.setattr(login_limiter, "limits", (2, 100))
+    login_limiter.clear()
+    for _ in range(2):
+        response = client.post("api/auth/login", data={"username": user_data["user_email"], "password": "wrong"})
+        assert response.status_code == 401, response.text
+    response = client.post("api/auth/login",
+                           data={"username": user_data["user_email"], "password": user_data["password"]})
+    assert response.status_code == 429, response.text
+    assert response.json() == {"detail": messages.TOO_MANY_LOGINS}
+    assert int(response.headers["Retry-After"]) > 0
+    login_limiter.clear()
+
+
+def test_login_rate_counts_failures_only(client, monkeypatch):
+    monkeypatch.setattr(login_limiter, "limits", (2, 100))
+    login_limiter.clear()
+    for password in (user_data["password"], user_data["password"], "wrong", user_data["password"], "wrong",
+                     user_data["password"]):
+        response = client.post("api/auth/login", data={"username": user_data["user_email"], "password": password})
+        assert response.status_code == (200 if password == user_data["password"] else 401), response.text
+    login_limiter.clear()
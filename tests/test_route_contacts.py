@@ -0,0 +1,254 @@
+import asyncio
+import csv
+import io
+import json
+from datetime import date
+
+import pytest
+from fastapi_limiter.depends import RateLimiter
+
+from main import app
+from src.conf.config import settings
+from src.entity.models import Contact, User
+from src.schemas.contact import ContactPage
+from src.services.pagination import encode_cursor
+from sqlalchemy import select
+
+from tests.conftest import TestingSessionLocal, test_user
+
+
+@pytest.fixture(scope="module")
+def contacts():
+    async def add_contacts():
+        async with TestingSessionLocal() as session:
+            user = await session.execute(select(User).where(User.user_email == test_user["user_email"]))
+            user = user.scalar_one()
+            user.avatar = "test_avatar"
+            for i in range(25):
+                session.add(Contact(first_name=f"first_name{i}", last_name="last_name", email=f"contact{i}@example.com",
+                                    phone="0673293127", birth_date=date(1990, 1, 1 + i), user=user))
+            await session.commit()
+
+    asyncio.run(add_contacts())
+
+
+@pytest.fixture(scope="module")
+def token(client, contacts):
+    response = client.post("api/auth/login",
+                           data={"username": test_user["user_email"], "password": test_user["password"]})
+    assert response.status_code == 200, response.text
+    return response.json()["access_token"]
+
+
+def test_get_all_contacts_cursor(client, token):
+    headers = {"Authorization": f"Bearer {token}"}
+    pages = []
+    cursor = None
+    while True:
+        params = {"limit": 10} if cursor is None else {"limit": 10, "cursor": cursor}
+        response = client.get("api/contacts/all", params=params, headers=headers)
+        assert response.status_code == 200, response.text
+        data = response.json()
+        pages.append([item["id"] for item in data["items"]])
+        cursor = data["next_cursor"]
+        if cursor is None:
+            break
+    ids = [contact_id for page in pages for contact_id in page]
+    assert [len(page) for page in pages] == [10, 10, 5]
+    assert ids == sorted(ids)
+    assert len(set(ids)) == 25
+
+
+def test_get_all_contacts_invalid_cursor(client, token):
+    response = client.get("api/contacts/all", params={"cursor": "not-a-cursor"},
+                          headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 400, response.text
+    assert response.json()["detail"] == "Invalid cursor"
+
+
+def test_get_all_contacts_cursor_out_of_range(client, token):
+    cursor = encode_cursor([2 ** 63])
+    response = client.get("api/contacts/all", params={"cursor": cursor}, headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 400, response.text
+    assert response.json()["detail"] == "Invalid cursor"
+
+
+def test_get_all_contacts_cursor_with_offset(client, token):
+    response = client.get("api/contacts/all", params={"cursor": encode_cursor([1]), "offset": 10},
+                          headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 400, response.text
+    assert response.json()["detail"] == "Use either cursor or offset"
+
+
+def test_update_contact(client, token):
+    headers = {"Authorization": f"Bearer {token}"}
+    contact_id = client.get("api/contacts/all", headers=headers).json()["items"][0]["id"]
+    body = {"first_name": "updated", "last_name": "last_name", "email": "updated@example.com",
+            "phone": "0673293127", "birth_date": "1990-01-01", "friend_status": True}
+    response = client.put(f"api/contacts/{contact_id}", json=body, headers=headers)
+    assert response.status_code == 200, response.text
+    data = response.json()
+    assert data["id"] == contact_id
+    assert data["first_name"] == "updated"
+    assert data["email"] == "updated@example.com"
+    assert data["user"]["user_email"] == test_user["user_email"]
+
+
+def test_update_contact_email_exists(client, token):
+    headers = {"Authorization": f"Bearer {token}"}
+    body = {"first_name": "updated", "last_name": "last_name", "email": "contact5@example.com",
+            "phone": "0673293127", "birth_date": "1990-01-01", "friend_status": True}
+    contact_id = client.get("api/contacts/all", headers=headers).json()["items"][0]["id"]
+    response = client.put(f"api/contacts/{contact_id}", json=body, headers=headers)
+    assert response.status_code == 409, response.text
+    response = client.put("api/contacts/100000", json=body, headers=headers)
+    assert response.status_code == 404, response.text
+
+
+def test_delete_contact(client, token):
+    headers = {"Authorization": f"Bearer {token}"}
+    contact_id = client.get("api/contacts/all", headers=headers).json()["items"][0]["id"]
+    response = client.delete(f"api/contacts/{contact_id}", headers=headers)
+    assert response.status_code == 204, response.text
+    response = client.delete(f"api/contacts/{contact_id}", headers=headers)
+    assert response.status_code == 404, response.text
+
+
+@pytest.fixture()
+def no_rate_limit():
+    limiters = [depends.dependency for route in app.routes for depends in getattr(route, "dependencies", ())
+                if isinstance(depends.dependency, RateLimiter)]
+    for limiter in limiters:
+        app.dependency_overrides[limiter] = lambda: None
+    yield
+    for limiter in limiters:
+        app.dependency_overrides.pop(limiter, None)
+
+
+def test_create_contacts_bulk(client, token, no_rate_limit, monkeypatch):
+    monkeypatch.setattr(settings, "contacts_bulk_batch_size", 2)
+    contact = {"first_name": "bulk_name", "last_name": "last_name", "phone": "0673293127", "birth_date": "1990-02-01"}
+    emails = ["bulk1@example.com", "bulk2@example.com", "bulk1@example.com", "contact10@example.com",
+              "bulk3@example.com"]
+    response = client.post("api/contacts/bulk", json=[dict(contact, email=email) for email in emails],
+                           headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 200, response.text
+    data = response.json()
+    assert data["created"] == 3
+    assert [item["status"] for item in data["items"]] == ["created", "created", "duplicate", "exists", "created"]
+    assert [item["index"] for item in data["items"]] == list(range(5))
+    assert all(item["id"] for item in data["items"] if item["status"] == "created")
+
+
+def test_create_contacts_bulk_invalid(client, token, no_rate_limit):
+    contact = {"first_name": "bulk_name", "last_name": "last_name", "phone": "0673293127", "birth_date": "1990-02-01"}
+    response = client.post("api/contacts/bulk", json=[dict(contact, email="bulk4@example.com"),
+                                                      dict(contact, email="not-an-email")],
+                           headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 422, response.text
+    response = client.get("api/contacts/email", params={"email": "bulk4@example.com"},
+                          headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 404, response.text
+
+
+def test_export_contacts(client, token, monkeypatch):
+    monkeypatch.setattr(settings, "contacts_export_batch_size", 3)
+    headers = {"Authorization": f"Bearer {token}"}
+    response = client.get("api/contacts/all", params={"limit": 500}, headers=headers)
+    ids = [item["id"] for item in response.json()["items"]]
+
+    response = client.get("api/contacts/export", headers=headers)
+    assert response.status_code == 200, response.text
+    assert response.headers["content-type"] == "application/x-ndjson"
+    rows = [json.loads(line) for line in response.text.splitlines()]
+    assert [row["id"] for row in rows] == ids
+    assert all(date.fromisoformat(row["birth_date"]) for row in rows)
+
+    response = client.get("api/contacts/all/export", params={"format": "csv"}, headers=headers)
+    assert response.status_code == 200, response.text
+    assert response.headers["content-type"].startswith("text/csv")
+    assert 'filename="all_contacts.csv"' in response.headers["content-disposition"]
+    rows = list(csv.DictReader(io.StringIO(response.text)))
+    assert [int(row["id"]) for row in rows] == ids
+
+
+def test_export_contacts_invalid_format(client, token):
+    response = client.get("api/contacts/export", params={"format": "xml"},
+                          headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 422, response.text
+
+
+def test_get_contacts_owner_once(client, token):
+    headers = {"Authorization": f"Bearer {token}"}
+    response = client.get("api/contacts/last_name", params={"last_name": "last_name"}, headers=headers)
+    assert response.status_code == 200, response.text
+    data = response.json()
+    assert data["owner"]["user_email"] == test_user["user_email"]
+    assert all(item["user"] is None for item in data["items"])
+
+    response = client.get("api/contacts/all", params={"include": "user"}, headers=headers)
+    assert response.status_code == 200, response.text
+    data = response.json()
+    assert data["owner"] is None
+    assert all(item["user"]["user_email"] == test_user["user_email"] for item in data["items"])
+
+
+def test_get_contacts_rows_match_response_model(client, token):
+    headers = {"Authorization": f"Bearer {token}"}
+    params = {"last_name": "last_name", "limit": 50}
+    rows = client.get("api/contacts/last_name", params=params, headers={**headers, "Cache-Control": "no-store"})
+    assert rows.status_code == 200, rows.text
+    assert rows.headers["content-type"] == "application/json"
+    contacts = client.get("api/contacts/last_name", params={**params, "include": "user"}, headers=headers).json()
+    for item in contacts["items"]:
+        item["user"] = None
+    assert rows.json() == ContactPage.model_validate(contacts).model_dump(mode="json")
+
+    miss = client.get("api/contacts/last_name", params=params, headers=headers)
+    hit = client.get("api/contacts/last_name", params=params, headers=headers)
+    assert (miss.headers["X-FastAPI-Cache"], hit.headers["X-FastAPI-Cache"]) == ("MISS", "HIT")
+    assert miss.content == hit.content and miss.json() == rows.json()
+
+    schema = app.openapi()["paths"]["/api/contacts/last_name"]["get"]["responses"]["200"]["content"]
+    assert schema["application/json"]["schema"] == {"$ref": "#/components/schemas/ContactPage"}
+
+
+def test_search_contacts(client, token):
+    headers = {"Authorization": f"Bearer {token}"}
+    response = client.get("api/contacts/search", params={"q": "CONTACT12@EXA"}, headers=headers)
+    assert response.status_code == 200, response.text
+    data = response.json()
+    assert data["items"][0]["email"] == "contact12@example.com"
+    assert data["owner"]["user_email"] == test_user["user_email"]
+
+    response = client.get("api/contacts/search", params={"q": "qqqzzzxxx"}, headers=headers)
+    assert response.status_code == 404, response.text
+    response = client.get("api/contacts/search", params={"q": "ab"}, headers=headers)
+    assert response.status_code == 422, response.text
+
+
+def test_contacts_cache_invalidated_on_write(client, token):
+    headers = {"Authorization": f"Bearer {token}"}
+    params = {"last_name": "last_name", "limit": 500}
+    response = client.get("api/contacts/last_name", params=params, headers=headers)
+    response = client.get("api/contacts/last_name", params=params, headers=headers)
+    assert response.headers["x-fastapi-cache"] == "HIT"
+    contact_id = response.json()["items"][0]["id"]
+
+    response = client.get(f"api/contacts/{contact_id}", headers=headers)
+    assert response.headers["x-fastapi-cache"] == "MISS"
+    response = client.get(f"api/contacts/{contact_id}", headers=headers)
+    assert response.headers["x-fastapi-cache"] == "HIT"
+
+    response = client.delete(f"api/contacts/{contact_id}", headers=headers)
+    assert response.status_code == 204, response.text
+
+    response = client.get("api/contacts/last_name", params=params, headers=headers)
+    assert response.headers["x-fastapi-cache"] == "MISS"
+    assert contact_id not in [item["id"] for item in response.json()["items"]]
+    response = client.get(f"api/contacts/{contact_id}", headers=headers)
+    assert response.status_code == 404, response.text
+
+    stats = client.get("api/contacts/cache/stats", headers=headers).json()
+    assert stats["hits"] >= 2
+    assert stats["misses"] >= 2
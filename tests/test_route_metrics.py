@@ -0,0 +1,79 @@
+import os
+import subprocess
+import sys
+
+import pytest
+from prometheus_client.parser import text_string_to_metric_families
+
+import main
+from tests.conftest import test_user
+
+SCRAPE_TOKEN = "scrape-token"
+
+
+def samples(text: str) -> dict:
+    return {(sample.name, tuple(sorted(sample.labels.items()))): sample.value
+            for family in text_string_to_metric_families(text) for sample in family.samples}
+
+
+@pytest.fixture()
+def scrape_token(monkeypatch):
+    monkeypatch.setattr(main.scrape_auth, "token", SCRAPE_TOKEN)
+    monkeypatch.setattr(main, "outbox_counts", main.metrics.OutboxCounts(ttl=60))
+
+
+def test_metrics(client, scrape_token):
+    login = client.post("api/auth/login", data={"username": test_user["user_email"], "password": test_user["password"]})
+    headers = {"Authorization": f"Bearer {login.json()['access_token']}"}
+    assert client.get("api/contacts/987654", headers=headers).status_code == 404
+
+    response = client.get("metrics", headers={"Authorization": f"Bearer {SCRAPE_TOKEN}"})
+    assert response.status_code == 200, response.text
+    assert response.headers["content-type"].startswith("text/plain")
+    values = samples(response.text)
+    route = (("method", "GET"), ("route", "/api/contacts/{contact_id}"), ("status", "404"))
+    assert values[("http_requests_total", route)] >= 1
+    assert values[("http_request_duration_seconds_count", route[:2])] >= 1
+    assert ("email_outbox_emails", (("status", "pending"),)) in values
+    assert ("email_outbox_emails", (("status", "dead"),)) in values
+    assert values[("login_admissions_total", (("decision", "admitted"),))] >= 1
+
+
+def test_metrics_need_token(client, scrape_token):
+    assert client.get("metrics").status_code == 401
+    assert client.get("metrics", headers={"Authorization": "Bearer wrong"}).status_code == 401
+
+
+def test_metrics_off_without_token(client):
+    assert client.get("metrics").status_code == 404
+
+
+@pytest.mark.asyncio
+async def test_outbox_counts_cached():
+    counted = []
+
+    async def count():
+        counted.append(1)
+        return {"pending": len(counted)}
+
+    counts = main.metrics.OutboxCounts(ttl=60)
+    assert await counts.get(count) == {"pending": 1}
+    assert await counts.get(count) == {"pending": 1}
+    counts = main.metrics.OutboxCounts(ttl=0)
+    assert await counts.get(count) == {"pending": 2}
+    assert await counts.get(count) == {"pending": 3}
+
+
+RECORD = ("from src.services import metrics; "
+          "metrics.observe_request('GET', '/api/contacts/{contact_id}', 200, 0.01)")
+SCRAPE = "import sys; from src.services import metrics; sys.stdout.write(metrics.latest({}).decode())"
+
+
+def test_metrics_are_summed_over_processes(tmp_path):
+    env = dict(os.environ, PROMETHEUS_MULTIPROC_DIR=str(tmp_path))
+    for _ in range(2):
+        subprocess.run([sys.executable, "-c", RECORD], env=env, check=True)
+    scrape = subprocess.run([sys.executable, "-c", SCRAPE], env=env, check=True, capture_output=True, text=True)
+    values = samples(scrape.stdout)
+    assert values[("http_requests_total", (("method", "GET"), ("route", "/api/contacts/{contact_id}"),
+                                           ("status", "200")))] == 2
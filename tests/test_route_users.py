@@ -0,0 +1,124 @@
+import asyncio
+
+import pytest
+from jose import jwt
+from sqlalchemy import event
+
+from main import app
+from src.repository import users as repository_users
+from src.services.auth import auth_service
+from src.services.executor import BlockingPool
+from src.services.revocation import revocations
+from src.services.sessions import get_session_store
+from src.services.storage import LocalStorage, get_avatar_storage
+
+from tests.conftest import engine, test_user
+
+
+@pytest.fixture()
+def storage(tmp_path):
+    storage = LocalStorage(str(tmp_path), "/static/avatars", BlockingPool(workers=1, queue_size=1), chunk_size=1024)
+    app.dependency_overrides[get_avatar_storage] = lambda: storage
+    yield storage
+    app.dependency_overrides.pop(get_avatar_storage, None)
+    storage.shutdown()
+
+
+@pytest.fixture(scope="module")
+def token(client):
+    response = client.post("api/auth/login",
+                           data={"username": test_user["user_email"], "password": test_user["password"]})
+    assert response.status_code == 200, response.text
+    return response.json()["access_token"]
+
+
+def test_update_avatar_local_storage(client, token, storage):
+    content = bytes(range(256)) * 40
+    response = client.patch("api/users/avatar", files={"file": ("avatar.png", content, "image/png")},
+                            headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 200, response.text
+    avatar = response.json()["avatar"]
+    assert avatar.startswith(f"/static/avatars/{test_user['username']}.png?v=")
+    assert (storage.directory / f"{test_user['username']}.png").read_bytes() == content
+    assert not list(storage.directory.glob(".upload-*"))
+
+
+@pytest.fixture()
+def stateless(monkeypatch):
+    monkeypatch.setattr(auth_service, "stateless", True)
+    monkeypatch.setattr(revocations, "enabled", True)
+    monkeypatch.setattr(revocations, "redis", None)
+
+
+def test_stateless_token_skips_database(client, stateless):
+    response = client.post("api/auth/login",
+                           data={"username": test_user["user_email"], "password": test_user["password"]})
+    assert response.status_code == 200, response.text
+    tokens = response.json()
+    headers = {"Authorization": f"Bearer {tokens['access_token']}"}
+    claims = jwt.get_unverified_claims(tokens["access_token"])
+    assert claims["sid"] == jwt.get_unverified_claims(tokens["refresh_token"])["sid"]
+
+    statements = []
+
+    def count(*args):
+        statements.append(args[2])
+
+    event.listen(engine.sync_engine, "before_cursor_execute", count)
+    try:
+        response = client.get("api/users/me", headers=headers)
+    finally:
+        event.remove(engine.sync_engine, "before_cursor_execute", count)
+    assert response.status_code == 200, response.text
+    assert response.json()["user_email"] == test_user["user_email"]
+    assert response.json()["id"] == claims["uid"]
+    assert statements == []
+
+    response = client.post("api/auth/logout", headers=headers)
+    assert response.status_code == 200, response.text
+    response = client.get("api/users/me", headers=headers)
+    assert response.status_code == 401, response.text
+
+
+def test_stateful_token_after_stateless_turned_on(client, monkeypatch):
+    response = client.post("api/auth/login",
+                           data={"username": test_user["user_email"], "password": test_user["password"]})
+    assert response.status_code == 200, response.text
+    headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+    monkeypatch.setattr(auth_service, "stateless", True)
+    response = client.get("api/users/me", headers=headers)
+    assert response.status_code == 200, response.text
+    assert response.json()["user_email"] == test_user["user_email"]
+
+    response = client.post("api/auth/logout", headers=headers)
+    assert response.status_code == 200, response.text
+    response = client.get("api/users/me", headers=headers)
+    assert response.status_code == 401, response.text
+
+
+def test_access_token_after_password_reset(client, monkeypatch):
+    response = client.post("api/auth/login",
+                           data={"username": test_user["user_email"], "password": test_user["password"]})
+    assert response.status_code == 200, response.text
+    access_token = response.json()["access_token"]
+    headers = {"Authorization": f"Bearer {access_token}"}
+    response = client.get("api/users/me", headers=headers)
+    assert response.status_code == 200, response.text
+
+    sessions = app.dependency_overrides[get_session_store]()
+    update_password = repository_users.update_password
+    active = []
+
+    async def spy(*args, **kwargs):
+        active.append(await sessions.is_active(jwt.get_unverified_claims(access_token)["sid"]))
+        return await update_password(*args, **kwargs)
+
+    monkeypatch.setattr(repository_users, "update_password", spy)
+    reset_token = asyncio.run(auth_service.create_email_token({"sub": test_user["user_email"]}))
+    response = client.post(f"api/users/reset_password/{reset_token}", json={"new_password": test_user["password"]})
+    assert response.status_code == 200, response.text
+    # the sessions were revoked before the token cache was invalidated
+    assert active == [False]
+
+    response = client.get("api/users/me", headers=headers)
+    assert response.status_code == 401, response.text
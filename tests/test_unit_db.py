@@ -0,0 +1,83 @@
+import unittest
+
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+from main import prime_statements
+from src.database.db import DatabaseSessionManager
+
+from tests.conftest import TestingSessionLocal
+
+
+class TestDatabaseSessionManager(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.manager = DatabaseSessionManager("sqlite+aiosqlite://", pool_size=3, max_overflow=0)
+        self.pool = self.manager._engine.sync_engine.pool
+
+    async def asyncTearDown(self):
+        await self.manager.close()
+
+    async def test_warmup_opens_connections(self):
+        primed = []
+
+        async def prime(session):
+            await session.execute(text("SELECT 1"))
+            primed.append(id(await session.connection()))
+
+        await self.manager.warmup(5, prime)
+        self.assertEqual(len(set(primed)), 3)
+        self.assertEqual(self.pool.checkedin(), 3)
+        self.assertEqual(self.pool.checkedout(), 0)
+
+    async def test_warmup_failure_does_not_hang(self):
+        async def prime(session):
+            raise OperationalError("SELECT 1", {}, Exception("server closed the connection"))
+
+        await self.manager.warmup(3, prime)
+        self.assertEqual(self.pool.checkedout(), 0)
+
+    async def test_close(self):
+        await self.manager.warmup(2)
+        await self.manager.close()
+        self.assertEqual(self.pool.checkedin(), 0)
+
+    async def test_prime_statements(self):
+        async with TestingSessionLocal() as session:
+            await prime_statements(session)
+
+
+class TestReadReplicas(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.manager = DatabaseSessionManager("sqlite+aiosqlite://",
+                                              replica_urls=["sqlite+aiosqlite://", "sqlite+aiosqlite://"])
+
+    async def asyncTearDown(self):
+        await self.manager.close()
+
+    async def read_engines(self, reads: int, primary: bool = False) -> list:
+        engines = []
+        for _ in range(reads):
+            async with self.manager.read_session(primary=primary) as session:
+                await session.execute(text("SELECT 1"))
+                engines.append(session.bind)
+        return engines
+
+    async def test_round_robin(self):
+        replicas = [replica.engine for replica in self.manager._replicas]
+        self.assertTrue(self.manager.has_replicas)
+        self.assertEqual(await self.read_engines(4), replicas * 2)
+
+    async def test_primary(self):
+        self.assertEqual(await self.read_engines(2, primary=True), [self.manager._engine] * 2)
+
+    async def test_unreachable_replica_is_ejected(self):
+        manager = DatabaseSessionManager("sqlite+aiosqlite://", replica_urls=["sqlite+aiosqlite:////nonexistent/r.db"])
+        try:
+            async with manager.read_session() as session:
+                await session.execute(text("SELECT 1"))
+                self.assertIs(session.bind, manager._engine)
+            self.assertFalse(manager._replicas[0].healthy)
+        finally:
+            await manager.close()
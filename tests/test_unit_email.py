@@ -0,0 +1,69 @@
+import unittest
+
+from src.services.email import SMTPPool, build_message
+from src.services.executor import BlockingPool
+from src.services.mail_templates import TEMPLATE_FOLDER, TEMPLATES, MailTemplates
+
+from tests.smtp_server import local_config, start_server
+
+TEMPLATE_BODY = {"host": "http://localhost:8000/", "username": "test_user", "token": "token"}
+
+
+class TestSMTPPool(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.controller, self.handler = start_server(auth=True)
+        self.config = local_config(self.controller.port)
+
+    def tearDown(self):
+        self.controller.stop()
+
+    def message(self, i: int = 0):
+        return build_message("Confirm your email ", f"user{i}@example.com", "email_template.html", TEMPLATE_BODY,
+                             self.config)
+
+    async def test_send_reuses_connection(self):
+        pool = SMTPPool(self.config, size=2, idle_timeout=60)
+        for i in range(5):
+            await pool.send(self.message(i))
+        await pool.close()
+        self.assertEqual(len(self.handler.messages), 5)
+        self.assertEqual(pool.connects, 1)
+        self.assertIn(b"test_user", self.handler.messages[0])
+
+    async def test_send_reconnects_after_drop(self):
+        pool = SMTPPool(self.config, size=1, idle_timeout=60)
+        await pool.send(self.message())
+        self.controller.stop()
+        self.controller, self.handler = start_server(self.controller.port, auth=True)
+        await pool.send(self.message())
+        await pool.close()
+        self.assertEqual(len(self.handler.messages), 1)
+        self.assertEqual(pool.connects, 2)
+
+    async def test_idle_connection_not_reused(self):
+        pool = SMTPPool(self.config, size=1, idle_timeout=0)
+        await pool.send(self.message())
+        await pool.send(self.message())
+        await pool.close()
+        self.assertEqual(pool.connects, 2)
+
+
+class TestMailTemplates(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.templates = MailTemplates(TEMPLATE_FOLDER, TEMPLATES, BlockingPool(workers=1, queue_size=1))
+
+    def tearDown(self):
+        self.templates.shutdown()
+
+    def test_render_escapes_values(self):
+        html = self.templates.render("email_template.html", dict(TEMPLATE_BODY, username="<b>bob</b>"))
+        self.assertIn("Hi &lt;b&gt;bob&lt;/b&gt;,", html)
+        self.assertIn('href="http://localhost:8000/api/auth/confirmed_email/token"', html)
+
+    async def test_render_batches(self):
+        contexts = (dict(TEMPLATE_BODY, username=f"user{i}") for i in range(5))
+        batches = [batch async for batch in self.templates.render_batches("password_template.html", contexts, 2)]
+        self.assertEqual([len(batch) for batch in batches], [2, 2, 1])
+        self.assertIn("user4", batches[-1][0])
@@ -0,0 +1,42 @@
+import asyncio
+import threading
+import unittest
+
+from fastapi import HTTPException
+from prometheus_client import REGISTRY
+
+from src.services.executor import BlockingPool
+
+
+class TestBlockingPool(unittest.IsolatedAsyncioTestCase):
+
+    async def test_run_in_thread(self):
+        pool = BlockingPool(workers=2, queue_size=0, name="hashing")
+        thread_name = await pool.run(lambda: threading.current_thread().name)
+        self.assertTrue(thread_name.startswith("hashing"))
+        self.assertEqual(pool.pending, 0)
+        pool.shutdown()
+
+    async def test_inline_without_workers(self):
+        pool = BlockingPool(workers=0, queue_size=0)
+        thread_name = await pool.run(lambda: threading.current_thread().name)
+        self.assertEqual(thread_name, threading.current_thread().name)
+
+    async def test_reject_when_queue_full(self):
+        pool = BlockingPool(workers=1, queue_size=1, name="full")
+        release = threading.Event()
+        busy = [asyncio.create_task(pool.run(release.wait)) for _ in range(2)]
+        await asyncio.sleep(0)
+        with self.assertRaises(HTTPException) as error:
+            await pool.run(release.wait)
+        self.assertEqual(error.exception.status_code, 503)
+        self.assertEqual(error.exception.headers["Retry-After"], "1")
+        self.assertEqual(REGISTRY.get_sample_value("blocking_pool_rejections_total", {"pool": "full"}), 1)
+        self.assertEqual(REGISTRY.get_sample_value("blocking_pool_pending", {"pool": "full"}), 2)
+        release.set()
+        await asyncio.gather(*busy)
+        pool.shutdown()
+
+
+if __name__ == '__main__':
+    unittest.main()
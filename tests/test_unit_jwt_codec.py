@@ -0,0 +1,46 @@
+import unittest
+from datetime import datetime, timedelta
+
+from src.services.jwt_codec import HMACCodec, JoseCodec, TokenError, create_codec
+
+KEY = "81ca0de60255b6e2b16b03a717a11c35dc24d8e565fd4f388a876de40d21d9ce"
+
+
+class TestJWTCodecs(unittest.TestCase):
+
+    def setUp(self):
+        self.hmac = HMACCodec(KEY, "HS256")
+        self.jose = JoseCodec(KEY, "HS256")
+        now = datetime.utcnow()
+        self.claims = {"sub": "test@example.com", "sid": "session", "name": "Дедпул", "iat": now,
+                       "exp": now + timedelta(minutes=15), "scope": "access_token"}
+
+    def test_same_tokens(self):
+        self.assertEqual(self.hmac.encode(self.claims), self.jose.encode(self.claims))
+
+    def test_decode_each_other(self):
+        expected = self.jose.decode(self.jose.encode(self.claims))
+        self.assertEqual(self.hmac.decode(self.jose.encode(self.claims)), expected)
+        self.assertEqual(self.jose.decode(self.hmac.encode(self.claims)), expected)
+        self.assertEqual(self.hmac.unverified_claims(self.jose.encode(self.claims)), expected)
+
+    def test_rejected(self):
+        token = self.hmac.encode(self.claims)
+        header, payload, signature = token.split(".")
+        other = HMACCodec("other key", "HS256").encode(self.claims)
+        expired = self.hmac.encode(dict(self.claims, exp=datetime.utcnow() - timedelta(seconds=1)))
+        for bad in (other, expired, f"{header}.{payload}", f"{header}.{payload}.{signature[:-2]}",
+                    self.hmac.encode(dict(self.claims, aud="other")), HMACCodec(KEY, "HS512").encode(self.claims),
+                    "eyJhbGciOiJub25lIiwidHlwIjoiSldUIn0." + payload + "."):
+            for codec in (self.hmac, self.jose):
+                with self.assertRaises(TokenError, msg=bad):
+                    codec.decode(bad)
+
+    def test_leeway(self):
+        expired = self.hmac.encode(dict(self.claims, exp=datetime.utcnow() - timedelta(seconds=5)))
+        self.assertEqual(HMACCodec(KEY, "HS256", leeway=30).decode(expired)["sub"], "test@example.com")
+        self.assertEqual(JoseCodec(KEY, "HS256", leeway=30).decode(expired)["sub"], "test@example.com")
+
+    def test_create_codec(self):
+        self.assertIsInstance(create_codec("hmac", KEY, "HS384"), HMACCodec)
+        self.assertIsInstance(create_codec("jose", KEY, "HS256"), JoseCodec)
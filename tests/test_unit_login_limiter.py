@@ -0,0 +1,51 @@
+import unittest
+
+from fastapi import HTTPException
+
+from src.services.login_limiter import LoginLimiter
+
+
+class TestLoginLimiter(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.limiter = LoginLimiter(None, window=60, per_account=2, per_ip=3)
+
+    async def fail(self, account: str, ip: str):
+        await self.limiter.admit(account, ip)
+        await self.limiter.record_failure(account, ip)
+
+    async def assertRejected(self, account: str, ip: str):
+        with self.assertRaises(HTTPException) as error:
+            await self.limiter.admit(account, ip)
+        self.assertEqual(error.exception.status_code, 429)
+        self.assertTrue(0 < int(error.exception.headers["Retry-After"]) <= 60)
+
+    async def test_per_account(self):
+        await self.fail("test@example.com", "10.0.0.1")
+        await self.fail("Test@Example.com", "10.0.0.2")
+        await self.assertRejected("test@example.com", "10.0.0.3")
+        await self.limiter.admit("other@example.com", "10.0.0.3")
+
+    async def test_per_ip(self):
+        for account in ("a@example.com", "b@example.com", "c@example.com"):
+            await self.fail(account, "10.0.0.1")
+        await self.assertRejected("d@example.com", "10.0.0.1")
+        await self.limiter.admit("d@example.com", "10.0.0.2")
+
+    async def test_admitted_attempts_are_not_counted(self):
+        for _ in range(5):
+            await self.limiter.admit("test@example.com", "10.0.0.1")
+
+    async def test_clear_account(self):
+        await self.fail("test@example.com", "10.0.0.1")
+        await self.limiter.clear_account("TEST@example.com")
+        await self.fail("test@example.com", "10.0.0.1")
+        await self.limiter.admit("test@example.com", "10.0.0.1")
+        # the failures of the address are kept
+        await self.fail("other@example.com", "10.0.0.1")
+        await self.assertRejected("third@example.com", "10.0.0.1")
+
+    async def test_window_slides(self):
+        self.limiter.window = 0
+        for _ in range(5):
+            await self.fail("test@example.com", "10.0.0.1")
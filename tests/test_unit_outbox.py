@@ -0,0 +1,91 @@
+import aiosmtplib
+import pytest
+from sqlalchemy import delete, select
+
+from src.entity.models import EmailKind, EmailOutbox, OutboxStatus
+from src.repository import outbox as repository_outbox
+from src.services import outbox as outbox_service
+from src.services.outbox import MailOutboxWorker
+
+from tests.conftest import TestingSessionLocal
+
+
+def make_worker(**kwargs) -> MailOutboxWorker:
+    options = dict(batch_size=10, concurrency=2, max_attempts=3, backoff=30, backoff_max=3600, lease=300,
+                   poll_interval=0)
+    options.update(kwargs)
+    return MailOutboxWorker(lambda: TestingSessionLocal(), None, **options)
+
+
+@pytest.fixture()
+def sent(monkeypatch):
+    sent = []
+
+    async def fake_send(email: str, username: str, host: str, smtp_pool):
+        if email.startswith("down"):
+            raise aiosmtplib.SMTPServerDisconnected("connection lost")
+        if email.startswith("unknown"):
+            raise aiosmtplib.SMTPResponseException(550, "no such user")
+        sent.append(email)
+
+    monkeypatch.setitem(outbox_service.SENDERS, EmailKind.confirm_email, fake_send)
+    yield sent
+
+
+async def enqueue(*emails: str) -> None:
+    async with TestingSessionLocal() as session:
+        await session.execute(delete(EmailOutbox))
+        for email in emails:
+            await repository_outbox.enqueue_email(EmailKind.confirm_email, email, "user", "http://testserver/",
+                                                  session)
+        await session.commit()
+
+
+async def outbox() -> dict[str, EmailOutbox]:
+    async with TestingSessionLocal() as session:
+        rows = (await session.execute(select(EmailOutbox))).scalars().all()
+    return {row.recipient: row for row in rows}
+
+
+@pytest.mark.asyncio
+async def test_run_once_sends_retries_and_dead_letters(sent):
+    await enqueue("ok@example.com", "down@example.com", "unknown@example.com")
+
+    assert await make_worker().run_once() == 3
+
+    assert sent == ["ok@example.com"]
+    rows = await outbox()
+    assert set(rows) == {"down@example.com", "unknown@example.com"}
+    assert rows["down@example.com"].status == OutboxStatus.pending
+    assert rows["down@example.com"].attempts == 1
+    assert rows["down@example.com"].next_attempt_at > repository_outbox.utcnow()
+    assert "connection lost" in rows["down@example.com"].last_error
+    assert rows["unknown@example.com"].status == OutboxStatus.dead
+    # nothing is due until the backoff has passed
+    assert await make_worker().run_once() == 0
+
+
+@pytest.mark.asyncio
+async def test_run_once_dead_letters_after_max_attempts(sent):
+    await enqueue("down@example.com")
+
+    assert await make_worker(max_attempts=1).run_once() == 1
+
+    rows = await outbox()
+    assert rows["down@example.com"].status == OutboxStatus.dead
+    assert rows["down@example.com"].attempts == 1
+
+
+@pytest.mark.asyncio
+async def test_run_once_claims_in_batches(sent):
+    await enqueue(*(f"user{i}@example.com" for i in range(5)))
+
+    worker = make_worker(batch_size=2)
+    assert [await worker.run_once() for _ in range(4)] == [2, 2, 1, 0]
+    assert len(sent) == 5
+    assert await outbox() == {}
+
+
+def test_retry_delay_is_exponential_and_capped():
+    worker = make_worker(backoff=30, backoff_max=100)
+    assert [worker.retry_delay(attempts) for attempts in (1, 2, 3, 4)] == [30, 60, 100, 100]
@@ -9,7 +9,9 @@ from src.repository.users import (get_user_by_email,
                                   create_user,
                                   update_token,
                                   confirmed_email,
-                                  update_avatar)
+                                  update_avatar,
+                                  rehash_password)
+from src.services.token_cache import token_cache
 
 
 class TestAsyncUsers(unittest.IsolatedAsyncioTestCase):
@@ -83,6 +85,13 @@ class TestAsyncUsers(unittest.IsolatedAsyncioTestCase):
         self.assertEqual(self.user.refresh_token, test_token)
         self.session.commit.assert_called()
 
+    async def test_rehash_password(self):
+        token_cache.set("token", {"exp": 2 ** 31}, self.user)
+        await rehash_password(user=self.user, password_hash="new_hash", db=self.session)
+        self.assertEqual(self.user.password, "new_hash")
+        self.session.commit.assert_called()
+        self.assertIsNone(token_cache.get("token"))
+
 
 if __name__ == '__main__':
     unittest.main()
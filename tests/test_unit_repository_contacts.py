@@ -1,13 +1,14 @@
 import unittest
 from datetime import date
-from unittest.mock import MagicMock, AsyncMock
+from unittest.mock import MagicMock, AsyncMock, patch
 
-from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine, async_sessionmaker
 
-from src.entity.models import Contact, User
+from src.entity.models import Base, Contact, User
 from src.schemas.contact import ContactSchema, ContactUpdateSchema
 from src.repository.contacts import (
-    days_to_birthday,
+    birthday_sort_key,
     get_contacts_birthday,
     get_contacts,
     get_all_contacts,
@@ -16,8 +17,12 @@ from src.repository.contacts import (
     get_contact_email,
     get_contact,
     create_contact,
+    create_contacts,
     update_contact,
     delete_contact,
+    fts_match,
+    trigrams,
+    search_contacts,
 )
 
 
@@ -39,8 +44,7 @@ class TestAsyncContacts(unittest.IsolatedAsyncioTestCase):
         mocked_contacts.scalars.return_value.all.return_value = contacts
         self.session.execute.return_value = mocked_contacts
         results = await get_contacts_birthday(offset=offset, limit=limit, user=self.user, db=self.session)
-        select_true_contacts = [contact for contact in contacts if days_to_birthday(contact.birth_date) <= 7]
-        self.assertEqual(results, select_true_contacts)
+        self.assertEqual(results, contacts)
 
     async def test_get_contacts(self):
         limit = 10
@@ -125,12 +129,15 @@ class TestAsyncContacts(unittest.IsolatedAsyncioTestCase):
                              email="example@example.com",
                              phone="380673293127", birth_date=date(1998, 1, 11), friend_status=False)
         mocked_contact = MagicMock()
-        mocked_contact.scalar_one_or_none.return_value = None
+        mocked_contact.scalar_one_or_none.return_value = Contact(id=1, **body.model_dump(), user_id=self.user.id)
         self.session.execute.return_value = mocked_contact
 
         result = await create_contact(body=body, user=self.user, db=self.session)
 
+        self.session.execute.assert_awaited_once()
+        self.session.commit.assert_awaited_once()
         self.assertIsInstance(result, Contact)
+        self.assertEqual(result.user, self.user)
         self.assertEqual(result.first_name, body.first_name)
         self.assertEqual(result.last_name, body.last_name)
         self.assertEqual(result.email, body.email)
@@ -138,6 +145,18 @@ class TestAsyncContacts(unittest.IsolatedAsyncioTestCase):
         self.assertEqual(result.birth_date, body.birth_date)
         self.assertEqual(result.friend_status, body.friend_status)
 
+    async def test_create_contact_exist(self):
+        body = ContactSchema(first_name="test_first_name", last_name="test_last_name", email="example@example.com",
+                             phone="380673293127", birth_date=date(1998, 1, 11), friend_status=False)
+        mocked_contact = MagicMock()
+        mocked_contact.scalar_one_or_none.return_value = None
+        self.session.execute.return_value = mocked_contact
+
+        result = await create_contact(body=body, user=self.user, db=self.session)
+
+        self.assertIsNone(result)
+        self.session.commit.assert_not_called()
+
     async def test_update_contact_email_not_changed(self):
         contact_id = 1
         body = ContactUpdateSchema(first_name="test_first_name", last_name="test_last_name",
@@ -180,15 +199,12 @@ class TestAsyncContacts(unittest.IsolatedAsyncioTestCase):
                                           birth_date=date(1998, 1, 11),
                                           friend_status=False)
 
-        mocked_contact = MagicMock()
-        mocked_contact.scalar_one_or_none.return_value = contact
-        self.session.execute.return_value = mocked_contact
-        if self.session.return_value.email != body.email:
-            mocked_contact_ = MagicMock()
-            mocked_contact_.scalar_one_or_none.return_value = contact_with_same_email
+        self.session.execute.side_effect = IntegrityError("UPDATE contacts", {}, Exception("UNIQUE constraint failed"))
+        if contact.email != contact_with_same_email.email:
             result = await update_contact(contact_id=1, body=body, user=self.user, db=self.session)
             self.assertFalse(result)
             self.session.commit.assert_not_called()
+            self.session.rollback.assert_awaited_once()
 
     async def test_update_contact_mail_changed_mail_not_exist(self):
         contact_id = 1
@@ -259,5 +275,126 @@ class TestAsyncContacts(unittest.IsolatedAsyncioTestCase):
         self.session.commit.assert_not_called()
 
 
+class InMemoryDatabaseTestCase(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.engine = create_async_engine("sqlite+aiosqlite://")
+        async with self.engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        self.session = async_sessionmaker(bind=self.engine, expire_on_commit=False)()
+
+    async def asyncTearDown(self):
+        await self.session.close()
+        await self.engine.dispose()
+
+
+class FixedDate(date):
+    @classmethod
+    def today(cls):
+        return cls(2024, 12, 29)
+
+
+class TestContactsBirthdayWindow(InMemoryDatabaseTestCase):
+
+    async def asyncSetUp(self):
+        await super().asyncSetUp()
+        self.user = User(username="test_user", password="qwerty", user_email="test_email", confirmed=True)
+        self.session.add(self.user)
+        birth_dates = [date(1990, 12, 28), date(1985, 12, 31), date(2000, 1, 3), date(1995, 1, 10), date(1980, 6, 15)]
+        for i, birth_date in enumerate(birth_dates):
+            self.session.add(Contact(first_name=f"test_first_name{i}", last_name="test_last_name",
+                                     email=f"test{i}@example.com", phone="0673293127", birth_date=birth_date,
+                                     user=self.user))
+        await self.session.commit()
+
+    async def test_window_wraps_new_year(self):
+        with patch("src.repository.contacts.date", FixedDate):
+            results = await get_contacts_birthday(limit=10, offset=0, db=self.session, user=self.user)
+        self.assertEqual([contact.birth_date for contact in results], [date(1985, 12, 31), date(2000, 1, 3)])
+
+    async def test_window_days(self):
+        with patch("src.repository.contacts.date", FixedDate):
+            results = await get_contacts_birthday(limit=10, offset=0, db=self.session, user=self.user,
+                                                  window_days=12)
+        self.assertEqual([contact.birth_date for contact in results],
+                         [date(1985, 12, 31), date(2000, 1, 3), date(1995, 1, 10)])
+
+    async def test_window_after_cursor(self):
+        with patch("src.repository.contacts.date", FixedDate):
+            first_page = await get_contacts_birthday(limit=1, offset=0, db=self.session, user=self.user)
+            after = birthday_sort_key(first_page[0])
+            results = await get_contacts_birthday(limit=10, offset=0, db=self.session, user=self.user, after=after)
+        self.assertEqual(after, (1231, first_page[0].id))
+        self.assertEqual([contact.birth_date for contact in results], [date(2000, 1, 3)])
+
+
+class TestSearchContacts(InMemoryDatabaseTestCase):
+
+    async def asyncSetUp(self):
+        await super().asyncSetUp()
+        self.user = User(username="test_user", password="qwerty", user_email="test_email", confirmed=True)
+        other = User(username="other_user", password="qwerty", user_email="other_email", confirmed=True)
+        people = [("Taras", "Shevchenko", "kobzar@example.com", "0671112233", self.user),
+                  ("Lesya", "Ukrainka", "lesya@example.com", "0502223344", self.user),
+                  ("Ivan", "Franko", "kameniar@example.com", "0933334455", self.user),
+                  ("Taras", "Shevchenko", "other@example.com", "0671112233", other)]
+        for first_name, last_name, email, phone, user in people:
+            self.session.add(Contact(first_name=first_name, last_name=last_name, email=email, phone=phone,
+                                     birth_date=date(1990, 1, 1), user=user))
+        await self.session.commit()
+
+    async def search(self, query: str) -> list[str]:
+        contacts = await search_contacts(query, 10, 0, self.session, self.user, similarity=0.4)
+        return [contact.email for contact in contacts]
+
+    def test_fts_match(self):
+        self.assertEqual(trigrams('Ab"cab'), ['ab"', 'b"c', '"ca', 'cab'])
+        self.assertEqual(fts_match(trigrams('Ab"cab')), '"ab""" OR "b""c" OR """ca" OR "cab"')
+
+    async def test_substring_any_field_any_case(self):
+        self.assertEqual(await self.search("SHEVCH"), ["kobzar@example.com"])
+        self.assertEqual(await self.search("kameniar@"), ["kameniar@example.com"])
+        self.assertEqual(await self.search("0502223"), ["lesya@example.com"])
+
+    async def test_typo_best_match_first(self):
+        self.assertEqual((await self.search("ukrainak"))[0], "lesya@example.com")
+
+    async def test_follows_updates_and_deletes(self):
+        contact = (await search_contacts("franko", 10, 0, self.session, self.user, similarity=0.4))[0]
+        contact.last_name = "Kameniar"
+        await self.session.commit()
+        self.assertEqual(await self.search("franko"), [])
+        await self.session.delete(contact)
+        await self.session.commit()
+        self.assertEqual(await self.search("kameniar"), [])
+
+    async def test_rows(self):
+        rows = await search_contacts("lesya", 10, 0, self.session, self.user, similarity=0.4, as_rows=True)
+        self.assertEqual([(row.first_name, row.last_name) for row in rows], [("Lesya", "Ukrainka")])
+
+
+class TestContactEmailPerUser(InMemoryDatabaseTestCase):
+
+    async def asyncSetUp(self):
+        await super().asyncSetUp()
+        self.users = [User(username=f"user{i}", password="qwerty", user_email=f"user{i}@example.com", confirmed=True)
+                      for i in range(2)]
+        self.session.add_all(self.users)
+        await self.session.commit()
+
+    async def test_same_email_for_different_users(self):
+        body = ContactSchema(first_name="John", last_name="Doe", email="john@example.com", phone="0673293127",
+                             birth_date=date(1990, 1, 1))
+        with patch("src.repository.contacts.contacts_cache", AsyncMock()), \
+                patch("src.repository.contacts.read_your_writes", AsyncMock()):
+            first = await create_contact(body, self.session, self.users[0])
+            second = await create_contact(body, self.session, self.users[1])
+            again = await create_contact(body, self.session, self.users[0])
+            report = await create_contacts([body], self.session, self.users[1])
+        self.assertNotEqual(first.id, second.id)
+        self.assertIsNone(again)
+        self.assertEqual(report, [("exists", None)])
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,45 @@
+import time
+import unittest
+
+from src.services.revocation import RevocationList
+
+
+class TestRevocationList(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.revocations = RevocationList(None, ttl=900, enabled=True)
+        self.claims = {"sid": "session", "uid": 1, "iat": int(time.time()) - 10}
+
+    async def test_not_revoked(self):
+        self.assertFalse(self.revocations.is_revoked(self.claims))
+
+    async def test_revoke_session(self):
+        await self.revocations.revoke_session("session")
+        self.assertTrue(self.revocations.is_revoked(self.claims))
+        self.assertFalse(self.revocations.is_revoked({**self.claims, "sid": "other"}))
+
+    async def test_revoke_user_keeps_newer_tokens(self):
+        await self.revocations.revoke_user(1)
+        self.assertTrue(self.revocations.is_revoked(self.claims))
+        self.assertFalse(self.revocations.is_revoked({**self.claims, "iat": time.time() + 1}))
+        self.assertFalse(self.revocations.is_revoked({**self.claims, "uid": 2}))
+
+    async def test_revoke_user_rejects_tokens_of_the_same_second(self):
+        await self.revocations.revoke_user(1)
+        revoked_at = self.revocations._users[1][0]
+        self.assertTrue(self.revocations.is_revoked({**self.claims, "iat": revoked_at}))
+        self.assertFalse(self.revocations.is_revoked({**self.claims, "iat": revoked_at + 1}))
+
+    async def test_expired_revocation(self):
+        self.revocations.ttl = -1
+        await self.revocations.revoke_session("session")
+        self.assertFalse(self.revocations.is_revoked(self.claims))
+
+    async def test_disabled(self):
+        self.revocations.enabled = False
+        await self.revocations.revoke_session("session")
+        self.assertFalse(self.revocations.is_revoked(self.claims))
+
+    async def test_apply_published(self):
+        self.revocations._apply(f"user:1:{time.time()}")
+        self.assertTrue(self.revocations.is_revoked(self.claims))
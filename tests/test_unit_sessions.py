@@ -0,0 +1,35 @@
+import unittest
+
+from src.services.sessions import MemorySessionStore
+
+
+class TestMemorySessionStore(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.sessions = MemorySessionStore(ttl=60)
+        await self.sessions.create("session", "test@example.com", "token1")
+
+    async def test_rotate(self):
+        self.assertTrue(await self.sessions.rotate("session", "test@example.com", "token1", "token2"))
+        self.assertTrue(await self.sessions.rotate("session", "test@example.com", "token2", "token3"))
+        self.assertTrue(await self.sessions.is_active("session"))
+
+    async def test_reuse_revokes_session(self):
+        await self.sessions.rotate("session", "test@example.com", "token1", "token2")
+        self.assertFalse(await self.sessions.rotate("session", "test@example.com", "token1", "token3"))
+        self.assertFalse(await self.sessions.is_active("session"))
+        self.assertFalse(await self.sessions.rotate("session", "test@example.com", "token2", "token3"))
+
+    async def test_expired_session(self):
+        self.sessions.ttl = -1
+        await self.sessions.create("expired", "test@example.com", "token1")
+        self.assertFalse(await self.sessions.is_active("expired"))
+        self.assertFalse(await self.sessions.rotate("expired", "test@example.com", "token1", "token2"))
+
+    async def test_revoke_user(self):
+        await self.sessions.create("other", "other@example.com", "token1")
+        await self.sessions.create("second", "test@example.com", "token1")
+        await self.sessions.revoke_user("test@example.com")
+        self.assertFalse(await self.sessions.is_active("session"))
+        self.assertFalse(await self.sessions.is_active("second"))
+        self.assertTrue(await self.sessions.is_active("other"))
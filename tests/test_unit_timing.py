@@ -0,0 +1,83 @@
+import re
+
+import pytest
+from fastapi import Depends, FastAPI
+from fastapi.responses import StreamingResponse
+from fastapi.testclient import TestClient
+from pydantic import BaseModel
+from sqlalchemy import text
+
+from middlewares import ServerTimingMiddleware
+from src.services import timing
+from src.services.serialization import TimedJSONResponse
+
+from tests.conftest import TestingSessionLocal
+
+
+class Item(BaseModel):
+    value: int
+
+
+async def fake_user():
+    with timing.timed("auth"):
+        return "user"
+
+
+app = FastAPI(default_response_class=TimedJSONResponse)
+app.add_middleware(ServerTimingMiddleware)
+
+
+@app.get("/item", response_model=Item)
+async def read_item(user: str = Depends(fake_user)):
+    async with TestingSessionLocal() as session:
+        await session.execute(text("SELECT 1"))
+        value = (await session.execute(text("SELECT 2"))).scalar()
+    return {"value": value}
+
+
+@app.get("/stream")
+async def stream():
+    async def chunks():
+        for i in range(3):
+            yield f"{i}\n"
+
+    return StreamingResponse(chunks(), media_type="text/plain")
+
+
+def metrics(response) -> dict[str, str]:
+    return {m.group(1): m.group(2) or "" for m in re.finditer(r"(\w+);dur=[\d.]+(?:;desc=\"([^\"]*)\")?",
+                                                                response.headers["Server-Timing"])}
+
+
+@pytest.fixture()
+def instrumented():
+    timing.instrument()
+    yield
+    timing.uninstrument()
+
+
+def test_server_timing_breakdown(instrumented):
+    response = TestClient(app).get("/item")
+    assert response.status_code == 200, response.text
+    assert response.json() == {"value": 2}
+    assert metrics(response) == {"total": "", "auth": "", "db": "2 queries", "serialization": ""}
+
+
+def test_server_timing_streaming_response():
+    response = TestClient(app).get("/stream")
+    assert response.text == "0\n1\n2\n"
+    assert list(metrics(response)) == ["total"]
+
+
+def test_timed_outside_request_is_noop():
+    with timing.timed("auth"):
+        pass
+    timing.record("db", 1.0)
+    assert timing.header(0.001) == "total;dur=1.00"
+
+
+def test_uninstrument():
+    timing.instrument()
+    timing.uninstrument()
+    response = TestClient(app).get("/item")
+    assert "db" not in metrics(response)
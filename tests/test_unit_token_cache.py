@@ -0,0 +1,79 @@
+import time
+import unittest
+from unittest.mock import AsyncMock
+
+from src.entity.models import User
+from src.services.token_cache import TokenCache, user_from_snapshot
+
+
+class TestTokenCache(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.cache = TokenCache(maxsize=2, ttl=60)
+        self.user = User(id=1, username="test_user", password="qwerty", user_email="test@example.com",
+                         refresh_token="refresh", confirmed=True)
+        self.payload = {"sub": "test@example.com", "scope": "access_token", "exp": time.time() + 900}
+
+    def test_get_hit(self):
+        self.cache.set("token", self.payload, self.user)
+        payload, snapshot = self.cache.get("token")
+        self.assertEqual(payload, self.payload)
+        self.assertEqual(snapshot["id"], 1)
+        self.assertEqual(snapshot["user_email"], "test@example.com")
+
+    def test_get_miss(self):
+        self.assertIsNone(self.cache.get("token"))
+
+    def test_expired_token(self):
+        self.cache.set("token", {**self.payload, "exp": time.time() - 1}, self.user)
+        self.assertIsNone(self.cache.get("token"))
+
+    async def test_invalidate(self):
+        self.cache.set("token", self.payload, self.user)
+        self.cache.set("token2", self.payload, self.user)
+        await self.cache.invalidate("test@example.com")
+        self.assertIsNone(self.cache.get("token"))
+        self.assertIsNone(self.cache.get("token2"))
+
+    async def test_invalidate_published(self):
+        self.cache.redis = AsyncMock()
+        self.cache.set("token", self.payload, self.user)
+        await self.cache.invalidate("test@example.com")
+        self.cache.redis.publish.assert_awaited_once_with(TokenCache.channel, "test@example.com")
+        self.assertIsNone(self.cache.get("token"))
+
+    def test_invalidation_of_other_process(self):
+        self.cache.set("token", self.payload, self.user)
+        self.cache._drop("test@example.com")
+        self.assertIsNone(self.cache.get("token"))
+
+    def test_lru_eviction(self):
+        self.cache.set("token1", self.payload, self.user)
+        self.cache.set("token2", self.payload, self.user)
+        self.cache.get("token1")
+        self.cache.set("token3", self.payload, self.user)
+        self.assertIsNotNone(self.cache.get("token1"))
+        self.assertIsNone(self.cache.get("token2"))
+        self.assertIsNotNone(self.cache.get("token3"))
+
+    def test_disabled(self):
+        cache = TokenCache(maxsize=0, ttl=60)
+        cache.set("token", self.payload, self.user)
+        self.assertIsNone(cache.get("token"))
+
+    def test_user_from_snapshot(self):
+        self.cache.set("token", self.payload, self.user)
+        user = user_from_snapshot(self.cache.get("token")[1])
+        self.assertEqual(user.id, self.user.id)
+        self.assertEqual(user.username, self.user.username)
+
+    def test_snapshot_leaves_out_secrets(self):
+        self.cache.set("token", self.payload, self.user)
+        snapshot = self.cache.get("token")[1]
+        self.assertEqual(set(snapshot), set(TokenCache.fields))
+        self.assertNotIn("password", snapshot)
+        self.assertNotIn("refresh_token", snapshot)
+
+
+if __name__ == '__main__':
+    unittest.main()